@@ -1,191 +1,284 @@
+"""
+Tk ground control for SIYI camera-gimbals
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+All camera commands run on a worker thread, and telemetry reaches the widgets through a queue drained with after(),
+so the window never waits for the network.
+
+Usage
+--
+    python3 gui/tkgui.py --ip 192.168.144.25
+    (hold an arrow to move the gimbal, hold a zoom button to zoom)
+"""
+import sys
+import queue
+import argparse
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic, sleep
+
 import tkinter as tk
 from tkinter import ttk
-from tkinter import filedialog as fd
-from tkinter.messagebox import showinfo
-
-from time import sleep
-import sys
-import os
-  
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
 
 from siyi_sdk import SIYISDK
 
-# create the window window
-window = tk.Tk()
-window.title('SiYi Ground Control ( ͡❛ ͜ʖ ͡❛)')
-# window.resizable(False, False)
-window.geometry('320x240')
-
-class CamAngle:
-    def __init__(self):
-        self.yaw = 0
-        self.pitch = 0
-
-    def addYaw(self, dy):
-        self.yaw += dy
-        if self.yaw >45:
-            self.yaw = 45
-        if self.yaw <-45:
-            self.yaw = -45
-
-    def addPitch(self, dp):
-        self.pitch += dp
-        if self.pitch >25:
-            self.pitch = 25
-        if self.pitch <-90:
-            self.pitch = -90
-
-
-    def zeroYaw(self):
-        self.yaw = 0
-
-    def zeroPitch(self):
-        self.pitch = 0
-
-cam_angle = CamAngle()
-
-cam = SIYISDK(server_ip="192.168.1.25", port=37260)
-if not cam.connect():
-    print("No connection ")
-    exit(1)
-
-
-cam.requestFollowMode()
-
-def pitch_up():
-    cam_angle.addPitch(5)
-    cam.setGimbalRotation(cam_angle.yaw, cam_angle.pitch)
-    # cam.setGimbalRotation(0,10)
-    print("Attitude (yaw,pitch,roll) eg:", cam.getAttitude())
-
-# pitch up button
-pitch_up_button = ttk.Button(
-    window,
-    text='🢁',
-    command=pitch_up
-)
-
-pitch_up_button.grid(row = 0, column = 1, pady = 2)
-
-# pitch_up_button.pack(expand=True)
-
-
-def pitch_down():
-    cam_angle.addPitch(-5)
-    cam.setGimbalRotation(cam_angle.yaw, cam_angle.pitch)
-    # cam.setGimbalRotation(0,10)
-    print("Attitude (yaw,pitch,roll) eg:", cam.getAttitude())
-
-# pitch down button
-pitch_down_button = ttk.Button(
-    window,
-    text='🢃',
-    command=pitch_down
-)
-
-pitch_down_button.grid(row = 2, column = 1, pady = 2)
-# pitch_down_button.pack(expand=True)
+# Period of the UI update, in ms (~60 fps)
+UI_PERIOD_MS = 16
+# Period of the speed command while an arrow is held, in ms
+SPEED_PERIOD_MS = 100
+# Telemetry samples per second
+TELEMETRY_RATE = 30.0
 
 
-def yaw_left():
-    cam_angle.addYaw(5)
-    cam.setGimbalRotation(cam_angle.yaw, cam_angle.pitch)
-    # cam.setGimbalRotation(0,10)
-    print("Attitude (yaw,pitch,roll) eg:", cam.getAttitude())
-
-# pitch down button
-yaw_left_button = ttk.Button(
-    window,
-    text='🢀',
-    command=yaw_left
-)
-
-yaw_left_button.grid(row = 1, column = 0, pady = 2)
-# yaw_left_button.pack(expand=True)
-
-
-def yaw_right():
-    cam_angle.addYaw(-5)
-    cam.setGimbalRotation(cam_angle.yaw, cam_angle.pitch)
-    # cam.setGimbalRotation(0,10)
-    print("Attitude (yaw,pitch,roll) eg:", cam.getAttitude())
-
-# pitch down button
-yaw_right_button = ttk.Button(
-    window,
-    text='🢂',
-    command=yaw_right
-)
-
-yaw_right_button.grid(row = 1, column = 2, pady = 2)
-# yaw_right_button.pack(expand=True)
-
-
-# 🎯
-
-def picth_yaw_center():
-    cam_angle.zeroYaw()
-    cam_angle.zeroPitch()
-    cam.setGimbalRotation(cam_angle.yaw, cam_angle.pitch)
-    # cam.setGimbalRotation(0,10)
-    print("Attitude (yaw,pitch,roll) eg:", cam.getAttitude())
-
-# pitch down button
-picth_yaw_center_button = ttk.Button(
-    window,
-    text='🎯',
-    command=picth_yaw_center
-)
-
-picth_yaw_center_button.grid(row = 1, column = 1, pady = 2)
-# picth_yaw_center_button.pack(expand=True)
-
-
-# 🔎 ➕
-
-def zoom_in():
-    val = cam.requestZoomIn()
-    sleep(0.5)
-    val = cam.requestZoomHold()
-    sleep(0.5)
-    print("Zoom level: ", cam.getZoomLevel())
-
-# pitch down button
-zoom_in_button = ttk.Button(
-    window,
-    text='🔎➕',
-    command=zoom_in
-)
-
-zoom_in_button.grid(row = 3, column = 0, pady = 2)
-# zoom_in_button.pack(expand=True)
-
-
-# 🔎 ➖ 
-
-def zoom_out():
-    val = cam.requestZoomOut()
-    sleep(0.5)
-    val = cam.requestZoomHold()
-    sleep(0.5)
-    print("Zoom level: ", cam.getZoomLevel())
-
-# pitch down button
-zoom_out_button = ttk.Button(
-    window,
-    text='🔎➖',
-    command=zoom_out
-)
-
-zoom_out_button.grid(row = 3, column = 2, pady = 2)
-# zoom_out_button.pack(expand=True)
-
-
-# run the application
-window.mainloop()
-cam.disconnect()
-print("exit")
+class CommandWorker(threading.Thread):
+    """
+    Runs camera commands in order on its own thread. Commands are keyed, and a command that is still pending is
+    replaced by a newer one with the same key, so a slow link does not build up a backlog of stale commands
+    """
+    def __init__(self):
+        super().__init__(daemon=True)
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()
+        self._stop = False
+
+    def submit(self, key, fn, *args):
+        """
+        Queues fn(*args)
+
+        Params
+        --
+        - key [str] commands with the same key replace each other while pending. None: never replaced
+        - fn [callable]
+        """
+        with self._cond:
+            if key is None:
+                key = object()
+            else:
+                self._pending.pop(key, None)
+            self._pending[key] = (fn, args)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stop or self._pending)
+                if self._stop:
+                    return
+                _, (fn, args) = self._pending.popitem(last=False)
+            try:
+                fn(*args)
+            except Exception as e:
+                self._logger.error("Command %s failed: %s", getattr(fn, "__name__", fn), e)
+
+
+class GimbalControl:
+    """
+    Tk window with hold-to-move arrows, hold-to-zoom buttons, a go-to angle form and a live attitude/zoom readout
+    """
+    def __init__(self, root, cam):
+        """
+        Params
+        --
+        - root [tk.Tk]
+        - cam [SIYISDK] not connected yet. connect() runs on the worker thread
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._root = root
+        self._cam = cam
+        self._events = queue.Queue()
+        self._worker = CommandWorker()
+        self._stop = threading.Event()
+
+        # Speed setpoint (yaw, pitch) of the held arrow, resent every SPEED_PERIOD_MS
+        self._held = None
+        self._speed_job = None
+
+        self._status = tk.StringVar(value="Connecting...")
+        self._attitude = tk.StringVar(value="yaw -- pitch -- roll --")
+        self._zoom = tk.StringVar(value="zoom --")
+        self._speed = tk.IntVar(value=50)
+        self._yaw_sp = tk.StringVar(value="0")
+        self._pitch_sp = tk.StringVar(value="0")
+
+        self._build()
+        self._worker.start()
+        self._worker.submit(None, self._connect)
+        self._root.after(UI_PERIOD_MS, self._drain)
+        self._root.protocol("WM_DELETE_WINDOW", self.close)
+
+    def _build(self):
+        root = self._root
+        root.title('SiYi Ground Control ( ͡❛ ͜ʖ ͡❛)')
+
+        pad = ttk.Frame(root, padding=4)
+        pad.grid(row=0, column=0)
+        # (text, row, column, yaw speed sign, pitch speed sign). Positive yaw speed turns right
+        for text, row, col, ys, ps in (('🢁', 0, 1, 0, 1), ('🢃', 2, 1, 0, -1),
+                                       ('🢀', 1, 0, -1, 0), ('🢂', 1, 2, 1, 0)):
+            b = ttk.Button(pad, text=text, width=4)
+            b.grid(row=row, column=col, pady=2)
+            b.bind("<ButtonPress-1>", lambda e, ys=ys, ps=ps: self._startMove(ys, ps))
+            b.bind("<ButtonRelease-1>", lambda e: self._stopMove())
+        ttk.Button(pad, text='🎯', width=4, command=self._center).grid(row=1, column=1, pady=2)
+
+        zoom_in = ttk.Button(pad, text='🔎➕', width=4)
+        zoom_in.grid(row=3, column=0, pady=2)
+        zoom_in.bind("<ButtonPress-1>", lambda e: self._worker.submit("zoom", self._cam.requestZoomIn))
+        zoom_in.bind("<ButtonRelease-1>", lambda e: self._worker.submit("zoom", self._zoomHold))
+        zoom_out = ttk.Button(pad, text='🔎➖', width=4)
+        zoom_out.grid(row=3, column=2, pady=2)
+        zoom_out.bind("<ButtonPress-1>", lambda e: self._worker.submit("zoom", self._cam.requestZoomOut))
+        zoom_out.bind("<ButtonRelease-1>", lambda e: self._worker.submit("zoom", self._zoomHold))
+
+        side = ttk.Frame(root, padding=4)
+        side.grid(row=0, column=1, sticky="n")
+        ttk.Label(side, text="Speed").grid(row=0, column=0, sticky="w")
+        ttk.Scale(side, from_=1, to=100, orient=tk.HORIZONTAL, variable=self._speed).grid(row=0, column=1)
+        ttk.Label(side, text="Yaw").grid(row=1, column=0, sticky="w")
+        ttk.Entry(side, textvariable=self._yaw_sp, width=6).grid(row=1, column=1, sticky="w")
+        ttk.Label(side, text="Pitch").grid(row=2, column=0, sticky="w")
+        ttk.Entry(side, textvariable=self._pitch_sp, width=6).grid(row=2, column=1, sticky="w")
+        ttk.Button(side, text="Go", command=self._goTo).grid(row=3, column=1, sticky="w")
+
+        ttk.Label(root, textvariable=self._attitude, font="TkFixedFont").grid(row=1, column=0, columnspan=2)
+        ttk.Label(root, textvariable=self._zoom, font="TkFixedFont").grid(row=2, column=0, columnspan=2)
+        ttk.Label(root, textvariable=self._status).grid(row=3, column=0, columnspan=2)
+
+    # Worker thread
+
+    def _connect(self):
+        if not self._cam.connect():
+            self._events.put(("status", "No connection"))
+            return
+        self._cam.requestFollowMode()
+        # The readout shows the zoom level, also when it is changed by another controller
+        self._cam.enableZoomPolling()
+        self._events.put(("status", "Connected"))
+        threading.Thread(target=self._telemetryLoop, daemon=True).start()
+
+    def _telemetryLoop(self):
+        """
+        Samples the attitude and zoom at TELEMETRY_RATE. Runs on its own thread, since the getters only read
+        the state updated by the SDK threads
+        """
+        period = 1.0 / TELEMETRY_RATE
+        t0 = monotonic()
+        n = 0
+        while not self._stop.is_set():
+            if not self._cam.isConnected():
+                self._events.put(("status", "Connection lost"))
+                return
+            self._events.put(("telemetry", (self._cam.getAttitude(), self._cam.getCurrentZoomLevel())))
+            n += 1
+            dt = t0 + n * period - monotonic()
+            if dt > 0:
+                sleep(dt)
+
+    def _zoomHold(self):
+        self._cam.requestZoomHold()
+        self._cam.requestCurrentZoomLevel()
+
+    def _rotate(self, yaw, pitch):
+        future = self._cam.setGimbalRotationAsync(yaw, pitch)
+        self._events.put(("status", "Moving to yaw {:.1f} pitch {:.1f}".format(yaw, pitch)))
+        future.add_done_callback(
+            lambda f: self._events.put(("status", "Reached" if not f.cancelled() and f.result() else "Stopped")))
+
+    def _move(self, yaw_speed, pitch_speed):
+        # Waits for the stop of an interrupted rotation, so that it does not arrive after the manual speed
+        self._cam.cancelRotation(wait=True)
+        self._cam.requestGimbalSpeed(yaw_speed, pitch_speed)
+
+    # Tk thread
+
+    def _drain(self):
+        """
+        Applies the events of the worker threads to the widgets. Only the latest telemetry sample is shown
+        """
+        telemetry = None
+        try:
+            while True:
+                kind, value = self._events.get_nowait()
+                if kind == "telemetry":
+                    telemetry = value
+                elif kind == "status":
+                    self._status.set(value)
+        except queue.Empty:
+            pass
+        if telemetry is not None:
+            (yaw, pitch, roll), zoom = telemetry
+            self._attitude.set("yaw {:6.1f} pitch {:6.1f} roll {:6.1f}".format(yaw, pitch, roll))
+            self._zoom.set("zoom {:4.1f}x".format(zoom))
+        if not self._stop.is_set():
+            self._root.after(UI_PERIOD_MS, self._drain)
+
+    def _startMove(self, yaw_sign, pitch_sign):
+        self._held = (yaw_sign, pitch_sign)
+        self._sendSpeed()
+
+    def _sendSpeed(self):
+        if self._held is None:
+            return
+        speed = int(self._speed.get())
+        self._worker.submit("move", self._move, self._held[0] * speed, self._held[1] * speed)
+        # Resent while held, with the current slider value
+        self._speed_job = self._root.after(SPEED_PERIOD_MS, self._sendSpeed)
+
+    def _stopMove(self):
+        self._held = None
+        if self._speed_job is not None:
+            self._root.after_cancel(self._speed_job)
+            self._speed_job = None
+        self._worker.submit("move", self._cam.requestGimbalSpeed, 0, 0)
+
+    def _center(self):
+        self._yaw_sp.set("0")
+        self._pitch_sp.set("0")
+        self._worker.submit("move", self._rotate, 0.0, 0.0)
+
+    def _goTo(self):
+        try:
+            yaw, pitch = float(self._yaw_sp.get()), float(self._pitch_sp.get())
+        except ValueError:
+            self._status.set("Invalid angles")
+            return
+        if not (-45 <= yaw <= 45 and -90 <= pitch <= 25):
+            self._status.set("Yaw must be in -45~45, pitch in -90~25")
+            return
+        self._worker.submit("move", self._rotate, yaw, pitch)
+
+    def close(self):
+        self._stop.set()
+        self._worker.stop()
+        self._root.destroy()
+        # The disconnect waits for the SDK threads, so it runs after the window is gone
+        self._cam.disconnect()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tk ground control for SIYI camera-gimbals")
+    parser.add_argument("--ip", default="192.168.144.25", help="Camera IP address")
+    parser.add_argument("--port", type=int, default=37260, help="Camera UDP port")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='[%(levelname)s] %(asctime)s [%(name)s::%(funcName)s] :\t%(message)s',
+                        level=logging.DEBUG if args.debug else logging.WARNING)
+
+    root = tk.Tk()
+    GimbalControl(root, SIYISDK(server_ip=args.ip, port=args.port))
+    root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Python implementation of SIYI SDK, for SIYI camera-gimbals such as the ZR10 and the A8 mini
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2022
+
+Control
+--
+    from siyi_sdk import SIYISDK
+    cam = SIYISDK(server_ip="192.168.144.25", port=37260)
+
+The video classes (SIYIRTSP, RTMPSender, VideoIngest, ...) are imported from their submodule on first use,
+so applications that only control the gimbal do not load the streaming code.
+"""
+import importlib
+
+from .siyi_sdk import SIYISDK
+from .siyi_message import SIYIMESSAGE, COMMAND
+
+# Names imported on first access, and their submodule
+_LAZY = {
+    "SIYIRTSP": "stream",
+    "RTSPRelay": "stream",
+    "SegmentRecorder": "stream",
+    "RTMPSender": "stream",
+    "StreamFanout": "stream",
+    "VideoEncoder": "stream",
+    "VideoFrame": "stream",
+    "FrameQueue": "stream",
+    "FrameBatcher": "stream",
+    "VideoIngest": "ingest",
+    "MetadataWriter": "metadata",
+    "readMetadata": "metadata",
+    "SharedFrameReader": "framebus",
+    "SIYIEmulator": "emulator",
+}
+
+__all__ = ["SIYISDK", "SIYIMESSAGE", "COMMAND"] + list(_LAZY.keys())
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
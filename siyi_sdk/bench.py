@@ -0,0 +1,486 @@
+"""
+Benchmarks of the SDK control path, run against the local emulator (see emulator.py).
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+Measures
+--
+- encode: cost of every SIYIMESSAGE message builder
+- decode: cost of decodeMsg(), and of the full SIYISDK.parseBuffer() path, for every reply type
+- rtt: request->reply round trip time percentiles
+- attitude: attitude samples per second received by one SIYISDK instance, at increasing push rates
+- fleet: CPU used per camera as the number of connected SIYISDK instances grows
+- video_encoder: fps and CPU of the RTMPSender ffmpeg encoder settings, encoding synthetic frames to a file
+- import_time: time to import each module in a new interpreter, without and with the bytecode cache,
+  and whether it loads OpenCV or numpy
+
+The emulators run in separate processes, so the CPU and latency numbers only account for the SDK.
+
+Usage
+--
+    siyi-bench --output bench.json
+    siyi-bench --suite encode decode
+"""
+import os
+import sys
+import json
+import socket
+import platform
+import argparse
+import subprocess
+import threading
+import logging
+import shutil
+import resource
+import tempfile
+from time import perf_counter, process_time, sleep, time
+
+from .siyi_message import SIYIMESSAGE, COMMAND
+from .siyi_sdk import SIYISDK
+
+# Directory that contains the package, where the subprocesses are started, so they import this copy of it
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+# (builder name, args)
+MSG_BUILDERS = [
+    ('firmwareVerMsg', ()),
+    ('hwIdMsg', ()),
+    ('gimbalInfoMsg', ()),
+    ('funcFeedbackMsg', ()),
+    ('takePhotoMsg', ()),
+    ('recordMsg', ()),
+    ('autoFocusMsg', ()),
+    ('centerMsg', ()),
+    ('lockModeMsg', ()),
+    ('followModeMsg', ()),
+    ('fpvModeMsg', ()),
+    ('gimbalAttMsg', ()),
+    ('zoomInMsg', ()),
+    ('zoomOutMsg', ()),
+    ('stopZoomMsg', ()),
+    ('longFocusMsg', ()),
+    ('closeFocusMsg', ()),
+    ('stopFocusMsg', ()),
+    ('gimbalSpeedMsg', (50, -50)),
+    ('setGimbalAttitude', (305, -205)),
+    ('dataStreamMsg', (1, 50)),
+    ('absoluteZoomMsg', (4.5,)),
+    ('requestCurrentZoomMsg', ()),
+]
+
+# (reply name, cmd_id, request data) answered by the emulator
+REPLIES = [
+    ('firmware', COMMAND.ACQUIRE_FW_VER, ''),
+    ('hardware_id', COMMAND.ACQUIRE_HW_ID, ''),
+    ('gimbal_info', COMMAND.ACQUIRE_GIMBAL_INFO, ''),
+    ('attitude', COMMAND.ACQUIRE_GIMBAL_ATT, ''),
+    ('auto_focus', COMMAND.AUTO_FOCUS, '01'),
+    ('manual_zoom', COMMAND.MANUAL_ZOOM, '01'),
+    ('manual_focus', COMMAND.MANUAL_FOCUS, '01'),
+    ('gimbal_speed', COMMAND.GIMBAL_SPEED, '0000'),
+    ('center', COMMAND.CENTER, '01'),
+    ('set_angles', COMMAND.SET_GIMBAL_ATTITUDE, '00000000'),
+    ('data_stream', COMMAND.SET_DATA_STREAM, '0100'),
+    ('function_feedback', COMMAND.PHOTO_VIDEO_HDR, '00'),
+    ('current_zoom', COMMAND.CURRENT_ZOOM_VALUE, ''),
+]
+
+
+def timePerCall(fn, n, repeat=3):
+    """
+    Returns the best, over repeat runs, mean time (seconds) of one call to fn()
+    """
+    best = None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        for _ in range(n):
+            fn()
+        dt = (perf_counter() - t0) / n
+        if best is None or dt < best:
+            best = dt
+    return best
+
+
+def percentiles(samples, ps=(50, 90, 99)):
+    if not samples:
+        return {}
+    s = sorted(samples)
+    res = {f"p{p}": s[min(len(s) - 1, int(round(p / 100. * (len(s) - 1))))] for p in ps}
+    res["min"] = s[0]
+    res["max"] = s[-1]
+    res["mean"] = sum(s) / len(s)
+    return res
+
+
+##################################################
+#                  Emulator                      #
+##################################################
+def freePort():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def spawnEmulator(port, args=(), timeout=5.0):
+    """
+    Starts the emulator in a separate process and waits until it answers requests
+    """
+    p = subprocess.Popen([sys.executable, "-m", __package__ + ".emulator", "--port", str(port)] + list(args),
+                         cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(0.05)
+    msg = bytes.fromhex(SIYIMESSAGE().firmwareVerMsg())
+    t0 = time()
+    try:
+        while time() - t0 < timeout:
+            s.sendto(msg, ("127.0.0.1", port))
+            try:
+                s.recvfrom(1024)
+                return p
+            except socket.timeout:
+                continue
+    finally:
+        s.close()
+    p.kill()
+    raise RuntimeError("Emulator did not start on port {}".format(port))
+
+
+def receiveOnly(port):
+    """
+    Returns a SIYISDK instance that only runs its receiving thread, so no polling loop adds traffic
+    """
+    cam = SIYISDK(server_ip="127.0.0.1", port=port)
+    cam._recv_thread.start()
+    return cam
+
+
+def hookParser(cam, name, fn):
+    """
+    Calls fn() after every call of the parsing function `name` of cam
+    """
+    parser = getattr(cam, name)
+
+    def hooked(msg, seq):
+        ret = parser(msg, seq)
+        fn()
+        return ret
+    setattr(cam, name, hooked)
+
+
+##################################################
+#                   Suites                       #
+##################################################
+def benchEncode(n=20000):
+    """
+    Mean time (us) to build each message
+    """
+    msg = SIYIMESSAGE()
+    res = {}
+    for name, args in MSG_BUILDERS:
+        builder = getattr(msg, name)
+        res[name] = timePerCall(lambda: builder(*args), n) * 1e6
+    return {"unit": "us/msg", "results": res}
+
+
+def benchDecode(n=20000):
+    """
+    Mean time (us) to decode each reply type, with decodeMsg() only and with the full parseBuffer() path
+    """
+    from .emulator import SIYIEmulator
+    emu = SIYIEmulator(port=0)
+    cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+    res = {}
+    for name, cmd_id, data in REPLIES:
+        reply = emu.handleRequest(cmd_id, data)[0]
+        b = bytes.fromhex(reply)
+        res[name] = {
+            "decodeMsg": timePerCall(lambda: cam._in_msg.decodeMsg(reply), n) * 1e6,
+            "parseBuffer": timePerCall(lambda: cam.parseBuffer(b), n) * 1e6,
+        }
+    emu.stop()
+    cam._socket.close()
+    return {"unit": "us/msg", "results": res}
+
+
+def benchRTT(n=1000, latency=0.0):
+    """
+    Round trip time (ms) of the current zoom request, one request in flight at a time
+    """
+    port = freePort()
+    p = spawnEmulator(port, ["--latency", str(latency)])
+    cam = receiveOnly(port)
+    ev = threading.Event()
+    hookParser(cam, "parseCurrentZoomLevelMsg", ev.set)
+
+    samples = []
+    timeouts = 0
+    for _ in range(n):
+        ev.clear()
+        t0 = perf_counter()
+        cam.requestCurrentZoomLevel()
+        if ev.wait(1.0):
+            samples.append((perf_counter() - t0) * 1e3)
+        else:
+            timeouts += 1
+    cam.disconnect()
+    p.kill()
+    p.wait()
+    return {"unit": "ms", "requests": n, "timeouts": timeouts, "emulator_latency_s": latency,
+            "results": percentiles(samples)}
+
+
+def benchAttitude(rates=(100, 500, 1000, 2000, 5000), duration=3.0):
+    """
+    Attitude samples per second parsed by one SIYISDK instance, while the emulator pushes at each rate
+    """
+    res = {}
+    for rate in rates:
+        port = freePort()
+        p = spawnEmulator(port, ["--push-rate", str(rate)])
+        cam = receiveOnly(port)
+        count = [0]
+
+        def inc():
+            count[0] += 1
+        hookParser(cam, "parseAttitudeMsg", inc)
+        # Any request lets the emulator know where to push
+        cam.requestGimbalInfo()
+        sleep(0.5)
+        c0, t0, cpu0 = count[0], perf_counter(), process_time()
+        sleep(duration)
+        c1, t1, cpu1 = count[0], perf_counter(), process_time()
+        cam.disconnect()
+        p.kill()
+        p.wait()
+        res[str(rate)] = {"samples_per_s": (c1 - c0) / (t1 - t0),
+                          "cpu_percent": 100. * (cpu1 - cpu0) / (t1 - t0)}
+    return {"unit": "samples/s", "results": res}
+
+
+def benchFleet(sizes=(1, 2, 4, 8), duration=5.0):
+    """
+    CPU time used by the SDK per connected camera, with the default polling loops running
+    """
+    res = {}
+    for n in sizes:
+        ports = [freePort() for _ in range(n)]
+        procs = [spawnEmulator(port) for port in ports]
+        cams = []
+        for port in ports:
+            cam = SIYISDK(server_ip="127.0.0.1", port=port)
+            if cam.connect():
+                cams.append(cam)
+        sleep(1.0)
+        t0, cpu0 = perf_counter(), process_time()
+        sleep(duration)
+        t1, cpu1 = perf_counter(), process_time()
+        for cam in cams:
+            cam.disconnect()
+        for p in procs:
+            p.kill()
+            p.wait()
+        cpu = 100. * (cpu1 - cpu0) / (t1 - t0)
+        res[str(n)] = {"connected": len(cams), "cpu_percent": cpu,
+                       "cpu_percent_per_camera": cpu / max(len(cams), 1)}
+    return {"unit": "percent of one core", "results": res}
+
+
+def syntheticFrames(size, n=30):
+    """
+    Returns n raw frames of size bytes, a shifted gradient so that consecutive frames differ
+    """
+    base = bytes(range(256)) * (size // 256 + n + 1)
+    return [base[7 * i:7 * i + size] for i in range(n)]
+
+
+def encoderPresets():
+    """
+    Returns the (name, VideoEncoder, input pixel format) to benchmark: libx264 presets, and the available
+    hardware encoders
+    """
+    from .stream import VideoEncoder
+    presets = [
+        ("libx264 ultrafast bgr24", VideoEncoder("libx264", preset="ultrafast"), "bgr24"),
+        ("libx264 ultrafast yuv420p", VideoEncoder("libx264", preset="ultrafast"), "yuv420p"),
+        ("libx264 superfast yuv420p", VideoEncoder("libx264", preset="superfast"), "yuv420p"),
+        ("libx264 veryfast yuv420p", VideoEncoder("libx264", preset="veryfast"), "yuv420p"),
+    ]
+    for codec in VideoEncoder.available():
+        if codec == "libx264":
+            continue
+        encoder = VideoEncoder(codec)
+        if encoder.isUsable():
+            presets.append(("{} nv12".format(codec), encoder, "nv12"))
+    return presets
+
+
+def benchVideoEncoder(size=(640, 480), n_frames=300, fps=30, bitrate=2000000, gop=30):
+    """
+    Encoding speed and CPU of the ffmpeg process of RTMPSender, for every encoder preset.
+    Frames are written as fast as ffmpeg reads them, to an FLV file instead of an RTMP server
+    """
+    if shutil.which("ffmpeg") is None:
+        return {"skipped": "ffmpeg not found"}
+    try:
+        from .stream import RTMPSender
+        presets = encoderPresets()
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    w, h = size
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, encoder, pix_fmt in presets:
+            encoder.bitrate = bitrate
+            encoder.gop = gop
+            path = os.path.join(tmp, "out.flv")
+            sender = RTMPSender(rtmp_url=path)
+            sender.setImageSize(w, h)
+            sender.setFPS(fps)
+            sender.setPixelFormat(pix_fmt)
+            sender.setEncoder(encoder)
+            frame_size = w * h * {"bgr24": 3, "gray": 1}.get(pix_fmt, 1.5)
+            frames = syntheticFrames(int(frame_size))
+
+            ru0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+            t0 = perf_counter()
+            p = subprocess.Popen(sender.command(), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL)
+            try:
+                for i in range(n_frames):
+                    p.stdin.write(frames[i % len(frames)])
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+            code = p.wait()
+            dt = perf_counter() - t0
+            ru1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu = (ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime)
+            if code != 0:
+                res[name] = {"error": "ffmpeg exited with code {}".format(code)}
+                continue
+            res[name] = {
+                "codec": encoder.codec,
+                "pix_fmt": pix_fmt,
+                "fps": n_frames / dt,
+                "cpu_percent": 100. * cpu / dt,
+                "cpu_ms_per_frame": 1000. * cpu / n_frames,
+                "bitrate_bps": 8. * os.path.getsize(path) * fps / n_frames,
+            }
+    return {"size": "{}x{}".format(w, h), "frames": n_frames, "results": res}
+
+
+# Modules timed by benchImportTime(), and the heavy dependencies they should not load at import
+IMPORT_MODULES = ("siyi_sdk", "siyi_sdk.metadata", "siyi_sdk.stream", "siyi_sdk.ingest")
+HEAVY_MODULES = ("cv2", "numpy")
+
+
+def parseImportTime(text, package=__package__):
+    """
+    Returns the import time, in seconds, of the package and its submodules in the output of python -X importtime
+    """
+    total = 0
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        name = parts[-1].rstrip()
+        # Top-level entries only, their time includes the modules they import
+        if len(parts) == 3 and (name == " " + package or name.startswith(" " + package + ".")):
+            total += int(parts[1])
+    return total / 1e6
+
+
+def benchImportTime(modules=IMPORT_MODULES, n=10):
+    """
+    Import time of each module in a fresh interpreter, as after a reboot. The first import compiles the module
+    (cold, empty bytecode cache), the next ones load the cached bytecode (warm).
+    process_ms is the wall time of the whole interpreter, minus the one of an interpreter that imports nothing
+    """
+    def run(code, env):
+        t0 = perf_counter()
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return perf_counter() - t0, p
+
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=tmp)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        base = sorted(run("pass", env)[0] for _ in range(n))[n // 2]
+        for m in modules:
+            code = "import sys; import {}; print(','.join(k for k in {!r} if k in sys.modules))".format(
+                m, HEAVY_MODULES)
+            _, p = run(code, env)
+            if p.returncode != 0:
+                res[m] = {"error": p.stderr.strip().splitlines()[-1]}
+                continue
+            cold = parseImportTime(p.stderr)
+            warm = []
+            wall = []
+            for _ in range(n):
+                dt, p = run(code, env)
+                warm.append(parseImportTime(p.stderr))
+                wall.append(dt)
+            res[m] = {
+                "cold_ms": 1000. * cold,
+                "warm_ms": percentiles([1000. * t for t in warm]),
+                "process_ms": 1000. * (sorted(wall)[n // 2] - base),
+                "heavy_modules": [k for k in p.stdout.strip().split(",") if k],
+            }
+    return {"python": sys.executable, "runs": n, "results": res}
+
+
+SUITES = {
+    "encode": benchEncode,
+    "decode": benchDecode,
+    "rtt": benchRTT,
+    "attitude": benchAttitude,
+    "fleet": benchFleet,
+    "video_encoder": benchVideoEncoder,
+    "import_time": benchImportTime,
+}
+
+
+def runSuites(names):
+    results = {
+        "meta": {
+            "time": time(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+    }
+    for name in names:
+        print("Running {}...".format(name), file=sys.stderr)
+        results[name] = SUITES[name]()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SIYI SDK benchmarks")
+    parser.add_argument("--suite", nargs="+", choices=list(SUITES.keys()), default=list(SUITES.keys()),
+                        help="Suites to run. Default: all")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to. Default: stdout")
+    args = parser.parse_args(argv)
+
+    # Keep the SDK quiet, errors only
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("SIYISDK").setLevel(logging.ERROR)
+    logging.getLogger("SIYIMESSAGE").setLevel(logging.ERROR)
+
+    results = runSuites(args.suite)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
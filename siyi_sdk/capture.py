@@ -0,0 +1,204 @@
+"""
+Capture and replay of the raw UDP datagrams exchanged with a SIYI camera
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+Record with SIYISDK.startCapture(path) / SIYISDK.stopCapture(), then replay offline with replayCapture().
+
+File format (little endian)
+--
+- Header: MAGIC (8 bytes) + wall clock time of the start of the capture (float64)
+- Records: time since start in seconds (float64) + direction (uint8, TX or RX) + length (uint16) + datagram bytes
+
+Usage
+--
+    python3 -m siyi_sdk.capture dump capture.siyi
+    python3 -m siyi_sdk.capture replay capture.siyi --speed 0
+"""
+import struct
+import threading
+import collections
+import logging
+from time import time, monotonic, sleep, perf_counter
+
+MAGIC = b'SIYICAP\x01'
+HEADER = struct.Struct('<8sd')
+RECORD = struct.Struct('<dBH')
+
+# Directions
+TX = 0  # sent to the camera
+RX = 1  # received from the camera
+
+
+class PacketRecorder:
+    """
+    Appends datagrams to a capture file from a background thread.
+    record() never blocks: datagrams are queued, and dropped (see getDroppedCount()) if the writer falls max_pending behind.
+    """
+    def __init__(self, path: str, flush_interval=0.5, max_pending=100000) -> None:
+        """
+        Params
+        --
+        - path [str] capture file, overwritten if it exists
+        - flush_interval [float] seconds between writes to the file
+        - max_pending [int] maximum number of queued datagrams
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._path = path
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+
+        self._queue = collections.deque()
+        # Datagrams are recorded by the sending and the receiving threads. Time is taken under the lock,
+        # so the records are in time order, as replay expects
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._written = 0
+
+        self._file = open(path, 'wb', buffering=1 << 16)
+        self._start_t = monotonic()
+        self._file.write(HEADER.pack(MAGIC, time()))
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.loop, daemon=True)
+        self._thread.start()
+
+    def record(self, direction: int, b: bytes):
+        """
+        Queues a datagram. Safe to call from any thread
+
+        Params
+        --
+        - direction [int] TX or RX
+        - b [bytes] datagram
+        """
+        with self._lock:
+            if len(self._queue) >= self._max_pending:
+                self._dropped += 1
+                return
+            self._queue.append((monotonic() - self._start_t, direction, b))
+
+    def getDroppedCount(self):
+        return self._dropped
+
+    def getWrittenCount(self):
+        return self._written
+
+    def _write(self):
+        q = self._queue
+        buf = bytearray()
+        n = 0
+        while q:
+            t, direction, b = q.popleft()
+            buf += RECORD.pack(t, direction, len(b))
+            buf += b
+            n += 1
+        if n:
+            self._file.write(buf)
+            self._written += n
+
+    def loop(self):
+        while not self._stopped.wait(self._flush_interval):
+            try:
+                self._write()
+            except Exception as e:
+                self._logger.error("Could not write capture %s: %s", self._path, e)
+                return
+
+    def close(self):
+        """
+        Writes pending datagrams and closes the file
+        """
+        self._stopped.set()
+        self._thread.join()
+        self._write()
+        self._file.close()
+
+
+def readCapture(path: str):
+    """
+    Reads a capture file
+
+    Returns
+    --
+    Generator of (t, direction, bytes), where t is the time in seconds since the start of the capture
+    """
+    with open(path, 'rb') as f:
+        magic, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("{} is not a SIYI capture file".format(path))
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            t, direction, n = RECORD.unpack(head)
+            b = f.read(n)
+            if len(b) < n:
+                return
+            yield t, direction, b
+
+
+def captureStartTime(path: str):
+    """
+    Returns the wall clock time at which the capture started
+    """
+    with open(path, 'rb') as f:
+        magic, start = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("{} is not a SIYI capture file".format(path))
+    return start
+
+
+def replayCapture(path: str, cam, speed=1.0):
+    """
+    Feeds the received datagrams of a capture to cam.parseBuffer()
+
+    Params
+    --
+    - path [str] capture file
+    - cam [SIYISDK] instance that parses the datagrams. It does not need to be connected
+    - speed [float] replay speed factor. 1: original timing, 10: 10x faster, 0: as fast as possible
+
+    Returns
+    --
+    [tuple] (number of replayed datagrams, elapsed seconds)
+    """
+    n = 0
+    t0 = perf_counter()
+    for t, direction, b in readCapture(path):
+        if direction != RX:
+            continue
+        if speed:
+            dt = t / speed - (perf_counter() - t0)
+            if dt > 0:
+                sleep(dt)
+        cam.parseBuffer(b)
+        n += 1
+    return n, perf_counter() - t0
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="SIYI capture tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_dump = sub.add_parser("dump", help="Print the datagrams of a capture")
+    p_dump.add_argument("path")
+    p_replay = sub.add_parser("replay", help="Replay a capture through the SDK parser")
+    p_replay.add_argument("path")
+    p_replay.add_argument("--speed", type=float, default=1.0, help="Speed factor. 0: as fast as possible")
+    args = parser.parse_args()
+
+    if args.cmd == "dump":
+        for t, direction, b in readCapture(args.path):
+            print("{:12.6f} {} {}".format(t, "TX" if direction == TX else "RX", b.hex()))
+    else:
+        from .siyi_sdk import SIYISDK
+        cam = SIYISDK(server_ip="127.0.0.1")
+        n, dt = replayCapture(args.path, cam, args.speed)
+        print("Replayed {} datagrams in {:.3f} s ({:.0f} datagrams/s)".format(n, dt, n / dt if dt > 0 else 0))
+        print("Last attitude (yaw, pitch, roll): {}".format(cam.getAttitude()))
+
+
+if __name__ == "__main__":
+    main()
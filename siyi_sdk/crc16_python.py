@@ -3,9 +3,10 @@ Computes CRC16
 Ref: https://gist.github.com/oysstu/68072c44c02879a2abf94ef350d1c7c6?permalink_comment_id=3943460#gistcomment-3943460
 """
 
-from unittest import TestCase
 import logging
 
+log = logging.getLogger(__name__)
+
 def crc16(data: bytes):
     '''
     CRC-16 (CCITT) implemented with a precomputed lookup table
@@ -46,9 +47,6 @@ def crc16_str_swap(val: str):
     --
     crc_str [str] string of 4 charcaters representing 2 bytes of crc16, in swaped order. 
     """
-    LOG_FORMAT='%(asctime)s [CRC16PYTHON::%(funcName)s] [%(levelname)s]:\t%(message)s'
-    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
-    log = logging.getLogger(__name__)
     crc_str = ""
     if not isinstance(val, str):
         log.error("Message is not string")
@@ -81,7 +79,6 @@ def crc16_str_swap(val: str):
 def crc16_test():
     LOG_FORMAT='%(asctime)s [CRC16PYTHON::%(funcName)s] [%(levelname)s]:\t%(message)s'
     logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
-    log = logging.getLogger(__name__)
     data="5566010100000005FF"
     expected_crc = "5c6a"
     data_crc = crc16_str_swap(data)
@@ -0,0 +1,508 @@
+"""
+Local emulator of a SIYI camera-gimbal, for testing and benchmarking without hardware.
+It binds a local UDP port and answers the SDK commands with CRC'd replies, the same way a camera does.
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+Example
+--
+    emu = SIYIEmulator(port=0)  # port 0 picks a free port
+    emu.start()
+    cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+    ...
+    emu.stop()
+"""
+import socket
+import threading
+import heapq
+import random
+import logging
+from time import monotonic
+
+from .siyi_message import SIYIMESSAGE, COMMAND, HardwareIDMsg, RequestDataStreamMsg, RecordingMsg, MotionModeMsg, FuncFeedbackInfoMsg
+from .crc16_python import crc16_str_swap
+from .utils import toHex
+from . import cameras
+
+
+class GimbalState:
+    """
+    Simulated state of the gimbal and the camera
+    """
+    def __init__(self):
+        self.yaw = 0.0      # degrees
+        self.pitch = 0.0
+        self.roll = 0.0
+        self.yaw_speed = 0.0    # deg/s
+        self.pitch_speed = 0.0
+        self.roll_speed = 0.0
+
+        # Speed command (-100~100), used when target is None
+        self.yaw_cmd = 0
+        self.pitch_cmd = 0
+        # Angle target (yaw, pitch) in degrees. None when in speed mode
+        self.target = None
+
+        self.zoom = 1.0
+        self.zoom_dir = 0   # -1: zoom out, 0: hold, 1: zoom in
+
+        self.record_state = RecordingMsg.OFF
+        self.motion_mode = MotionModeMsg.FOLLOW
+        self.mount_dir = 0
+        self.hdr = False
+
+
+class SIYIEmulator:
+    def __init__(self, ip="127.0.0.1", port=37260, cam_type="A8 mini", latency=0.0, jitter=0.0,
+                 loss=0.0, reorder=0.0, seed=0, sim_rate=200, debug=False) -> None:
+        """
+        Params
+        --
+        - ip [str] IP address to bind
+        - port [int] UDP port to bind. 0 binds any free port, see getPort()
+        - cam_type [str] Emulated camera, one of HardwareIDMsg.CAM_DICT values
+        - latency [float] One-way delay, in seconds, added to every reply
+        - jitter [float] Maximum random delay, in seconds, added on top of latency
+        - loss [float] Probability [0~1] of dropping a reply
+        - reorder [float] Probability [0~1] of holding a reply back so that later replies overtake it
+        - seed [int] Seed of the random generator, so loss/jitter/reordering are repeatable
+        - sim_rate [float] Rate (Hz) of the gimbal dynamics simulation
+        - debug [bool] print debug messages
+        """
+        self._debug = debug
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._logger.setLevel(logging.DEBUG if self._debug else logging.INFO)
+
+        self._cam_type = cam_type
+        if cam_type == 'ZR10':
+            self._specs = cameras.ZR10
+        else:
+            self._specs = cameras.A8MINI
+
+        self._latency = latency
+        self._jitter = jitter
+        self._loss = loss
+        self._reorder = reorder
+        self._reorder_delay = 0.01  # seconds a reordered reply is held back
+        self._rand = random.Random(seed)
+
+        self._sim_dt = 1.0 / sim_rate
+
+        # Max rotation rate (deg/s) at speed command 100
+        self._max_rate = 90.0
+        # Zoom rate, in zoom levels per second
+        self._zoom_rate = 2.0
+
+        # Firmware versions as sent by the camera (uint32, little endian)
+        self._fw_data = toHex(0x030201, 32) + toHex(0x030502, 32) + toHex(0x010203, 32)
+
+        self._state = GimbalState()
+        self._state_lock = threading.Lock()
+
+        # Message helper, to decode requests
+        self._msg = SIYIMESSAGE(debug=self._debug)
+        self._seq = 0
+
+        # Push stream of attitude data. 0: OFF
+        self._push_rate = 0.0
+        self._next_push_t = 0.0
+        self._client_addr = None
+
+        # Scheduled replies (due time, counter, bytes, address)
+        self._out_queue = []
+        self._out_counter = 0
+        self._cond = threading.Condition()
+
+        # Counters, mainly for tests
+        self._rx_count = {}
+        self._tx_count = 0
+        self._drop_count = 0
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((ip, port))
+        self._socket.settimeout(0.1)
+
+        self._stop = False
+        self._recv_thread = None
+        self._sim_thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def getPort(self):
+        """
+        Returns the UDP port the emulator is bound to
+        """
+        return self._socket.getsockname()[1]
+
+    def start(self):
+        """
+        Starts receiving and simulation threads
+        """
+        self._stop = False
+        self._recv_thread = threading.Thread(target=self.recvLoop, daemon=True)
+        self._sim_thread = threading.Thread(target=self.simLoop, daemon=True)
+        self._recv_thread.start()
+        self._sim_thread.start()
+        self._logger.info("SIYI emulator (%s) listening on port %s", self._cam_type, self.getPort())
+
+    def stop(self):
+        """
+        Stops the threads and closes the socket
+        """
+        self._stop = True
+        with self._cond:
+            self._cond.notify()
+        if self._recv_thread is not None and self._recv_thread.is_alive():
+            self._recv_thread.join()
+        if self._sim_thread is not None and self._sim_thread.is_alive():
+            self._sim_thread.join()
+        self._socket.close()
+
+    ##################################################
+    #                 Configuration                  #
+    ##################################################
+    def setLatency(self, latency: float, jitter: float = 0.0):
+        self._latency = latency
+        self._jitter = jitter
+
+    def setLoss(self, loss: float):
+        self._loss = loss
+
+    def setReorder(self, reorder: float, delay: float = 0.01):
+        self._reorder = reorder
+        self._reorder_delay = delay
+
+    def setPushRate(self, rate: float):
+        """
+        Sets the rate (Hz) of the attitude push stream. Unlike SET_DATA_STREAM, any rate is accepted.
+        0 turns the stream off.
+        """
+        self._push_rate = rate
+        self._next_push_t = monotonic()
+
+    def setAttitude(self, yaw: float, pitch: float, roll: float = 0.0):
+        """
+        Places the gimbal at the given angles (degrees), and stops any motion
+        """
+        with self._state_lock:
+            s = self._state
+            s.yaw, s.pitch, s.roll = yaw, pitch, roll
+            s.yaw_cmd = s.pitch_cmd = 0
+            s.target = None
+
+    def getAttitude(self):
+        with self._state_lock:
+            return (self._state.yaw, self._state.pitch, self._state.roll)
+
+    def getZoom(self):
+        with self._state_lock:
+            return self._state.zoom
+
+    def getRequestCount(self, cmd_id=None):
+        """
+        Returns number of received requests of cmd_id, or of all requests if cmd_id is None
+        """
+        if cmd_id is None:
+            return sum(self._rx_count.values())
+        return self._rx_count.get(cmd_id, 0)
+
+    def getSentCount(self):
+        return self._tx_count
+
+    def getDroppedCount(self):
+        return self._drop_count
+
+    ##################################################
+    #                  Simulation                    #
+    ##################################################
+    def step(self, dt: float):
+        """
+        Advances the gimbal dynamics by dt seconds.
+        Called by the simulation thread, and can be called directly for deterministic tests.
+        """
+        with self._state_lock:
+            s = self._state
+            if s.target is not None:
+                max_step = self._max_rate * dt
+                d_yaw = max(min(s.target[0] - s.yaw, max_step), -max_step)
+                d_pitch = max(min(s.target[1] - s.pitch, max_step), -max_step)
+                s.yaw_speed = d_yaw / dt
+                s.pitch_speed = d_pitch / dt
+                if d_yaw == 0 and d_pitch == 0:
+                    s.target = None
+            else:
+                # NOTE Positive yaw speed decreases yaw, as on the hardware (see SIYISDK.setGimbalRotation)
+                s.yaw_speed = -s.yaw_cmd * self._max_rate / 100.
+                s.pitch_speed = s.pitch_cmd * self._max_rate / 100.
+
+            s.yaw = max(min(s.yaw + s.yaw_speed * dt, self._specs.MAX_YAW_DEG), self._specs.MIN_YAW_DEG)
+            s.pitch = max(min(s.pitch + s.pitch_speed * dt, self._specs.MAX_PITCH_DEG), self._specs.MIN_PITCH_DEG)
+
+            if s.zoom_dir != 0:
+                s.zoom = max(min(s.zoom + s.zoom_dir * self._zoom_rate * dt, self._specs.MAX_ZOOM), 1.0)
+
+    def simLoop(self):
+        """
+        Integrates dynamics at sim_rate, pushes the attitude stream and sends due replies
+        """
+        next_step_t = monotonic()
+        while not self._stop:
+            now = monotonic()
+            if now >= next_step_t:
+                self.step(self._sim_dt)
+                next_step_t += self._sim_dt
+                if next_step_t < now:
+                    # We fell behind. Do not try to catch up
+                    next_step_t = now + self._sim_dt
+
+            if self._push_rate > 0 and self._client_addr is not None and now >= self._next_push_t:
+                self._schedule(self.attitudeMsg(), self._client_addr)
+                self._next_push_t += 1.0 / self._push_rate
+                if self._next_push_t < now:
+                    self._next_push_t = now + 1.0 / self._push_rate
+
+            with self._cond:
+                self._flush(now)
+                wake_t = next_step_t
+                if self._push_rate > 0 and self._client_addr is not None:
+                    wake_t = min(wake_t, self._next_push_t)
+                if self._out_queue:
+                    wake_t = min(wake_t, self._out_queue[0][0])
+                timeout = wake_t - monotonic()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+    def _flush(self, now):
+        """
+        Sends due replies. Must be called while holding self._cond
+        """
+        while self._out_queue and self._out_queue[0][0] <= now:
+            _, _, b, addr = heapq.heappop(self._out_queue)
+            self._sendto(b, addr)
+
+    def _sendto(self, b, addr):
+        try:
+            self._socket.sendto(b, addr)
+            self._tx_count += 1
+        except OSError as e:
+            self._logger.debug("Could not send reply: %s", e)
+
+    def _schedule(self, msg, addr):
+        """
+        Applies loss, latency, jitter and reordering to a reply, and sends it or queues it
+        """
+        if self._loss > 0 and self._rand.random() < self._loss:
+            self._drop_count += 1
+            return
+        delay = self._latency
+        if self._jitter > 0:
+            delay += self._rand.random() * self._jitter
+        if self._reorder > 0 and self._rand.random() < self._reorder:
+            delay += self._reorder_delay
+
+        b = bytes.fromhex(msg)
+        with self._cond:
+            if delay <= 0 and not self._out_queue:
+                self._sendto(b, addr)
+                return
+            self._out_counter += 1
+            heapq.heappush(self._out_queue, (monotonic() + delay, self._out_counter, b, addr))
+            self._cond.notify()
+
+    ##################################################
+    #                   Requests                     #
+    ##################################################
+    def recvLoop(self):
+        while not self._stop:
+            try:
+                buff, addr = self._socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._client_addr = addr
+            val = self._msg.decodeMsg(buff.hex())
+            if val is None:
+                continue
+            data, data_len, cmd_id, seq = val
+            self._rx_count[cmd_id] = self._rx_count.get(cmd_id, 0) + 1
+            for reply in self.handleRequest(cmd_id, data):
+                self._schedule(reply, addr)
+
+    def handleRequest(self, cmd_id: str, data: str):
+        """
+        Updates the simulated state according to a request, and returns the list of replies
+
+        Params
+        --
+        - cmd_id [str] Command ID, see COMMAND
+        - data [str] Data bytes in hex
+
+        Returns
+        --
+        [list] Encoded reply messages
+        """
+        s = self._state
+        if cmd_id == COMMAND.ACQUIRE_FW_VER:
+            return [self.encodeMsg(self._fw_data, cmd_id)]
+
+        if cmd_id == COMMAND.ACQUIRE_HW_ID:
+            return [self.encodeMsg(self.hardwareIdData(), cmd_id)]
+
+        if cmd_id == COMMAND.ACQUIRE_GIMBAL_INFO:
+            with self._state_lock:
+                info = ('00' + toHex(int(s.hdr), 8) + '00' + toHex(s.record_state, 8)
+                        + toHex(s.motion_mode, 8) + toHex(s.mount_dir, 8) + '00')
+            return [self.encodeMsg(info, cmd_id)]
+
+        if cmd_id == COMMAND.ACQUIRE_GIMBAL_ATT:
+            return [self.attitudeMsg()]
+
+        if cmd_id in (COMMAND.AUTO_FOCUS, COMMAND.MANUAL_FOCUS):
+            return [self.encodeMsg('01', cmd_id)]
+
+        if cmd_id == COMMAND.MANUAL_ZOOM:
+            with self._state_lock:
+                d = int(data[0:2], 16)
+                s.zoom_dir = d - 256 if d > 127 else d
+                zoom = int(round(s.zoom * 10))
+            return [self.encodeMsg(toHex(zoom, 16), cmd_id)]
+
+        if cmd_id == COMMAND.ABSOLUTE_ZOOM:
+            with self._state_lock:
+                level = int(data[0:2], 16) + int(data[2:4], 16) / 10.
+                s.zoom = max(min(level, self._specs.MAX_ZOOM), 1.0)
+                s.zoom_dir = 0
+            return [self.encodeMsg('01', cmd_id)]
+
+        if cmd_id == COMMAND.CURRENT_ZOOM_VALUE:
+            with self._state_lock:
+                zoom = int(round(s.zoom * 10))
+            return [self.encodeMsg(toHex(zoom // 10, 8) + toHex(zoom % 10, 8), cmd_id)]
+
+        if cmd_id == COMMAND.GIMBAL_SPEED:
+            with self._state_lock:
+                y, p = int(data[0:2], 16), int(data[2:4], 16)
+                s.yaw_cmd = y - 256 if y > 127 else y
+                s.pitch_cmd = p - 256 if p > 127 else p
+                s.target = None
+            return [self.encodeMsg('01', cmd_id)]
+
+        if cmd_id == COMMAND.CENTER:
+            with self._state_lock:
+                s.target = (0.0, 0.0)
+            return [self.encodeMsg('01', cmd_id)]
+
+        if cmd_id == COMMAND.SET_GIMBAL_ATTITUDE:
+            yaw = int(data[2:4] + data[0:2], 16)
+            pitch = int(data[6:8] + data[4:6], 16)
+            yaw = (yaw - 65536 if yaw > 32767 else yaw) / 10.
+            pitch = (pitch - 65536 if pitch > 32767 else pitch) / 10.
+            with self._state_lock:
+                s.target = (max(min(yaw, self._specs.MAX_YAW_DEG), self._specs.MIN_YAW_DEG),
+                            max(min(pitch, self._specs.MAX_PITCH_DEG), self._specs.MIN_PITCH_DEG))
+                reply = toHex(int(s.yaw * 10), 16) + toHex(int(s.pitch * 10), 16) + toHex(int(s.roll * 10), 16)
+            return [self.encodeMsg(reply, cmd_id)]
+
+        if cmd_id == COMMAND.SET_DATA_STREAM:
+            data_type = data[0:2]
+            if data_type == RequestDataStreamMsg.ATTITUDE_DATA:
+                freqs = {v: k for k, v in RequestDataStreamMsg.FREQ.items()}
+                self.setPushRate(freqs.get(data[2:4], 0))
+            return [self.encodeMsg(data_type, cmd_id)]
+
+        if cmd_id == COMMAND.PHOTO_VIDEO_HDR:
+            # The camera does not acknowledge this command. It sends function feedback instead
+            func = int(data[0:2], 16)
+            feedback = FuncFeedbackInfoMsg.SUCCESSFUL
+            with self._state_lock:
+                if func == 1:
+                    s.hdr = not s.hdr
+                    feedback = FuncFeedbackInfoMsg.HDR_ON if s.hdr else FuncFeedbackInfoMsg.HDR_OFF
+                elif func == 2:
+                    s.record_state = RecordingMsg.OFF if s.record_state == RecordingMsg.ON else RecordingMsg.ON
+                elif func == 3:
+                    s.motion_mode = MotionModeMsg.LOCK
+                elif func == 4:
+                    s.motion_mode = MotionModeMsg.FOLLOW
+                elif func == 5:
+                    s.motion_mode = MotionModeMsg.FPV
+            return [self.encodeMsg(toHex(feedback, 8), COMMAND.FUNC_FEEDBACK_INFO)]
+
+        if cmd_id == COMMAND.FUNC_FEEDBACK_INFO:
+            return [self.encodeMsg(toHex(FuncFeedbackInfoMsg.SUCCESSFUL, 8), cmd_id)]
+
+        self._logger.warning("CMD ID %s is not emulated", cmd_id)
+        return []
+
+    ##################################################
+    #                   Replies                      #
+    ##################################################
+    def encodeMsg(self, data: str, cmd_id: str):
+        """
+        Encodes a reply, as the camera does: CTRL is ACK and the sequence is incremented for every reply.
+        Called from the receiving and the simulation threads, so the sequence is taken under the state lock
+        """
+        with self._state_lock:
+            self._seq = (self._seq + 1) % 65536
+            seq = self._seq
+        msg_front = self._msg.HEADER + '02' + self._msg.computeDataLen(data) + toHex(seq, 16) + cmd_id + data
+        return msg_front + crc16_str_swap(msg_front)
+
+    def attitudeMsg(self):
+        with self._state_lock:
+            s = self._state
+            data = (toHex(int(round(s.yaw * 10)), 16) + toHex(int(round(s.pitch * 10)), 16)
+                    + toHex(int(round(s.roll * 10)), 16) + toHex(int(round(s.yaw_speed * 10)), 16)
+                    + toHex(int(round(s.pitch_speed * 10)), 16) + toHex(int(round(s.roll_speed * 10)), 16))
+        return self.encodeMsg(data, COMMAND.ACQUIRE_GIMBAL_ATT)
+
+    def hardwareIdData(self):
+        """
+        Hardware ID (12 bytes). SIYISDK.parseHardwareIDMsg reads the camera key from the swapped characters of the first byte
+        """
+        key = '00'
+        for k, v in HardwareIDMsg.CAM_DICT.items():
+            if v == self._cam_type:
+                key = k
+                break
+        return (key[1] + key[0]).lower() + '00' * 11
+
+
+def main():
+    import argparse
+    from time import sleep
+    parser = argparse.ArgumentParser(description="Local SIYI camera-gimbal emulator")
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=37260)
+    parser.add_argument("--cam", default="A8 mini", help="Emulated camera type")
+    parser.add_argument("--latency", type=float, default=0.0, help="One-way latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Max random extra latency in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="Reply loss probability")
+    parser.add_argument("--reorder", type=float, default=0.0, help="Reply reordering probability")
+    parser.add_argument("--push-rate", type=float, default=0.0, help="Attitude push stream rate in Hz")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='[%(levelname)s] %(asctime)s [%(name)s::%(funcName)s] :\t%(message)s')
+    emu = SIYIEmulator(ip=args.ip, port=args.port, cam_type=args.cam, latency=args.latency, jitter=args.jitter,
+                       loss=args.loss, reorder=args.reorder, seed=args.seed, debug=args.debug)
+    emu.start()
+    if args.push_rate > 0:
+        emu.setPushRate(args.push_rate)
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        emu.stop()
+
+
+if __name__ == "__main__":
+    main()
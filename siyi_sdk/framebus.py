@@ -0,0 +1,281 @@
+"""
+Shared-memory ring buffer of image frames, so one decoded stream can feed several processes
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+The writer (e.g. SIYIRTSP.enableSharedMemory()) copies each frame once into a slot of the ring.
+Readers in other processes map the same memory and get NumPy views of the slots, without copying.
+
+Every slot has a sequence lock: the writer makes it odd while it writes the slot, and even when done.
+A reader keeps the lock value it saw when it got the frame, and SharedFrame.isValid() tells whether
+the slot was overwritten since. A reader has about (n_slots - 1) frame periods to use a view.
+
+Memory layout
+--
+- Header (64 bytes): MAGIC, n_slots, height, width, channels, slot size, last written frame seq
+- Slots: slot header (32 bytes: lock, frame seq, stamp, pts) followed by height*width*channels bytes
+
+Example (reader process)
+--
+    reader = SharedFrameReader("siyi_front")
+    seq = 0
+    while True:
+        frame = reader.waitForFrame(seq, timeout=1.0)
+        if frame is None:
+            continue
+        seq = frame.seq
+        process(frame.image)
+        if not frame.isValid():
+            pass  # the slot was overwritten while processing, discard the result
+"""
+import struct
+from time import time, sleep, monotonic
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = b'SIYIBUS1'
+HEADER = struct.Struct('<8sIIIIIQ')
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<QQdd')
+SLOT_HEADER_SIZE = 32
+# Offset of the last written frame seq in the header
+WRITE_SEQ_OFFSET = HEADER.size - 8
+
+
+def _slotSize(height, width, channels):
+    # Slots are aligned to 64 bytes
+    size = SLOT_HEADER_SIZE + height * width * channels
+    return (size + 63) // 64 * 64
+
+
+class SharedFrame:
+    """
+    Frame read from the shared memory. image is a view of the shared memory, valid while isValid() is True
+    """
+    def __init__(self, reader, slot, lock, seq, stamp, pts, image) -> None:
+        self._reader = reader
+        self.slot = slot
+        self.seq = seq
+        self.stamp = stamp
+        self.pts = pts
+        self.image = image
+        self._lock = lock
+
+    def isValid(self):
+        """
+        Returns False if the writer has started overwriting this slot since the frame was read
+        """
+        return self._reader._slotLock(self.slot) == self._lock
+
+    def copy(self):
+        """
+        Returns a copy of the image, or None if the slot was overwritten during the copy
+        """
+        image = self.image.copy()
+        if not self.isValid():
+            return None
+        return image
+
+
+class SharedFrameWriter:
+    """
+    Creates the shared memory and writes frames into it
+    """
+    def __init__(self, name, shape, n_slots=4) -> None:
+        """
+        Params
+        --
+        - name [str] shared memory name, used by readers to attach
+        - shape [tuple] (height, width) or (height, width, channels) of the frames, uint8
+        - n_slots [int] number of frames in the ring
+        """
+        height, width = shape[0], shape[1]
+        channels = shape[2] if len(shape) > 2 else 1
+        self._shape = tuple(shape)
+        self._n_slots = n_slots
+        self._slot_size = _slotSize(height, width, channels)
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + n_slots * self._slot_size)
+        buf = self._shm.buf
+        HEADER.pack_into(buf, 0, MAGIC, n_slots, height, width, channels, self._slot_size, 0)
+        for i in range(n_slots):
+            SLOT_HEADER.pack_into(buf, self._slotOffset(i), 0, 0, 0.0, 0.0)
+        self._views = [np.ndarray(self._shape, dtype=np.uint8, buffer=buf,
+                                  offset=self._slotOffset(i) + SLOT_HEADER_SIZE) for i in range(n_slots)]
+        self._count = 0
+
+    def _slotOffset(self, i):
+        return HEADER_SIZE + i * self._slot_size
+
+    def getName(self):
+        return self._shm.name
+
+    def getShape(self):
+        return self._shape
+
+    def write(self, image, seq=None, stamp=None, pts=0.0) -> bool:
+        """
+        Copies an image into the next slot
+
+        Params
+        --
+        - image [numpy array] uint8 image of the writer shape
+        - seq [int] frame sequence number. None uses an internal counter
+        - stamp [float] capture time in seconds, time.monotonic() as VideoFrame.stamp. None uses the current time
+        - pts [float] presentation timestamp in milliseconds
+
+        Returns
+        --
+        False if the image shape does not match
+        """
+        if image.shape != self._shape:
+            return False
+        self._count += 1
+        if seq is None:
+            seq = self._count
+        if stamp is None:
+            stamp = monotonic()
+        i = self._count % self._n_slots
+        off = self._slotOffset(i)
+        buf = self._shm.buf
+        lock = struct.unpack_from('<Q', buf, off)[0]
+        struct.pack_into('<Q', buf, off, lock + 1)  # odd: writing
+        np.copyto(self._views[i], image)
+        struct.pack_into('<Qdd', buf, off + 8, seq, stamp, pts)
+        struct.pack_into('<Q', buf, off, lock + 2)  # even: done
+        struct.pack_into('<Q', buf, WRITE_SEQ_OFFSET, self._count)
+        return True
+
+    def close(self, unlink=True):
+        """
+        Releases the shared memory. unlink removes it, readers then can't attach anymore
+        """
+        self._views = []
+        self._shm.close()
+        if unlink:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def unlinkSharedMemory(name):
+    """
+    Removes the shared memory of a writer that could not close it, e.g. because its process died
+
+    Returns
+    --
+    True if the memory existed
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+    return True
+
+
+class SharedFrameReader:
+    """
+    Attaches to the shared memory of a SharedFrameWriter
+    """
+    def __init__(self, name, timeout=5.0) -> None:
+        """
+        Params
+        --
+        - name [str] shared memory name
+        - timeout [float] seconds to wait for the writer to create the memory
+        """
+        t0 = time()
+        while True:
+            try:
+                self._shm = shared_memory.SharedMemory(name=name)
+                break
+            except FileNotFoundError:
+                if time() - t0 > timeout:
+                    raise
+                sleep(0.05)
+        # The writer owns the memory. Do not let this process' resource tracker unlink it on exit
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        magic, n_slots, height, width, channels, slot_size, _ = HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC:
+            self._shm.close()
+            raise ValueError("{} is not a SIYI frame bus".format(name))
+        self._n_slots = n_slots
+        self._slot_size = slot_size
+        self._shape = (height, width, channels) if channels > 1 else (height, width)
+        self._views = [np.ndarray(self._shape, dtype=np.uint8, buffer=self._shm.buf,
+                                  offset=HEADER_SIZE + i * slot_size + SLOT_HEADER_SIZE) for i in range(n_slots)]
+
+    def getShape(self):
+        return self._shape
+
+    def _slotLock(self, i):
+        return struct.unpack_from('<Q', self._shm.buf, HEADER_SIZE + i * self._slot_size)[0]
+
+    def getWriteCount(self):
+        """
+        Number of frames written so far
+        """
+        return struct.unpack_from('<Q', self._shm.buf, WRITE_SEQ_OFFSET)[0]
+
+    def latest(self):
+        """
+        Returns the latest complete frame as a SharedFrame, or None if nothing was written yet
+        """
+        count = self.getWriteCount()
+        # The latest slot may be being overwritten already, then fall back to older ones
+        for back in range(min(count, self._n_slots)):
+            i = (count - back) % self._n_slots
+            off = HEADER_SIZE + i * self._slot_size
+            lock, seq, stamp, pts = SLOT_HEADER.unpack_from(self._shm.buf, off)
+            if lock % 2 == 1 or lock == 0:
+                continue
+            return SharedFrame(self, i, lock, seq, stamp, pts, self._views[i])
+        return None
+
+    def waitForFrame(self, after_seq=0, timeout=None, poll_interval=0.001, event=None):
+        """
+        Waits for a frame with seq greater than after_seq, and returns the latest one
+
+        Params
+        --
+        - after_seq [int] seq of the last processed frame
+        - timeout [float] seconds. None waits forever
+        - poll_interval [float] seconds between checks of the write counter, without event
+        - event [multiprocessing.Event] set by the writer process after each frame. The reader sleeps on it
+          instead of polling. Only one reader may wait on an event, since it clears it
+
+        Returns
+        --
+        [SharedFrame] or None on timeout
+        """
+        t0 = time()
+        while True:
+            if event is not None:
+                # Cleared before the check, so a frame written after it sets the event again
+                event.clear()
+            frame = self.latest()
+            if frame is not None and frame.seq > after_seq:
+                return frame
+            remaining = None if timeout is None else t0 + timeout - time()
+            if remaining is not None and remaining <= 0:
+                return None
+            if event is not None:
+                event.wait(remaining)
+            else:
+                sleep(poll_interval)
+
+    def close(self):
+        self._views = []
+        self._shm.close()
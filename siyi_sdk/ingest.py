@@ -0,0 +1,286 @@
+"""
+Video ingest from several SIYI cameras, with one capture process per camera
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+A SIYIRTSP runs its capture loop in a Python thread, so with several cameras the frame handling of every stream,
+and the application, share one interpreter lock. VideoIngest runs each SIYIRTSP in its own process instead:
+the cameras are captured in parallel on different cores, and the application process only receives the frames.
+
+The capture processes publish the frames in shared memory (see framebus.py), and set an event after each frame.
+In the application process, one thread per camera waits on that event, copies each new frame out of the shared
+memory once, and puts it in the FrameQueues of that camera. The total number of decoder threads is capped by max_decode_threads, shared between the cameras.
+A capture process that dies is restarted, and its shared memory is removed.
+
+Frame stamps are time.monotonic() of the capture process, which is the same clock in all processes on Linux.
+Requires numpy.
+
+Example
+--
+    ingest = VideoIngest(max_decode_threads=4)
+    ingest.addCamera("front", "rtsp://192.168.144.25:8554/main.264", output_size=(640, 360))
+    ingest.addCamera("rear", "rtsp://192.168.144.26:8554/main.264", output_size=(640, 360))
+    front = ingest.createQueue("front")
+    ingest.start()
+    frame = front.get(timeout=1.0)
+    ...
+    ingest.close()
+"""
+import os
+import struct
+import threading
+import logging
+import multiprocessing
+
+from .stream import FrameQueue, VideoFrame
+
+# Seconds between the stream statistics sent by the capture processes
+STATS_INTERVAL = 1.0
+
+
+def _captureWorker(name, rtsp_url, bus_name, n_slots, options, stop, frame_ready, stats_conn):
+    # Entry point of a capture process
+    from .stream import SIYIRTSP
+    rtsp = SIYIRTSP(rtsp_url, cam_name=name, **options)
+    rtsp.enableSharedMemory(bus_name, n_slots)
+    # Frame callbacks run after the frame is in shared memory
+    rtsp.addFrameCallback(lambda frame: frame_ready.set())
+    try:
+        while not stop.wait(STATS_INTERVAL):
+            stats_conn.send(rtsp.getStreamStats())
+    except (BrokenPipeError, EOFError):
+        pass
+    finally:
+        rtsp.close()
+        stats_conn.close()
+
+
+class IngestCamera:
+    """
+    State of one camera of a VideoIngest
+    """
+    def __init__(self, name, rtsp_url, options) -> None:
+        self.name = name
+        self.rtsp_url = rtsp_url
+        self.options = options
+        self.queues = []
+        self.process = None
+        self.stop = None
+        self.frame_ready = None
+        self.stats_conn = None
+        self.bus_name = None
+        self.stats = {}
+        self.starts = 0
+        self.frames = 0
+        self.torn = 0
+        self.thread = None
+
+
+class VideoIngest:
+    """
+    Captures several RTSP streams in separate processes, and delivers their frames to per-camera FrameQueues
+    """
+    def __init__(self, max_decode_threads=None, n_slots=4, restart_delay=1.0, bus_prefix="siyi_ingest") -> None:
+        """
+        Params
+        --
+        - max_decode_threads [int] total number of decoder threads, divided between the cameras (at least 1 each).
+          None uses the number of cores
+        - n_slots [int] frames in the shared memory ring of each camera
+        - restart_delay [float] seconds before a dead capture process is restarted
+        - bus_prefix [str] prefix of the shared memory names
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._max_decode_threads = max_decode_threads or os.cpu_count() or 1
+        self._n_slots = n_slots
+        self._restart_delay = restart_delay
+        self._bus_prefix = bus_prefix
+        # Threads and forked processes do not mix, the capture processes start from a fresh interpreter
+        self._ctx = multiprocessing.get_context("spawn")
+        self._cameras = {}
+        self._started = False
+        self._stopped = threading.Event()
+
+    def addCamera(self, name, rtsp_url, **options):
+        """
+        Adds a camera. Must be called before start()
+
+        Params
+        --
+        - name [str] camera name, used by createQueue() and getStreamStats()
+        - rtsp_url [str] RTSP url
+        - options: SIYIRTSP parameters, e.g. backend='gstreamer', output_size=(640, 360). A backend class must be
+          importable by the capture process. decode_threads is set by VideoIngest
+        """
+        if self._started:
+            raise RuntimeError("Cameras must be added before start()")
+        if name in self._cameras:
+            raise ValueError("Camera {} already added".format(name))
+        self._cameras[name] = IngestCamera(name, rtsp_url, dict(options))
+
+    def getCameras(self):
+        return list(self._cameras.keys())
+
+    def getDecodeThreads(self):
+        """
+        Decoder threads of each camera
+        """
+        return max(1, self._max_decode_threads // max(1, len(self._cameras)))
+
+    def createQueue(self, name, maxsize=1, policy=FrameQueue.DROP_OLDEST, block_timeout=None):
+        """
+        Creates a FrameQueue that receives the frames of a camera. Each consumer should use its own queue.
+        The images are copies, valid as long as they are used. See FrameQueue for the parameters
+
+        Returns
+        --
+        [FrameQueue]
+        """
+        q = FrameQueue(maxsize, policy, block_timeout)
+        self._cameras[name].queues.append(q)
+        return q
+
+    def removeQueue(self, name, q):
+        cam = self._cameras[name]
+        if q in cam.queues:
+            cam.queues.remove(q)
+        q.close()
+
+    def getStreamStats(self, name):
+        """
+        Returns the latest SIYIRTSP.getStreamStats() of a camera's capture process, with
+        - alive [bool] whether the capture process runs
+        - restarts [int] number of times the process was restarted
+        - delivered [int] frames put in the queues of the camera
+        - torn [int] frames overwritten in shared memory before they could be copied
+        """
+        cam = self._cameras[name]
+        stats = dict(cam.stats)
+        stats["alive"] = cam.process is not None and cam.process.is_alive()
+        stats["restarts"] = max(0, cam.starts - 1)
+        stats["delivered"] = cam.frames
+        stats["torn"] = cam.torn
+        return stats
+
+    def _startProcess(self, cam):
+        cam.starts += 1
+        # A new name for each process, in case a dead one left its memory behind
+        cam.bus_name = "{}_{}_{}_{}".format(self._bus_prefix, os.getpid(), cam.name, cam.starts)
+        options = dict(cam.options, decode_threads=self.getDecodeThreads())
+        cam.stop = self._ctx.Event()
+        cam.frame_ready = self._ctx.Event()
+        cam.stats_conn, child_conn = self._ctx.Pipe(duplex=False)
+        cam.process = self._ctx.Process(target=_captureWorker, name="capture-" + cam.name, daemon=True,
+                                        args=(cam.name, cam.rtsp_url, cam.bus_name, self._n_slots, options,
+                                              cam.stop, cam.frame_ready, child_conn))
+        cam.process.start()
+        child_conn.close()
+        self._logger.info("Started capture process of %s (pid %s, %s decoder threads)",
+                          cam.name, cam.process.pid, options["decode_threads"])
+
+    def _stopProcess(self, cam, timeout=5.0):
+        if cam.process is None:
+            return
+        cam.stop.set()
+        cam.process.join(timeout)
+        if cam.process.is_alive():
+            cam.process.terminate()
+            cam.process.join()
+        cam.stats_conn.close()
+        self._removeBus(cam)
+
+    def _removeBus(self, cam):
+        # A process that was killed could not remove its shared memory
+        from .framebus import unlinkSharedMemory
+        if unlinkSharedMemory(cam.bus_name):
+            self._logger.info("Removed shared memory %s of %s", cam.bus_name, cam.name)
+
+    def _readStats(self, cam):
+        try:
+            while cam.stats_conn.poll():
+                cam.stats = cam.stats_conn.recv()
+        except (EOFError, OSError):
+            pass
+
+    def readLoop(self, cam):
+        """
+        Delivers the frames of one camera, and restarts its capture process when it dies
+        """
+        from .framebus import SharedFrameReader
+        reader = None
+        seq = 0
+        while not self._stopped.is_set():
+            self._readStats(cam)
+            if not cam.process.is_alive():
+                self._logger.warning("Capture process of %s exited with code %s, restarting",
+                                     cam.name, cam.process.exitcode)
+                if reader is not None:
+                    reader.close()
+                    reader = None
+                cam.stats_conn.close()
+                self._removeBus(cam)
+                if self._stopped.wait(self._restart_delay):
+                    break
+                self._startProcess(cam)
+                seq = 0
+                continue
+            if reader is None:
+                # The shared memory is created with the first frame
+                try:
+                    reader = SharedFrameReader(cam.bus_name, timeout=0.2)
+                except FileNotFoundError:
+                    continue
+                except (ValueError, struct.error):
+                    # Created, but its header is not written yet
+                    self._stopped.wait(0.01)
+                    continue
+            frame = reader.waitForFrame(seq, timeout=0.2, event=cam.frame_ready)
+            if frame is None:
+                continue
+            seq = frame.seq
+            image = frame.copy()
+            if image is None:
+                cam.torn += 1
+                continue
+            cam.frames += 1
+            f = VideoFrame(frame.seq, image, frame.stamp, frame.pts or None)
+            for q in cam.queues:
+                q.put(f)
+        if reader is not None:
+            reader.close()
+
+    def start(self):
+        """
+        Starts the capture processes and the delivery threads
+        """
+        if self._started:
+            return
+        self._started = True
+        self._stopped.clear()
+        for cam in self._cameras.values():
+            self._startProcess(cam)
+            cam.thread = threading.Thread(target=self.readLoop, args=(cam,), daemon=True)
+            cam.thread.start()
+
+    def close(self):
+        """
+        Stops the capture processes, and closes the queues. Queued frames can still be read
+        """
+        self._stopped.set()
+        for cam in self._cameras.values():
+            if cam.thread is not None:
+                cam.thread.join()
+                cam.thread = None
+        for cam in self._cameras.values():
+            self._stopProcess(cam)
+            for q in cam.queues:
+                q.close()
+        self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
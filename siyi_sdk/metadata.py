@@ -0,0 +1,292 @@
+"""
+Per-frame gimbal state sidecar, synchronized to the video frames
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+SIYISDK keeps a short history of the gimbal attitude and zoom (see SIYISDK.getStateHistory()).
+MetadataWriter receives the frames of a SIYIRTSP, looks up the gimbal state at the arrival time of every
+frame (frame.stamp), interpolated between the two nearest attitude samples, and appends it to a sidecar file.
+The frame callback only queues (seq, stamp, pts), the lookup and the writes run in a background thread.
+
+File formats
+--
+- Binary (little endian): MAGIC (8 bytes) + wall clock time (float64) and time.monotonic() (float64) at the start,
+  then one RECORD per frame: seq (uint64), stamp (float64), pts in ms (float64, NaN if unknown),
+  yaw, pitch, roll in degrees, zoom level, age of the attitude in seconds (float32)
+- CSV: a "# wall_time=... stamp=..." line, a header line, then one line per frame with the same fields
+
+stamp is time.monotonic(). Add (wall_time - stamp of the header) to get the wall clock time, e.g. to find
+the segment of a SegmentRecorder that contains a frame.
+
+Usage
+--
+    writer = MetadataWriter(cam, rtsp, "flight.meta")
+    ...
+    writer.close()
+    for m in readMetadata("flight.meta"):
+        print(m.seq, m.yaw, m.pitch, m.zoom)
+"""
+import struct
+import threading
+import collections
+import bisect
+import logging
+import math
+from time import time, monotonic
+
+MAGIC = b'SIYIMET\x01'
+HEADER = struct.Struct('<8sdd')
+RECORD = struct.Struct('<Qdd5f')
+
+CSV_FIELDS = ("seq", "stamp", "pts", "yaw", "pitch", "roll", "zoom", "age")
+
+FrameMetadata = collections.namedtuple("FrameMetadata", CSV_FIELDS)
+
+
+def _angleLerp(a, b, k):
+    # Interpolates angles in degrees through the shortest way, e.g. from 179 to -179
+    d = (b - a + 180.) % 360. - 180.
+    v = a + k * d
+    if v > 180.:
+        v -= 360.
+    elif v <= -180.:
+        v += 360.
+    return v
+
+
+class GimbalStateHistory:
+    """
+    Bounded history of the gimbal attitude and zoom, in time.monotonic() time. Thread safe.
+    """
+    def __init__(self, maxlen=3000) -> None:
+        """
+        Params
+        --
+        - maxlen [int] number of attitude samples kept. 3000 samples are 60 s at the 50 Hz polling rate
+        """
+        self._lock = threading.Lock()
+        self._stamps = collections.deque(maxlen=maxlen)
+        self._states = collections.deque(maxlen=maxlen)
+        self._zoom = 0.0
+
+    def setZoom(self, level):
+        """
+        Sets the zoom level recorded with the next attitude samples
+        """
+        self._zoom = level
+
+    def add(self, yaw, pitch, roll, stamp=None):
+        """
+        Appends an attitude sample
+
+        Params
+        --
+        - yaw, pitch, roll [float] degrees
+        - stamp [float] time.monotonic() when it was received. None uses the current time
+        """
+        if stamp is None:
+            stamp = monotonic()
+        with self._lock:
+            self._stamps.append(stamp)
+            self._states.append((yaw, pitch, roll, self._zoom))
+
+    def __len__(self):
+        return len(self._stamps)
+
+    def getLatestStamp(self):
+        """
+        Returns the time of the newest sample, or None if there is none
+        """
+        with self._lock:
+            return self._stamps[-1] if self._stamps else None
+
+    def at(self, stamp):
+        """
+        Returns the gimbal state at a given time
+
+        Params
+        --
+        - stamp [float] time.monotonic() time, e.g. VideoFrame.stamp
+
+        Returns
+        --
+        [tuple] (yaw, pitch, roll, zoom, age) or None if there is no sample yet.
+        The angles are interpolated between the samples around stamp. Out of the history, the nearest sample is used,
+        and age is its distance to stamp in seconds, 0 otherwise.
+        """
+        with self._lock:
+            n = len(self._stamps)
+            if n == 0:
+                return None
+            i = bisect.bisect_left(self._stamps, stamp)
+            if i == 0:
+                return self._states[0] + (self._stamps[0] - stamp,)
+            if i == n:
+                return self._states[-1] + (stamp - self._stamps[-1],)
+            t0, t1 = self._stamps[i - 1], self._stamps[i]
+            s0, s1 = self._states[i - 1], self._states[i]
+        k = (stamp - t0) / (t1 - t0) if t1 > t0 else 0.0
+        return (_angleLerp(s0[0], s1[0], k),
+                s0[1] + k * (s1[1] - s0[1]),
+                s0[2] + k * (s1[2] - s0[2]),
+                s1[3] if k >= 0.5 else s0[3],
+                0.0)
+
+
+class MetadataWriter:
+    """
+    Writes the gimbal state of every frame of a SIYIRTSP to a sidecar file, from a background thread.
+    onFrame() never blocks: frames are dropped (see getDroppedCount()) if the writer falls max_pending behind.
+    """
+    def __init__(self, cam, rtsp, path: str, fmt=None, flush_interval=0.2, max_delay=0.5, max_pending=10000) -> None:
+        """
+        Params
+        --
+        - cam [SIYISDK] connected SDK instance, source of the gimbal state
+        - rtsp [SIYIRTSP] stream whose frames are tagged. None to call onFrame() yourself
+        - path [str] sidecar file, overwritten if it exists
+        - fmt [str] 'csv' or 'bin'. None: 'csv' if path ends with .csv, 'bin' otherwise
+        - flush_interval [float] seconds between writes to the file
+        - max_delay [float] a frame waits up to this many seconds for the next attitude sample, so its state can be
+          interpolated. After that the latest sample is used, and its age is recorded
+        - max_pending [int] maximum number of queued frames
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        if fmt is None:
+            fmt = 'csv' if path.lower().endswith('.csv') else 'bin'
+        if fmt not in ('csv', 'bin'):
+            raise ValueError("Unknown metadata format {}. Use 'csv' or 'bin'".format(fmt))
+        self._fmt = fmt
+        self._path = path
+        self._cam = cam
+        self._history = cam.getStateHistory()
+        # The zoom level of the frames follows changes made by other controllers
+        cam.enableZoomPolling()
+        self._rtsp = rtsp
+        self._flush_interval = flush_interval
+        self._max_delay = max_delay
+        self._max_pending = max_pending
+
+        self._queue = collections.deque()
+        self._dropped = 0
+        self._written = 0
+
+        if fmt == 'bin':
+            self._file = open(path, 'wb', buffering=1 << 16)
+            self._file.write(HEADER.pack(MAGIC, time(), monotonic()))
+        else:
+            self._file = open(path, 'w', buffering=1 << 16)
+            self._file.write("# wall_time={!r} stamp={!r}\n".format(time(), monotonic()))
+            self._file.write(",".join(CSV_FIELDS) + "\n")
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.loop, daemon=True)
+        self._thread.start()
+        if rtsp is not None:
+            rtsp.addFrameCallback(self.onFrame)
+
+    def onFrame(self, frame):
+        """
+        Queues a VideoFrame. Only its seq, stamp and pts are kept
+        """
+        if len(self._queue) >= self._max_pending:
+            self._dropped += 1
+            return
+        self._queue.append((frame.seq, frame.stamp, frame.pts))
+
+    def getDroppedCount(self):
+        return self._dropped
+
+    def getWrittenCount(self):
+        return self._written
+
+    def _write(self, flush_all=False):
+        q = self._queue
+        latest = self._history.getLatestStamp()
+        deadline = monotonic() - self._max_delay
+        lines = []
+        while q:
+            seq, stamp, pts = q[0]
+            # Wait for an attitude sample newer than the frame, so the state is interpolated
+            if not flush_all and (latest is None or stamp > latest) and stamp > deadline:
+                break
+            q.popleft()
+            state = self._history.at(stamp)
+            if state is None:
+                state = (math.nan, math.nan, math.nan, math.nan, math.nan)
+            if pts is None:
+                pts = math.nan
+            if self._fmt == 'bin':
+                lines.append(RECORD.pack(seq, stamp, pts, *state))
+            else:
+                lines.append("{},{:.6f},{:.3f},{:.2f},{:.2f},{:.2f},{:.1f},{:.3f}\n".format(seq, stamp, pts, *state))
+        if lines:
+            self._file.write((b'' if self._fmt == 'bin' else '').join(lines))
+            self._written += len(lines)
+
+    def loop(self):
+        while not self._stopped.wait(self._flush_interval):
+            try:
+                self._write()
+            except Exception as e:
+                self._logger.error("Could not write metadata %s: %s", self._path, e)
+                return
+
+    def close(self):
+        """
+        Stops receiving frames, writes the pending ones and closes the file
+        """
+        if self._rtsp is not None:
+            self._rtsp.removeFrameCallback(self.onFrame)
+        self._stopped.set()
+        self._thread.join()
+        self._write(flush_all=True)
+        self._file.close()
+        self._cam.enableZoomPolling(False)
+
+
+def readMetadata(path: str):
+    """
+    Reads a sidecar file written by MetadataWriter, binary or CSV
+
+    Returns
+    --
+    Generator of FrameMetadata(seq, stamp, pts, yaw, pitch, roll, zoom, age). pts is NaN if unknown
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        with open(path, 'rb') as f:
+            f.read(HEADER.size)
+            while True:
+                b = f.read(RECORD.size)
+                if len(b) < RECORD.size:
+                    return
+                yield FrameMetadata(*RECORD.unpack(b))
+    else:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.startswith('#') or line.startswith(CSV_FIELDS[0]):
+                    continue
+                values = line.rstrip('\n').split(',')
+                if len(values) != len(CSV_FIELDS):
+                    return
+                yield FrameMetadata(int(values[0]), *[float(v) for v in values[1:]])
+
+
+def metadataStartTime(path: str):
+    """
+    Returns (wall clock time, time.monotonic()) at the start of a sidecar file, to convert frame stamps to wall clock time
+    """
+    with open(path, 'rb') as f:
+        head = f.read(HEADER.size)
+    if head[:len(MAGIC)] == MAGIC:
+        _, wall, stamp = HEADER.unpack(head)
+        return wall, stamp
+    line = head.split(b'\n')[0].decode()
+    if not line.startswith('# wall_time='):
+        raise ValueError("{} is not a SIYI metadata file".format(path))
+    with open(path, 'r') as f:
+        fields = dict(kv.split('=') for kv in f.readline()[1:].split())
+    return float(fields['wall_time']), float(fields['stamp'])
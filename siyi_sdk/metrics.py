@@ -0,0 +1,253 @@
+"""
+Per-command counters and histograms of the SDK traffic
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+Enable with SIYISDK(enable_stats=True), then read a snapshot with SIYISDK.getStats(),
+or export it in the Prometheus text format with prometheusText().
+"""
+import threading
+from time import monotonic
+
+from .siyi_message import COMMAND
+
+# Names of command IDs, e.g. '0d' -> 'ACQUIRE_GIMBAL_ATT'
+CMD_NAMES = {v: k for k, v in vars(COMMAND).items() if not k.startswith('_')}
+
+# Requests that are answered with a different command ID
+REPLY_CMD = {COMMAND.PHOTO_VIDEO_HDR: COMMAND.FUNC_FEEDBACK_INFO}
+
+
+class CommandStats:
+    """
+    Counters of a single command ID
+    """
+    # Upper bounds, in seconds, of the RTT histogram buckets
+    RTT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.crc_failures = 0
+
+        # Time of the latest request still waiting for a reply. Replies carry no request seq, so the RTT is
+        # measured from the latest request: a lost reply does not add the time since an older one
+        self.pending_t = None
+        self.rtt_count = 0
+        self.rtt_sum = 0.0
+        self.rtt_max = 0.0
+        self.rtt_buckets = [0] * (len(self.RTT_BUCKETS) + 1)  # last one is +Inf
+
+        # Inter-arrival time and jitter (RFC 3550 estimator)
+        self.last_rx_t = None
+        self.interval = None
+        self.jitter = 0.0
+
+    def addRTT(self, rtt):
+        self.rtt_count += 1
+        self.rtt_sum += rtt
+        if rtt > self.rtt_max:
+            self.rtt_max = rtt
+        i = 0
+        for b in self.RTT_BUCKETS:
+            if rtt <= b:
+                break
+            i += 1
+        self.rtt_buckets[i] += 1
+
+    def addArrival(self, t):
+        if self.last_rx_t is not None:
+            interval = t - self.last_rx_t
+            if self.interval is not None:
+                self.jitter += (abs(interval - self.interval) - self.jitter) / 16.
+            self.interval = interval
+        self.last_rx_t = t
+
+    def snapshot(self):
+        buckets = {}
+        n = 0
+        for b, c in zip(self.RTT_BUCKETS, self.rtt_buckets):
+            n += c
+            buckets[str(b)] = n
+        buckets["+Inf"] = n + self.rtt_buckets[-1]
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "crc_failures": self.crc_failures,
+            "rtt": {
+                "count": self.rtt_count,
+                "sum": self.rtt_sum,
+                "mean": self.rtt_sum / self.rtt_count if self.rtt_count else None,
+                "max": self.rtt_max,
+                "buckets": buckets,
+            },
+            "interval_s": self.interval,
+            "jitter_s": self.jitter,
+        }
+
+
+class LoopStats:
+    """
+    Period statistics of a polling loop
+    """
+    def __init__(self, period):
+        self.period = period
+        self.iterations = 0
+        self.overruns = 0
+        self.max_period = 0.0
+
+    def snapshot(self):
+        return {
+            "target_period_s": self.period,
+            "iterations": self.iterations,
+            "overruns": self.overruns,
+            "max_period_s": self.max_period,
+        }
+
+
+class SIYIStats:
+    """
+    Collects the counters of one SIYISDK instance. All methods are thread safe.
+    """
+    # A loop iteration longer than OVERRUN_FACTOR times its target period counts as an overrun
+    OVERRUN_FACTOR = 1.5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start_t = monotonic()
+        self._cmds = {}
+        self._unknown = {}
+        self._loops = {}
+
+    def _cmd(self, cmd_id):
+        s = self._cmds.get(cmd_id)
+        if s is None:
+            s = self._cmds[cmd_id] = CommandStats()
+        return s
+
+    def onSent(self, cmd_id):
+        t = monotonic()
+        with self._lock:
+            s = self._cmd(cmd_id)
+            s.sent += 1
+            self._cmd(REPLY_CMD.get(cmd_id, cmd_id)).pending_t = t
+
+    def onReceived(self, cmd_id):
+        t = monotonic()
+        with self._lock:
+            s = self._cmd(cmd_id)
+            s.received += 1
+            s.addArrival(t)
+            if s.pending_t is not None:
+                s.addRTT(t - s.pending_t)
+                s.pending_t = None
+
+    def onCRCError(self, cmd_id):
+        with self._lock:
+            self._cmd(cmd_id).crc_failures += 1
+
+    def onUnknown(self, cmd_id):
+        with self._lock:
+            self._unknown[cmd_id] = self._unknown.get(cmd_id, 0) + 1
+
+    def onLoop(self, name, target_period, period):
+        """
+        Records one iteration of a polling loop
+
+        Params
+        --
+        - name [str] loop name
+        - target_period [float] desired period in seconds
+        - period [float] actual duration of the iteration in seconds
+        """
+        with self._lock:
+            s = self._loops.get(name)
+            if s is None:
+                s = self._loops[name] = LoopStats(target_period)
+            s.iterations += 1
+            if period > self.OVERRUN_FACTOR * target_period:
+                s.overruns += 1
+            if period > s.max_period:
+                s.max_period = period
+
+    def snapshot(self):
+        """
+        Returns a copy of all counters as a dictionary
+        """
+        with self._lock:
+            cmds = {}
+            for cmd_id, s in self._cmds.items():
+                d = s.snapshot()
+                d["name"] = CMD_NAMES.get(cmd_id, cmd_id)
+                cmds[cmd_id] = d
+            return {
+                "uptime_s": monotonic() - self._start_t,
+                "commands": cmds,
+                "unknown_ids": dict(self._unknown),
+                "loops": {name: s.snapshot() for name, s in self._loops.items()},
+            }
+
+
+def prometheusText(stats: dict, prefix="siyi", labels=None):
+    """
+    Formats a stats snapshot (see SIYIStats.snapshot()) in the Prometheus text exposition format
+
+    Params
+    --
+    - stats [dict] snapshot
+    - prefix [str] prefix of the metric names
+    - labels [dict] extra labels added to every sample, e.g. {'camera': 'front'}
+
+    Returns
+    --
+    [str] text
+    """
+    base = dict(labels or {})
+
+    def fmt(name, value, extra=None):
+        l = dict(base)
+        if extra:
+            l.update(extra)
+        if l:
+            lstr = ",".join('{}="{}"'.format(k, v) for k, v in l.items())
+            return "{}_{}{{{}}} {}".format(prefix, name, lstr, value)
+        return "{}_{} {}".format(prefix, name, value)
+
+    lines = []
+    lines.append("# TYPE {}_uptime_seconds gauge".format(prefix))
+    lines.append(fmt("uptime_seconds", stats["uptime_s"]))
+
+    cmds = stats["commands"]
+    for metric, key in (("sent_total", "sent"), ("received_total", "received"), ("crc_failures_total", "crc_failures")):
+        lines.append("# TYPE {}_{} counter".format(prefix, metric))
+        for cmd_id, s in cmds.items():
+            lines.append(fmt(metric, s[key], {"cmd_id": cmd_id, "cmd": s["name"]}))
+
+    lines.append("# TYPE {}_rtt_seconds histogram".format(prefix))
+    for cmd_id, s in cmds.items():
+        l = {"cmd_id": cmd_id, "cmd": s["name"]}
+        for le, n in s["rtt"]["buckets"].items():
+            lines.append(fmt("rtt_seconds_bucket", n, dict(l, le=le)))
+        lines.append(fmt("rtt_seconds_sum", s["rtt"]["sum"], l))
+        lines.append(fmt("rtt_seconds_count", s["rtt"]["count"], l))
+
+    lines.append("# TYPE {}_jitter_seconds gauge".format(prefix))
+    for cmd_id, s in cmds.items():
+        lines.append(fmt("jitter_seconds", s["jitter_s"], {"cmd_id": cmd_id, "cmd": s["name"]}))
+
+    lines.append("# TYPE {}_unknown_ids_total counter".format(prefix))
+    for cmd_id, n in stats["unknown_ids"].items():
+        lines.append(fmt("unknown_ids_total", n, {"cmd_id": cmd_id}))
+
+    lines.append("# TYPE {}_loop_iterations_total counter".format(prefix))
+    for name, s in stats["loops"].items():
+        lines.append(fmt("loop_iterations_total", s["iterations"], {"loop": name}))
+    lines.append("# TYPE {}_loop_overruns_total counter".format(prefix))
+    for name, s in stats["loops"].items():
+        lines.append(fmt("loop_overruns_total", s["overruns"], {"loop": name}))
+    lines.append("# TYPE {}_loop_max_period_seconds gauge".format(prefix))
+    for name, s in stats["loops"].items():
+        lines.append(fmt("loop_max_period_seconds", s["max_period_s"], {"loop": name}))
+
+    return "\n".join(lines) + "\n"
@@ -7,9 +7,9 @@ Copyright 2022
 
 """
 from os import stat
-from crc16_python import crc16_str_swap
+from .crc16_python import crc16_str_swap
 import logging
-from utils import toHex
+from .utils import toHex
 
 class FirmwareMsg:
     seq=0
@@ -143,13 +143,10 @@ class SIYIMESSAGE:
     """
     def __init__(self, debug=False) -> None:
         self._debug= debug # print debug messages
-        if self._debug:
-            d_level = logging.DEBUG
-        else:
-            d_level = logging.INFO
-        LOG_FORMAT='[%(levelname)s] %(asctime)s [SIYIMessage::%(funcName)s] :\t%(message)s'
-        logging.basicConfig(format=LOG_FORMAT, level=d_level)
+        # Logging is configured by the application. debug only lowers this logger's level
         self._logger = logging.getLogger(self.__class__.__name__)
+        if self._debug:
+            self._logger.setLevel(logging.DEBUG)
 
         self.HEADER='5566'# STX, 2 bytes
         self._ctr ='01'        
@@ -328,9 +325,7 @@ class SIYIMESSAGE:
         msg_front = self.HEADER+self._ctr+data_len+'0000'+cmd_id+data
         crc = crc16_str_swap(msg_front)
         if crc is not None:
-            msg = msg_front+crc
-            self._logger.debug("Encoded msg: %s", msg)
-            return msg
+            return msg_front+crc
         else:
             self._logger.error("Could not encode message. crc16 is None")
             return ''
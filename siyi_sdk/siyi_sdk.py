@@ -7,30 +7,34 @@ Copyright 2022
 
 """
 import socket
-from siyi_message import *
+from .siyi_message import *
 from time import sleep, time
 import logging
-from utils import  toInt
+from .utils import toInt
 import threading
-import cameras
+from concurrent.futures import Future
+from . import cameras
+from .metrics import SIYIStats
+from . import capture
+from .metadata import GimbalStateHistory
 
 
 class SIYISDK:
-    def __init__(self, server_ip="192.168.144.25", port=37260, debug=False):
+    def __init__(self, server_ip="192.168.144.25", port=37260, debug=False, enable_stats=False):
         """
         Params
         --
         - server_ip [str] IP address of the camera
         - port: [int] UDP port of the camera
+        - enable_stats [bool] collect per-command counters, see getStats()
         """
         self._debug = debug
-        if self._debug:
-            d_level = logging.DEBUG
-        else:
-            d_level = logging.INFO
-        LOG_FORMAT = ' [%(levelname)s] %(asctime)s [SIYISDK::%(funcName)s] :\t%(message)s'
-        logging.basicConfig(format=LOG_FORMAT, level=d_level)
+        # Logging is configured by the application (see test()). debug only lowers this logger's level
         self._logger = logging.getLogger(self.__class__.__name__)
+        if self._debug:
+            self._logger.setLevel(logging.DEBUG)
+        # Whether debug messages are enabled. Checked once per received buffer, so parsers don't build arguments for nothing
+        self._log_debug = self._logger.isEnabledFor(logging.DEBUG)
 
         # Message sent to the camera
         self._out_msg = SIYIMESSAGE(debug=self._debug)
@@ -43,6 +47,26 @@ class SIYISDK:
 
         self._BUFF_SIZE = 1024
 
+        # Traffic statistics. None when disabled
+        self._stats = None
+        self.enableStats(enable_stats)
+
+        # Raw datagram recorder, see startCapture()
+        self._recorder = None
+
+        # Recent attitude and zoom, to look up the gimbal state at the time of a video frame. See getStateHistory()
+        self._state_history = GimbalStateHistory()
+        # Number of users of the current zoom level polling, see enableZoomPolling()
+        self._zoom_polling = 0
+        self._zoom_polling_lock = threading.Lock()
+
+        # Target of the rotation controller thread, see setGimbalRotationAsync()
+        self._rotation_cond = threading.Condition()
+        self._rotation_target = None
+        self._rotation_thread = None
+        # True while the controller may have left the gimbal moving, until it sent its final stop
+        self._rotation_busy = False
+
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._rcv_wait_t = 5  # Receiving wait time
         self._socket.settimeout(self._rcv_wait_t)
@@ -149,6 +173,12 @@ class SIYISDK:
         """
         self._logger.info("Stopping all threads and disconnecting")
         self._stop = True  # Signal threads to stop
+        self.cancelRotation()
+        with self._rotation_cond:
+            self._rotation_cond.notify_all()
+        if self._rotation_thread is not None:
+            self._rotation_thread.join()
+            self._rotation_thread = None
 
         # Close the socket to unblock any recvfrom() calls
         if self._socket:
@@ -198,8 +228,12 @@ class SIYISDK:
         """
         while not self._stop:
             try:
+                t0 = time()
                 self.checkConnection()
                 sleep(t)
+                stats = self._stats
+                if stats is not None:
+                    stats.onLoop("connection", t, time() - t0)
             except Exception as e:
                 self._logger.error(f"Error in connection loop: {e}")
                 self.disconnect()
@@ -235,7 +269,8 @@ class SIYISDK:
 
     def gimbalInfoLoop(self, t):
         """
-        Periodically requests gimbal info.
+        Periodically requests gimbal info. While enableZoomPolling() is on, also requests the current zoom level,
+        so it stays current when it is changed by another controller
 
         Params
         --
@@ -243,8 +278,14 @@ class SIYISDK:
         """
         while not self._stop:
             try:
+                t0 = time()
                 self.requestGimbalInfo()
+                if self._zoom_polling > 0:
+                    self.requestCurrentZoomLevel()
                 sleep(t)
+                stats = self._stats
+                if stats is not None:
+                    stats.onLoop("gimbal_info", t, time() - t0)
             except Exception as e:
                 self._logger.error(f"Error in gimbal info loop: {e}")
                 self.disconnect()
@@ -259,8 +300,12 @@ class SIYISDK:
         """
         while not self._stop:
             try:
+                t0 = time()
                 self.requestGimbalAttitude()
                 sleep(t)
+                stats = self._stats
+                if stats is not None:
+                    stats.onLoop("gimbal_attitude", t, time() - t0)
             except Exception as e:
                 self._logger.error(f"Error in gimbal attitude loop: {e}")
                 self.disconnect()
@@ -276,10 +321,17 @@ class SIYISDK:
         b = bytes.fromhex(msg)
         try:
             self._socket.sendto(b, (self._server_ip, self._port))
-            return True
         except Exception as e:
             self._logger.error("Could not send bytes")
             return False
+        # Read once, stopCapture() and enableStats() may run on another thread
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(capture.TX, b)
+        stats = self._stats
+        if stats is not None:
+            stats.onSent(msg[14:16])
+        return True
 
     def rcvMsg(self):
         data=None
@@ -306,8 +358,22 @@ class SIYISDK:
             self._logger.error(f"[bufferCallback] {e}")
             return
 
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(capture.RX, buff)
+        self.parseBuffer(buff)
+
+    def parseBuffer(self, buff: bytes):
+        """
+        Splits a received buffer into packets, decodes them and updates the stored messages
+
+        Params
+        --
+        - buff [bytes] Raw bytes as received from the camera
+        """
+        # Raw datagrams are not logged, use startCapture() to trace them
+        self._log_debug = self._logger.isEnabledFor(logging.DEBUG)
         buff_str = buff.hex()
-        self._logger.debug("Buffer: %s", buff_str)
 
         # 10 bytes: STX+CTRL+Data_len+SEQ+CMD_ID+CRC16
         #            2 + 1  +    2   + 2 +   1  + 2
@@ -342,9 +408,17 @@ class SIYISDK:
             # Finally decode the packet!
             val = self._in_msg.decodeMsg(packet)
             if val is None:
+                # Packets are complete at this point, so decoding only fails on CRC
+                stats = self._stats
+                if stats is not None:
+                    stats.onCRCError(packet[14:16])
                 continue
             
             data, data_len, cmd_id, seq = val[0], val[1], val[2], val[3]
+            # Read once, enableStats() may run on another thread
+            stats = self._stats
+            if stats is not None:
+                stats.onReceived(cmd_id)
 
             if cmd_id==COMMAND.ACQUIRE_FW_VER:
                 self.parseFirmwareMsg(data, seq)
@@ -369,11 +443,14 @@ class SIYISDK:
             elif cmd_id==COMMAND.SET_GIMBAL_ATTITUDE:
                 self.parseSetGimbalAnglesMsg(data, seq)
             elif cmd_id==COMMAND.SET_DATA_STREAM:
-                self.parseRequestStreamMsg()
+                self.parseRequestStreamMsg(data, seq)
             elif cmd_id==COMMAND.CURRENT_ZOOM_VALUE:
                 self.parseCurrentZoomLevelMsg(data, seq)
             else:
                 self._logger.warning("CMD ID is not recognized")
+                stats = self._stats
+                if stats is not None:
+                    stats.onUnknown(cmd_id)
         
         return
     
@@ -706,7 +783,8 @@ class SIYISDK:
             self._fw_msg.gimbal_firmware_ver= msg[8:16]
             self._fw_msg.seq=seq
             
-            self._logger.debug("Firmware version: %s", self._fw_msg.gimbal_firmware_ver)
+            if self._log_debug:
+                self._logger.debug("Firmware version: %s", self._fw_msg.gimbal_firmware_ver)
 
             return True
         except Exception as e:
@@ -717,7 +795,8 @@ class SIYISDK:
         try:
             self._hw_msg.seq=seq
             self._hw_msg.id = msg
-            self._logger.debug("Hardware ID: %s", self._hw_msg.id)
+            if self._log_debug:
+                self._logger.debug("Hardware ID: %s", self._hw_msg.id)
             # first two characters define the camera ID
             
             # The numbers are reversed
@@ -743,11 +822,12 @@ class SIYISDK:
             self._att_msg.yaw_speed = toInt(msg[14:16]+msg[12:14]) /10.
             self._att_msg.pitch_speed = toInt(msg[18:20]+msg[16:18]) /10.
             self._att_msg.roll_speed = toInt(msg[22:24]+msg[20:22]) /10.
+            self._state_history.add(self._att_msg.yaw, self._att_msg.pitch, self._att_msg.roll)
 
-            self._logger.debug("(yaw, pitch, roll= (%s, %s, %s)", 
-                                    self._att_msg.yaw, self._att_msg.pitch, self._att_msg.roll)
-            self._logger.debug("(yaw_speed, pitch_speed, roll_speed= (%s, %s, %s)", 
-                                    self._att_msg.yaw_speed, self._att_msg.pitch_speed, self._att_msg.roll_speed)
+            if self._log_debug:
+                self._logger.debug("(yaw, pitch, roll)= (%s, %s, %s), (yaw_speed, pitch_speed, roll_speed)= (%s, %s, %s)",
+                                        self._att_msg.yaw, self._att_msg.pitch, self._att_msg.roll,
+                                        self._att_msg.yaw_speed, self._att_msg.pitch_speed, self._att_msg.roll_speed)
             return True
         except Exception as e:
             self._logger.error("Error %s", e)
@@ -763,9 +843,10 @@ class SIYISDK:
             self._motionMode_msg.mode = int('0x'+msg[8:10], base=16)
             self._mountDir_msg.dir = int('0x'+msg[10:12], base=16)
 
-            self._logger.debug("Recording state %s", self._record_msg.state)
-            self._logger.debug("Mounting direction %s", self._mountDir_msg.dir)
-            self._logger.debug("Gimbal motion mode %s", self._motionMode_msg.mode)
+            if self._log_debug:
+                self._logger.debug("Recording state %s", self._record_msg.state)
+                self._logger.debug("Mounting direction %s", self._mountDir_msg.dir)
+                self._logger.debug("Gimbal motion mode %s", self._motionMode_msg.mode)
             return True
         except Exception as e:
             self._logger.error("Error %s", e)
@@ -778,7 +859,8 @@ class SIYISDK:
             self._autoFocus_msg.success = bool(int('0x'+msg, base=16))
 
             
-            self._logger.debug("Auto focus success: %s", self._autoFocus_msg.success)
+            if self._log_debug:
+                self._logger.debug("Auto focus success: %s", self._autoFocus_msg.success)
 
             return True
         except Exception as e:
@@ -790,9 +872,11 @@ class SIYISDK:
         try:
             self._manualZoom_msg.seq=seq
             self._manualZoom_msg.level = int('0x'+msg[2:4]+msg[0:2], base=16) /10.
+            self._state_history.setZoom(self._manualZoom_msg.level)
 
             
-            self._logger.debug("Zoom level %s", self._manualZoom_msg.level)
+            if self._log_debug:
+                self._logger.debug("Zoom level %s", self._manualZoom_msg.level)
 
             return True
         except Exception as e:
@@ -806,7 +890,8 @@ class SIYISDK:
             self._manualFocus_msg.success = bool(int('0x'+msg, base=16))
 
             
-            self._logger.debug("Manual  focus success: %s", self._manualFocus_msg.success)
+            if self._log_debug:
+                self._logger.debug("Manual  focus success: %s", self._manualFocus_msg.success)
 
             return True
         except Exception as e:
@@ -820,7 +905,8 @@ class SIYISDK:
             self._gimbalSpeed_msg.success = bool(int('0x'+msg, base=16))
 
             
-            self._logger.debug("Gimbal speed success: %s", self._gimbalSpeed_msg.success)
+            if self._log_debug:
+                self._logger.debug("Gimbal speed success: %s", self._gimbalSpeed_msg.success)
 
             return True
         except Exception as e:
@@ -834,7 +920,8 @@ class SIYISDK:
             self._center_msg.success = bool(int('0x'+msg, base=16))
 
             
-            self._logger.debug("Gimbal center success: %s", self._center_msg.success)
+            if self._log_debug:
+                self._logger.debug("Gimbal center success: %s", self._center_msg.success)
 
             return True
         except Exception as e:
@@ -848,7 +935,8 @@ class SIYISDK:
             self._funcFeedback_msg.info_type = int('0x'+msg, base=16)
 
             
-            self._logger.debug("Function Feedback Code: %s", self._funcFeedback_msg.info_type)
+            if self._log_debug:
+                self._logger.debug("Function Feedback Code: %s", self._funcFeedback_msg.info_type)
 
             return True
         except Exception as e:
@@ -885,6 +973,7 @@ class SIYISDK:
             int_part = int('0x'+msg[0:2], base=16)
             float_part = int('0x'+msg[2:4], base=16)
             self._current_zoom_level_msg.level = int_part + (float_part/10)
+            self._state_history.setZoom(self._current_zoom_level_msg.level)
             return True
         except Exception as e:
             self._logger.error("Error %s", e)
@@ -926,6 +1015,26 @@ class SIYISDK:
     
     def getCurrentZoomLevel(self):
         return(self._current_zoom_level_msg.level)
+
+    def enableZoomPolling(self, enable=True):
+        """
+        Requests the current zoom level with every gimbal info request, for getCurrentZoomLevel() and the state
+        history. Off by default, so that users who do not read the zoom do not pay for the traffic.
+        Calls are counted: polling stops when every enableZoomPolling() is matched by an enableZoomPolling(False)
+
+        Params
+        --
+        - enable [bool]
+        """
+        with self._zoom_polling_lock:
+            self._zoom_polling = self._zoom_polling + 1 if enable else max(0, self._zoom_polling - 1)
+
+    def getStateHistory(self):
+        """
+        Returns the GimbalStateHistory of the received attitude samples, in time.monotonic() time.
+        history.at(frame.stamp) gives the gimbal state when a video frame arrived, see metadata.py
+        """
+        return self._state_history
     
     def getCenteringFeedback(self):
         return(self._center_msg.success)
@@ -933,9 +1042,45 @@ class SIYISDK:
     def getDataStreamFeedback(self):
         return(self._request_data_stream_msg.data_type)
 
+    def getStats(self):
+        """
+        Returns a snapshot of the traffic counters (see metrics.SIYIStats.snapshot()), or None if stats are disabled.
+        Use metrics.prometheusText() to export it.
+        """
+        stats = self._stats
+        if stats is None:
+            return None
+        return stats.snapshot()
+
     #################################################
     #                 Set functions                 #
     #################################################
+    def startCapture(self, path: str):
+        """
+        Starts recording all sent and received datagrams to a capture file. See capture.py
+
+        Params
+        --
+        - path [str] capture file, overwritten if it exists
+        """
+        self.stopCapture()
+        self._recorder = capture.PacketRecorder(path)
+
+    def stopCapture(self):
+        """
+        Stops recording, and closes the capture file
+        """
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    def enableStats(self, enable: bool):
+        """
+        Enables or disables the traffic counters. Enabling resets them.
+        """
+        self._stats = SIYIStats() if enable else None
+
     def setGimbalRotation(self, yaw, pitch, err_thresh=1.0, kp=4):
         """
         Sets gimbal attitude angles yaw and pitch in degrees
@@ -955,35 +1100,175 @@ class SIYISDK:
             self._logger.error("Desired yaw is outside controllable range -45~45")
             return
 
-        th = err_thresh
-        gain = kp
         while(True):
-            self.requestGimbalAttitude()
-            if self._att_msg.seq==self._last_att_seq:
-                self._logger.info("Did not get new attitude msg")
-                self.requestGimbalSpeed(0,0)
+            reached = self._rotationStep(yaw, pitch, err_thresh, kp)
+            if reached is None:
                 continue
+            if reached:
+                self._logger.info("Goal rotation is reached")
+                break
 
-            self._last_att_seq = self._att_msg.seq
+            sleep(0.1) # command frequency
 
-            yaw_err = -yaw + self._att_msg.yaw # NOTE for some reason it's reversed!!
-            pitch_err = pitch - self._att_msg.pitch
+    def _rotationStep(self, yaw, pitch, err_thresh, kp):
+        """
+        One iteration of the attitude controller of setGimbalRotation(): requests the attitude, and sends a speed
+        command proportional to the error
 
-            self._logger.debug("yaw_err= %s", yaw_err)
-            self._logger.debug("pitch_err= %s", pitch_err)
+        Returns
+        --
+        True when the target is reached, False otherwise, None if no new attitude was received
+        """
+        self.requestGimbalAttitude()
+        if self._att_msg.seq==self._last_att_seq:
+            self._logger.info("Did not get new attitude msg")
+            self.requestGimbalSpeed(0,0)
+            return None
 
-            if (abs(yaw_err) <= th and abs(pitch_err)<=th):
-                self.requestGimbalSpeed(0, 0)
-                self._logger.info("Goal rotation is reached")
-                break
+        self._last_att_seq = self._att_msg.seq
 
-            y_speed_sp = max(min(100, int(gain*yaw_err)), -100)
-            p_speed_sp = max(min(100, int(gain*pitch_err)), -100)
-            self._logger.debug("yaw speed setpoint= %s", y_speed_sp)
-            self._logger.debug("pitch speed setpoint= %s", p_speed_sp)
-            self.requestGimbalSpeed(y_speed_sp, p_speed_sp)
+        yaw_err = -yaw + self._att_msg.yaw # NOTE for some reason it's reversed!!
+        pitch_err = pitch - self._att_msg.pitch
 
-            sleep(0.1) # command frequency
+        log_debug = self._logger.isEnabledFor(logging.DEBUG)
+        if log_debug:
+            self._logger.debug("yaw_err= %s, pitch_err= %s", yaw_err, pitch_err)
+
+        if (abs(yaw_err) <= err_thresh and abs(pitch_err)<=err_thresh):
+            self.requestGimbalSpeed(0, 0)
+            return True
+
+        y_speed_sp = max(min(100, int(kp*yaw_err)), -100)
+        p_speed_sp = max(min(100, int(kp*pitch_err)), -100)
+        if log_debug:
+            self._logger.debug("yaw speed setpoint= %s, pitch speed setpoint= %s", y_speed_sp, p_speed_sp)
+        self.requestGimbalSpeed(y_speed_sp, p_speed_sp)
+        return False
+
+    def setGimbalRotationAsync(self, yaw, pitch, err_thresh=1.0, kp=4, timeout=None):
+        """
+        Non-blocking setGimbalRotation(). The gimbal is moved by a controller thread, and a new target replaces
+        the current one, so the latest call wins. Use it from GUIs and other event loops.
+
+        Params
+        --
+        yaw: [float] desired yaw in degrees
+        pitch: [float] desired pitch in degrees
+        err_thresh: [float] acceptable error threshold, in degrees, to stop correction
+        kp [float] proportional gain
+        timeout [float] seconds after which the rotation is abandoned. None: no limit
+
+        Returns
+        --
+        [concurrent.futures.Future] resolves to True when the target is reached, and to False if the target is
+        out of range, replaced by another one, cancelled with cancelRotation(), or timed out. The future is
+        already running, so Future.cancel() has no effect: use cancelRotation()
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        if (pitch >25 or pitch <-90):
+            self._logger.error("desired pitch is outside controllable range -90~25")
+            future.set_result(False)
+            return future
+
+        if (yaw >45 or yaw <-45):
+            self._logger.error("Desired yaw is outside controllable range -45~45")
+            future.set_result(False)
+            return future
+
+        deadline = time() + timeout if timeout is not None else None
+        with self._rotation_cond:
+            if self._rotation_target is not None:
+                self._rotation_target[-1].set_result(False)
+            self._rotation_target = (yaw, pitch, err_thresh, kp, deadline, future)
+            if self._rotation_thread is None or not self._rotation_thread.is_alive():
+                self._rotation_thread = threading.Thread(target=self.rotationLoop, daemon=True)
+                self._rotation_thread.start()
+            self._rotation_cond.notify_all()
+        return future
+
+    def cancelRotation(self, wait=False, timeout=1.0):
+        """
+        Stops the rotation started by setGimbalRotationAsync(), if any. Its future resolves to False.
+        The stop command is sent by the controller thread, after the speed command of its current step
+
+        Params
+        --
+        - wait [bool] return only once the controller sent its stop command, so that a following speed command
+          is not overridden by it
+        - timeout [float] maximum wait in seconds
+        """
+        with self._rotation_cond:
+            target = self._rotation_target
+            self._rotation_target = None
+            self._rotation_cond.notify_all()
+        if target is not None:
+            target[-1].set_result(False)
+        if wait and threading.current_thread() is not self._rotation_thread:
+            with self._rotation_cond:
+                self._rotation_cond.wait_for(lambda: self._stop or not self._rotation_busy, timeout)
+
+    def isRotating(self):
+        """
+        Returns True while a rotation started by setGimbalRotationAsync() is in progress
+        """
+        return self._rotation_target is not None
+
+    def _setRotationBusy(self, busy):
+        with self._rotation_cond:
+            self._rotation_busy = busy
+            self._rotation_cond.notify_all()
+
+    def rotationLoop(self):
+        """
+        Moves the gimbal towards the target of setGimbalRotationAsync(), at the setGimbalRotation() command rate.
+        All the speed commands of the controller, including the final stop, are sent from this thread, so that a
+        stop can not be overtaken by the speed command of a step in progress
+        """
+        while not self._stop:
+            with self._rotation_cond:
+                self._rotation_cond.wait_for(
+                    lambda: self._stop or self._rotation_busy or self._rotation_target is not None)
+                if self._stop:
+                    break
+                target = self._rotation_target
+                if target is not None:
+                    self._rotation_busy = True
+            if target is None:
+                # Cancelled. The speed command is persistent, so the gimbal moves until it is stopped
+                self.requestGimbalSpeed(0, 0)
+                self._setRotationBusy(False)
+                continue
+            yaw, pitch, err_thresh, kp, deadline, future = target
+            if deadline is not None and time() > deadline:
+                self._logger.warning("Rotation to (%s, %s) timed out", yaw, pitch)
+                reached = False
+            else:
+                try:
+                    reached = self._rotationStep(yaw, pitch, err_thresh, kp)
+                except Exception as e:
+                    self._logger.error("Error in rotation loop: %s", e)
+                    reached = False
+                if reached is None:
+                    # Wait for the next attitude message
+                    sleep(0.02)
+                    continue
+                if not reached:
+                    with self._rotation_cond:
+                        self._rotation_cond.wait_for(lambda: self._stop or self._rotation_target is not target, 0.1)
+                    continue
+                self._logger.info("Goal rotation is reached")
+            if not reached:
+                self.requestGimbalSpeed(0, 0)
+            with self._rotation_cond:
+                self._rotation_busy = False
+                if self._rotation_target is target:
+                    self._rotation_target = None
+                    future.set_result(reached)
+                self._rotation_cond.notify_all()
+        if self._rotation_busy and self._connected:
+            self.requestGimbalSpeed(0, 0)
+        self._setRotationBusy(False)
 
 def test():
     cam=SIYISDK(debug=False)
@@ -1018,4 +1303,6 @@ def test():
     cam.disconnect()
 
 if __name__=="__main__":
+    LOG_FORMAT = ' [%(levelname)s] %(asctime)s [%(name)s::%(funcName)s] :\t%(message)s'
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
     test()
\ No newline at end of file
@@ -0,0 +1,2273 @@
+#!/bin/env/python3
+"""
+RTSP client for getting video stream from SIYI cameras, e.g. ZR10, A8 Mini
+ZR10 webpage: http://en.siyi.biz/en/Gimbal%20Camera/ZR10/overview/
+A8 mini page: https://shop.siyi.biz/products/siyi-a8-mini?VariantsId=10611
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2022
+
+Required:
+- OpenCV
+    (sudo apt-get install python3-opencv -y)
+- imutils
+    pip install imutils
+- Gstreamer (https://gstreamer.freedesktop.org/documentation/installing/index.html?gi-language=c)
+    (Ubuntu: sudo apt-get install libgstreamer1.0-dev libgstreamer-plugins-base1.0-dev libgstreamer-plugins-bad1.0-dev gstreamer1.0-plugins-base gstreamer1.0-plugins-good gstreamer1.0-plugins-bad gstreamer1.0-plugins-ugly gstreamer1.0-libav gstreamer1.0-doc gstreamer1.0-tools gstreamer1.0-x gstreamer1.0-alsa gstreamer1.0-gl gstreamer1.0-gtk3 gstreamer1.0-qt5 gstreamer1.0-pulseaudio -y)
+- Deepstream (only for Nvidia Jetson boards)
+    (https://docs.nvidia.com/metropolis/deepstream/dev-guide/text/DS_Quickstart.html#jetson-setup)
+- For RTMP streaming
+    sudo apt install ffmpeg -y
+    pip install ffmpeg-python
+
+OpenCV and numpy are imported when a capture backend or an RTMPSender first needs them, so importing this module
+stays cheap for the applications that only use part of it.
+"""
+import logging
+from time import time, sleep, monotonic, mktime, strptime
+import threading
+import platform
+import collections
+import subprocess
+import select
+import os
+import bisect
+
+class VideoFrame:
+    '''
+    Decoded image frame, as delivered by SIYIRTSP
+    '''
+    def __init__(self, seq, image, stamp=None, pts=None, decode_time=0.0) -> None:
+        '''
+        Params
+        --
+        - seq [int] Frame sequence number, starts at 1 and increments for every decoded frame
+        - image [numpy array] BGR image
+        - stamp [float] Arrival time, time.monotonic() when the frame was grabbed from the stream.
+          Use it to join frames with other data, e.g. the gimbal attitude
+        - pts [float] Stream presentation timestamp in milliseconds, None if the backend does not provide it
+        - decode_time [float] Seconds spent retrieving the image after the frame was grabbed
+        '''
+        self.seq = seq
+        self.image = image
+        self.stamp = monotonic() if stamp is None else stamp
+        self.pts = pts
+        self.decode_time = decode_time
+
+class StreamStats:
+    '''
+    Rolling statistics of the frames received by SIYIRTSP, over the last `window` frames
+    '''
+    def __init__(self, window=100) -> None:
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._stamps = collections.deque(maxlen=window)
+        self._decode_times = collections.deque(maxlen=window)
+        # Transit time (arrival time - pts), relative to an unknown clock offset
+        self._transits = collections.deque(maxlen=window)
+        self._min_transit = None
+        # Inter-frame interval and jitter (RFC 3550 estimator)
+        self._interval = None
+        self._jitter = 0.0
+
+    def onFrame(self, frame):
+        with self._lock:
+            self._frames += 1
+            if self._stamps:
+                interval = frame.stamp - self._stamps[-1]
+                if self._interval is not None:
+                    self._jitter += (abs(interval - self._interval) - self._jitter) / 16.
+                self._interval = interval
+            self._stamps.append(frame.stamp)
+            self._decode_times.append(frame.decode_time)
+            if frame.pts is not None:
+                transit = frame.stamp - frame.pts / 1000.
+                self._transits.append(transit)
+                if self._min_transit is None or transit < self._min_transit:
+                    self._min_transit = transit
+
+    def reset(self):
+        '''
+        Forgets the transit times, e.g. when the stream restarts with new timestamps
+        '''
+        with self._lock:
+            self._transits.clear()
+            self._min_transit = None
+            self._stamps.clear()
+            self._interval = None
+
+    def snapshot(self):
+        '''
+        Returns a dictionary with
+        - frames: number of received frames
+        - fps: frame rate over the window
+        - interval_s, jitter_s: last inter-frame interval and its jitter
+        - decode_time_s: mean and max time spent retrieving images
+        - latency_s: estimated latency, added on top of the fastest frame seen so far. The stream clock is not
+          synchronized with ours, so the fixed part (encoder, network) can not be observed: this measures
+          the queuing and network delay variation, plus the decode time. None if the stream has no PTS
+        '''
+        with self._lock:
+            n = len(self._stamps)
+            fps = (n - 1) / (self._stamps[-1] - self._stamps[0]) if n > 1 and self._stamps[-1] > self._stamps[0] else None
+            decode = list(self._decode_times)
+            latency = None
+            if self._transits:
+                latency = {
+                    "mean": sum(self._transits) / len(self._transits) - self._min_transit,
+                    "max": max(self._transits) - self._min_transit,
+                    "last": self._transits[-1] - self._min_transit,
+                }
+            return {
+                "frames": self._frames,
+                "fps": fps,
+                "interval_s": self._interval,
+                "jitter_s": self._jitter,
+                "decode_time_s": {
+                    "mean": sum(decode) / len(decode) if decode else None,
+                    "max": max(decode) if decode else None,
+                },
+                "latency_s": latency,
+            }
+
+class FrameQueue:
+    '''
+    Bounded queue of VideoFrame, between the SIYIRTSP receiving thread and one consumer.
+    Memory is bounded by maxsize times the frame size.
+    '''
+    # Policies applied when the queue is full
+    DROP_OLDEST = 'drop_oldest'   # keep the newest frames, e.g. for tracking
+    DROP_NEWEST = 'drop_newest'   # keep the queued frames, discard the new one
+    BLOCK = 'block'               # wait for the consumer, e.g. for recording every frame
+
+    def __init__(self, maxsize=1, policy=DROP_OLDEST, block_timeout=None) -> None:
+        '''
+        Params
+        --
+        - maxsize [int] Maximum number of queued frames
+        - policy [str] DROP_OLDEST, DROP_NEWEST or BLOCK
+        - block_timeout [float] With BLOCK, maximum time in seconds to wait for space, then the new frame is dropped.
+          None waits forever. Note that a blocked put() also delays the other consumers of the stream.
+        '''
+        if policy not in (self.DROP_OLDEST, self.DROP_NEWEST, self.BLOCK):
+            raise ValueError("Unknown policy {}".format(policy))
+        self._maxsize = max(1, int(maxsize))
+        self._policy = policy
+        self._block_timeout = block_timeout
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._dropped = 0
+        self._closed = False
+
+    def put(self, frame) -> bool:
+        '''
+        Adds a frame, applying the queue policy if it is full
+
+        Returns
+        --
+        True if the frame was queued. False if it was dropped
+        '''
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._queue) >= self._maxsize:
+                if self._policy == self.DROP_OLDEST:
+                    self._queue.popleft()
+                    self._dropped += 1
+                elif self._policy == self.DROP_NEWEST:
+                    self._dropped += 1
+                    return False
+                else:
+                    if not self._cond.wait_for(lambda: self._closed or len(self._queue) < self._maxsize, self._block_timeout) \
+                            or self._closed:
+                        self._dropped += 1
+                        return False
+            self._queue.append(frame)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        '''
+        Removes and returns the oldest frame, waiting up to timeout seconds for one
+
+        Returns
+        --
+        [VideoFrame] or None on timeout, or if the queue is closed and empty
+        '''
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._closed or self._queue, timeout) or not self._queue:
+                return None
+            frame = self._queue.popleft()
+            self._cond.notify_all()
+            return frame
+
+    def __iter__(self):
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+    def qsize(self):
+        return len(self._queue)
+
+    def getDroppedCount(self):
+        '''
+        Number of frames dropped because the queue was full
+        '''
+        return self._dropped
+
+    def close(self):
+        '''
+        Wakes up blocked put() and get(). Queued frames can still be read
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def isClosed(self):
+        return self._closed
+
+class FramePool:
+    '''
+    Ring of preallocated image buffers that the decoder writes into, so streaming allocates nothing per frame.
+    The first `size` decoded images become the pool, then they are reused in order:
+    an image stays valid until `size` more frames are decoded.
+    '''
+    def __init__(self, size) -> None:
+        '''
+        Params
+        --
+        - size [int] number of buffers. Must be larger than the number of frames held by consumers at any time
+          (queued frames included), plus one being decoded
+        '''
+        self._size = size
+        self._buffers = []
+        self._i = 0
+
+    def getSize(self):
+        return self._size
+
+    def next(self):
+        '''
+        Returns the buffer to decode the next frame into, or None while the pool is being filled
+        '''
+        if len(self._buffers) < self._size:
+            return None
+        buf = self._buffers[self._i]
+        self._i = (self._i + 1) % self._size
+        return buf
+
+    def adopt(self, image, buf):
+        '''
+        Takes ownership of a decoded image
+
+        Params
+        --
+        - image [numpy array] decoded image
+        - buf [numpy array] buffer returned by next() for this frame
+        '''
+        if image is buf:
+            return
+        if buf is None:
+            self._buffers.append(image)
+        else:
+            # Decoder allocated a new image, e.g. the resolution changed. Start over
+            self._buffers = [image]
+            self._i = 0
+
+class FrameBatch:
+    '''
+    Batch of frames returned by FrameBatcher.get(). The arrays are views of the batcher's buffers,
+    valid until the next call to get()
+    '''
+    def __init__(self, images, seq, stamp, pts) -> None:
+        '''
+        Params
+        --
+        - images [numpy array] (n, height, width, channels) uint8 images, contiguous
+        - seq [numpy array] (n,) int64 frame sequence numbers
+        - stamp [numpy array] (n,) float64 arrival times, time.monotonic()
+        - pts [numpy array] (n,) float64 presentation timestamps in milliseconds, NaN if unknown
+        '''
+        self.images = images
+        self.seq = seq
+        self.stamp = stamp
+        self.pts = pts
+
+    def __len__(self):
+        return len(self.seq)
+
+class _BatchBuffer:
+    def __init__(self, np, batch_size, shape) -> None:
+        self.images = np.empty((batch_size,) + shape, dtype=np.uint8)
+        self.seq = np.zeros(batch_size, dtype=np.int64)
+        self.stamp = np.zeros(batch_size, dtype=np.float64)
+        self.pts = np.zeros(batch_size, dtype=np.float64)
+        self.shape = shape
+        self.n = 0
+        self.t0 = 0.0
+
+    def batch(self):
+        n = self.n
+        return FrameBatch(self.images[:n], self.seq[:n], self.stamp[:n], self.pts[:n])
+
+class FrameBatcher:
+    '''
+    Collects the frames of SIYIRTSP into preallocated (batch_size, height, width, channels) arrays,
+    e.g. for a detector that runs on batches. Create it with SIYIRTSP.createBatcher().
+    Each image is copied once into its batch, from the receiving thread, so no stacking is needed afterwards.
+    A batch is complete with batch_size frames, or max_wait seconds after its first frame.
+    If the consumer falls behind, the oldest complete batches are dropped.
+    '''
+    def __init__(self, batch_size=8, max_wait=0.1, n_buffers=3) -> None:
+        '''
+        Params
+        --
+        - batch_size [int] maximum number of frames per batch
+        - max_wait [float] seconds after the first frame of a batch before get() returns it incomplete. None waits
+          for batch_size frames
+        - n_buffers [int] number of preallocated batches: one returned to the consumer, one being filled,
+          and the others queued. At least 2
+        '''
+        import numpy as np
+        self._np = np
+        self._batch_size = max(1, int(batch_size))
+        self._max_wait = max_wait
+        self._n_buffers = max(2, int(n_buffers))
+        self._cond = threading.Condition()
+        self._free = []
+        self._allocated = 0
+        self._shape = None
+        self._filling = None
+        self._ready = collections.deque()
+        self._held = None
+        self._dropped = 0
+        self._closed = False
+
+    def _newBuffer(self):
+        # Called with the lock held. Returns a free buffer, or recycles the oldest complete batch
+        if self._free:
+            return self._free.pop()
+        if self._allocated < self._n_buffers:
+            self._allocated += 1
+            return _BatchBuffer(self._np, self._batch_size, self._shape)
+        buf = self._ready.popleft()
+        self._dropped += buf.n
+        if buf.shape != self._shape:
+            buf = _BatchBuffer(self._np, self._batch_size, self._shape)
+        return buf
+
+    def put(self, frame) -> bool:
+        '''
+        Copies a VideoFrame into the batch being filled. Called by SIYIRTSP for every new frame
+
+        Returns
+        --
+        False if the batcher is closed
+        '''
+        image = frame.image
+        with self._cond:
+            if self._closed:
+                return False
+            if image.shape != self._shape:
+                # New resolution. Finish the current batch, and allocate new buffers
+                if self._filling is not None and self._filling.n:
+                    self._ready.append(self._filling)
+                self._filling = None
+                self._shape = image.shape
+                self._free = []
+                self._allocated = len(self._ready) + (self._held is not None)
+            buf = self._filling
+            if buf is None:
+                buf = self._filling = self._newBuffer()
+                buf.n = 0
+                buf.t0 = monotonic()
+            i = buf.n
+            self._np.copyto(buf.images[i], image)
+            buf.seq[i] = frame.seq
+            buf.stamp[i] = frame.stamp
+            buf.pts[i] = frame.pts if frame.pts is not None else float('nan')
+            buf.n = i + 1
+            if buf.n == self._batch_size:
+                self._ready.append(buf)
+                self._filling = None
+            self._cond.notify_all()
+            return True
+
+    def _takeReady(self):
+        if self._ready:
+            return self._ready.popleft()
+        buf = self._filling
+        if buf is not None and buf.n and (self._closed or
+                                          (self._max_wait is not None and monotonic() - buf.t0 >= self._max_wait)):
+            self._filling = None
+            return buf
+        return None
+
+    def get(self, timeout=None):
+        '''
+        Returns the next batch, waiting up to timeout seconds for it. The previous batch returned by get() is
+        reused afterwards, so copy what must outlive the next call
+
+        Returns
+        --
+        [FrameBatch] or None on timeout, or if the batcher is closed and empty
+        '''
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            if self._held is not None:
+                if self._held.shape == self._shape:
+                    self._free.append(self._held)
+                else:
+                    self._allocated -= 1
+                self._held = None
+            while True:
+                buf = self._takeReady()
+                if buf is not None:
+                    self._held = buf
+                    return buf.batch()
+                if self._closed:
+                    return None
+                wait = None if deadline is None else deadline - monotonic()
+                if self._filling is not None and self._filling.n and self._max_wait is not None:
+                    until_full = self._filling.t0 + self._max_wait - monotonic()
+                    wait = until_full if wait is None else min(wait, until_full)
+                if wait is not None and wait <= 0:
+                    if deadline is not None and monotonic() >= deadline:
+                        return None
+                    continue
+                self._cond.wait(wait)
+
+    def __iter__(self):
+        while True:
+            batch = self.get()
+            if batch is None:
+                return
+            yield batch
+
+    def getDroppedCount(self):
+        '''
+        Number of frames dropped because the consumer fell behind
+        '''
+        return self._dropped
+
+    def close(self):
+        '''
+        Wakes up a blocked get(). The queued batches, and the incomplete one, can still be read
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def isClosed(self):
+        return self._closed
+
+def _url_with_transport(rtsp_url, use_udp):
+    '''
+    Appends ?rtsp_transport=udp to an RTSP url, for FFmpeg
+    '''
+    if use_udp and "rtsp_transport" not in rtsp_url:
+        if '?' in rtsp_url:
+            return f"{rtsp_url}&rtsp_transport=udp"
+        return f"{rtsp_url}?rtsp_transport=udp"
+    return rtsp_url
+
+class CaptureBackend:
+    '''
+    Base class of the SIYIRTSP capture backends.
+    A backend opens the RTSP stream and returns decoded BGR images.
+    '''
+    # True if the backend can crop and scale in its decoding pipeline, and accepts the decimation options
+    SUPPORTS_FILTERS = False
+    # Decimation options applied by the backend itself. SIYIRTSP applies the others by skipping grabbed frames
+    NATIVE_DECIMATION = ()
+
+    def __init__(self, rtsp_url, use_udp=True, output_size=None, crop=None,
+                 frame_step=1, max_fps=None, keyframes_only=False) -> None:
+        '''
+        Params
+        --
+        - rtsp_url [str] RTSP url, without transport options
+        - use_udp [bool] use UDP instead of TCP for RTSP transport
+        - output_size [tuple] (width, height) of the delivered images, scaled by the decoding pipeline. None keeps the size
+        - crop [tuple] (left, top, right, bottom) pixels removed from each side of the decoded image, before scaling
+        - frame_step [int] deliver every frame_step-th frame
+        - max_fps [float] maximum delivered frame rate. None for no limit
+        - keyframes_only [bool] decode only the key frames
+        '''
+        self._rtsp_url = rtsp_url
+        self._use_udp = use_udp
+        self._output_size = tuple(output_size) if output_size else None
+        self._crop = tuple(crop) if crop else None
+        self._frame_step = frame_step
+        self._max_fps = max_fps
+        self._keyframes_only = keyframes_only
+        self._decode_threads = 0
+        self._cap = None
+
+    def setDecodeThreads(self, n):
+        '''
+        Limits the number of decoder threads, applied by open(). 0 lets the decoder choose, usually one per core
+        '''
+        self._decode_threads = n
+
+    def describe(self):
+        '''
+        Returns a description of the source, for logging
+        '''
+        return self._rtsp_url
+
+    def open(self) -> bool:
+        '''
+        Opens the stream. Returns True on success
+        '''
+        raise NotImplementedError
+
+    def grab(self) -> bool:
+        '''
+        Waits for the next frame. Returns False if there is none
+        '''
+        return self._cap.grab()
+
+    def retrieve(self, image=None):
+        '''
+        Returns the grabbed frame as an image
+
+        Params
+        --
+        - image [numpy array] buffer to decode into, reused if it has the right size. None allocates a new image
+
+        Returns
+        --
+        (ret, image) as cv2.VideoCapture.retrieve()
+        '''
+        return self._cap.retrieve(image)
+
+    def read(self, image=None):
+        '''
+        grab() and retrieve()
+        '''
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def getPTS(self):
+        '''
+        Returns the presentation timestamp, in milliseconds, of the last grabbed frame, or None if unknown
+        '''
+        import cv2
+        pts = self._cap.get(cv2.CAP_PROP_POS_MSEC)
+        return pts if pts > 0 else None
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def hasFrames(self):
+        '''
+        False for backends that only run a process without delivering frames, e.g. a relay or a recorder
+        '''
+        return True
+
+    def isAlive(self):
+        '''
+        For backends without frames, returns False when the process has stopped
+        '''
+        return True
+
+    def getReturnCode(self):
+        return None
+
+class FFmpegBackend(CaptureBackend):
+    '''
+    OpenCV VideoCapture with the FFmpeg backend
+    '''
+    def describe(self):
+        return _url_with_transport(self._rtsp_url, self._use_udp)
+
+    # Open and read timeouts, so a lost camera is detected and reconnected quickly (OpenCV >= 4.6)
+    TIMEOUT_MS = 2000
+
+    def open(self) -> bool:
+        import cv2
+        params = []
+        if hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC'):
+            params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, self.TIMEOUT_MS, cv2.CAP_PROP_READ_TIMEOUT_MSEC, self.TIMEOUT_MS]
+        if self._decode_threads and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+            params += [cv2.CAP_PROP_N_THREADS, self._decode_threads]
+        self._cap = cv2.VideoCapture(self.describe(), cv2.CAP_FFMPEG, params)
+        # Reduce buffer size for lower latency
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return self._cap.isOpened()
+
+class FFmpegPipeBackend(CaptureBackend):
+    '''
+    Decodes with an ffmpeg process, whose filter graph crops and scales the images before they are sent to Python
+    as raw BGR frames through a pipe. SIYIRTSP uses it for the 'ffmpeg' backend when output_size or crop is set,
+    because OpenCV's FFmpeg backend can not apply filters. Requires numpy and the ffmpeg command.
+    The stream PTS is not available.
+    '''
+    SUPPORTS_FILTERS = True
+    NATIVE_DECIMATION = ('frame_step', 'max_fps', 'keyframes_only')
+
+    def __init__(self, rtsp_url, use_udp=True, output_size=None, crop=None,
+                 frame_step=1, max_fps=None, keyframes_only=False) -> None:
+        super().__init__(rtsp_url, use_udp, output_size, crop, frame_step, max_fps, keyframes_only)
+        self._p = None
+        self._shape = None
+
+    def filters(self):
+        '''
+        Returns the ffmpeg video filter graph. Frames are selected first, so the dropped ones are not scaled
+        '''
+        f = []
+        if self._frame_step > 1:
+            f.append("framestep={}".format(self._frame_step))
+        if self._max_fps:
+            f.append("select=isnan(prev_selected_t)+gte(t-prev_selected_t\\,{})".format(1. / self._max_fps))
+        if self._crop:
+            left, top, right, bottom = self._crop
+            f.append("crop=iw-{}:ih-{}:{}:{}".format(left + right, top + bottom, left, top))
+        if self._output_size:
+            f.append("scale={}:{}".format(*self._output_size))
+        return ",".join(f)
+
+    def inputArgs(self):
+        '''
+        Returns the ffmpeg arguments up to the RTSP input
+        '''
+        cmd = ["ffmpeg", "-loglevel", "error", "-nostdin",
+               "-rtsp_transport", "udp" if self._use_udp else "tcp",
+               "-fflags", "nobuffer", "-flags", "low_delay"]
+        if self._keyframes_only:
+            # The decoder discards the other frames without decoding them
+            cmd += ["-skip_frame", "nokey"]
+        if self._decode_threads:
+            cmd += ["-threads", str(self._decode_threads)]
+        return cmd + ["-i", self._rtsp_url]
+
+    def framesOutputArgs(self):
+        '''
+        Returns the ffmpeg arguments of the raw frames output to the pipe
+        '''
+        cmd = ["-an"]
+        if self.filters():
+            cmd += ["-vf", self.filters()]
+        # Deliver the decoded frames as they are, without duplicating frames to a constant rate
+        return cmd + ["-vsync", "passthrough", "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+
+    def command(self):
+        '''
+        Returns the ffmpeg command line
+        '''
+        return self.inputArgs() + self.framesOutputArgs()
+
+    def _probeSize(self):
+        '''
+        Returns the (width, height) of the stream, with ffprobe
+        '''
+        out = subprocess.run(["ffprobe", "-v", "error", "-rtsp_transport", "udp" if self._use_udp else "tcp",
+                              "-select_streams", "v:0", "-show_entries", "stream=width,height", "-of", "csv=p=0",
+                              self._rtsp_url], capture_output=True, text=True, timeout=10).stdout
+        w, h = out.strip().split(',')[:2]
+        return int(w), int(h)
+
+    def open(self) -> bool:
+        if self._output_size:
+            width, height = self._output_size
+        else:
+            try:
+                width, height = self._probeSize()
+            except Exception:
+                return False
+            if self._crop:
+                width -= self._crop[0] + self._crop[2]
+                height -= self._crop[1] + self._crop[3]
+        self._shape = (height, width, 3)
+        try:
+            self._p = subprocess.Popen(self.command(), stdout=subprocess.PIPE, bufsize=0)
+        except OSError:
+            return False
+        return True
+
+    def grab(self) -> bool:
+        # Wait for the next frame, with a timeout so SIYIRTSP can detect a dead stream
+        ready, _, _ = select.select([self._p.stdout], [], [], 0.5)
+        return bool(ready) and self._p.poll() is None
+
+    def retrieve(self, image=None):
+        import numpy as np
+        if image is None or image.shape != self._shape:
+            image = np.empty(self._shape, dtype=np.uint8)
+        # Read the frame directly into the image memory
+        view = memoryview(image).cast('B')
+        n = 0
+        while n < len(view):
+            k = self._p.stdout.readinto(view[n:])
+            if not k:
+                return False, None
+            n += k
+        return True, image
+
+    def getPTS(self):
+        return None
+
+    def isAlive(self):
+        return self._p is not None and self._p.poll() is None
+
+    def getReturnCode(self):
+        return self._p.poll() if self._p is not None else None
+
+    def release(self):
+        if self._p is not None:
+            self._p.kill()
+            self._p.wait()
+            self._p = None
+
+class FFmpegRelayBackend(FFmpegPipeBackend):
+    '''
+    ffmpeg process that remuxes the RTSP H.264 stream to RTMP without decoding it (-c copy).
+    With tee, the same process also decodes the stream and sends raw frames to Python, as FFmpegPipeBackend.
+    Used by RTSPRelay
+    '''
+    def __init__(self, rtsp_url, use_udp=True, rtmp_url="rtmp://127.0.0.1:1935/live/webcam", tee=False,
+                 output_size=None, crop=None, frame_step=1, max_fps=None, keyframes_only=False) -> None:
+        super().__init__(rtsp_url, use_udp, output_size, crop, frame_step, max_fps, keyframes_only)
+        self._rtmp_url = rtmp_url
+        self._tee = tee
+
+    def describe(self):
+        return "{} -> {}".format(self._rtsp_url, self._rtmp_url)
+
+    def command(self):
+        cmd = self.inputArgs() + ["-map", "0:v", "-c:v", "copy", "-an", "-f", "flv", self._rtmp_url]
+        if self._tee:
+            cmd += ["-map", "0:v"] + self.framesOutputArgs()
+        return cmd
+
+    def open(self) -> bool:
+        if self._tee:
+            return super().open()
+        try:
+            self._p = subprocess.Popen(self.command(), stdout=subprocess.DEVNULL)
+        except OSError:
+            return False
+        return True
+
+    def hasFrames(self):
+        return self._tee
+
+class FFmpegSegmentBackend(FFmpegPipeBackend):
+    '''
+    ffmpeg process that writes the RTSP stream to segment files without decoding it (-c copy).
+    Completed segments are reported to on_segment(filename, start, end), from the segment list that ffmpeg
+    writes to its stdout. Used by SegmentRecorder
+    '''
+    # Container: ffmpeg muxer
+    FORMATS = {'mkv': 'matroska', 'mp4': 'mp4', 'ts': 'mpegts'}
+
+    def __init__(self, rtsp_url, use_udp=True, pattern="seg_%Y%m%d-%H%M%S.mkv", segment_time=60, fmt='mkv',
+                 on_segment=None) -> None:
+        super().__init__(rtsp_url, use_udp)
+        if fmt not in self.FORMATS:
+            raise ValueError("Unknown format {}. Use one of {}".format(fmt, list(self.FORMATS.keys())))
+        self._pattern = pattern
+        self._segment_time = segment_time
+        self._fmt = fmt
+        self._on_segment = on_segment
+        self._reader = None
+
+    def describe(self):
+        return "{} -> {}".format(self._rtsp_url, self._pattern)
+
+    def command(self):
+        return self.inputArgs() + [
+            "-map", "0:v", "-c:v", "copy", "-an",
+            "-f", "segment", "-segment_time", str(self._segment_time), "-segment_format", self.FORMATS[self._fmt],
+            "-reset_timestamps", "1", "-strftime", "1",
+            "-segment_list", "pipe:1", "-segment_list_type", "csv",
+            self._pattern]
+
+    def open(self) -> bool:
+        try:
+            self._p = subprocess.Popen(self.command(), stdout=subprocess.PIPE, text=True, bufsize=1)
+        except OSError:
+            return False
+        self._reader = threading.Thread(target=self.readSegments, args=(self._p.stdout,), daemon=True)
+        self._reader.start()
+        return True
+
+    def readSegments(self, f):
+        for line in f:
+            try:
+                name, start, end = line.strip().rsplit(',', 2)
+                start, end = float(start), float(end)
+            except ValueError:
+                continue
+            if self._on_segment is not None:
+                self._on_segment(name, start, end)
+
+    def hasFrames(self):
+        return False
+
+class GStreamerBackend(CaptureBackend):
+    '''
+    OpenCV VideoCapture with a GStreamer appsink pipeline, like src/rtsp_gstreamer.cpp.
+    Requires OpenCV built with GStreamer support.
+    '''
+    SUPPORTS_FILTERS = True
+    NATIVE_DECIMATION = ('keyframes_only',)
+
+    # Decoder elements
+    DECODERS = {
+        'avdec': 'avdec_h264',
+        'v4l2': 'v4l2h264dec',
+        'nvv4l2': 'nvv4l2decoder',
+    }
+
+    def __init__(self, rtsp_url, use_udp=True, decoder='avdec', output_size=None, crop=None,
+                 frame_step=1, max_fps=None, keyframes_only=False) -> None:
+        '''
+        Params
+        --
+        - decoder [str] 'avdec' (software), 'v4l2' (V4L2 hardware decoder, e.g. Raspberry Pi) or 'nvv4l2' (Nvidia Jetson)
+        - keyframes_only [bool] drops the other frames before the decoder. Requires GStreamer >= 1.20
+        '''
+        super().__init__(rtsp_url, use_udp, output_size, crop, frame_step, max_fps, keyframes_only)
+        if decoder not in self.DECODERS:
+            raise ValueError("Unknown decoder {}. Use one of {}".format(decoder, list(self.DECODERS.keys())))
+        self._decoder = decoder
+
+    def _decodeChain(self):
+        '''
+        Returns the elements from the decoder to the conversion to BGR. Cropping and scaling are done before
+        the conversion, so it runs on the smaller image
+        '''
+        chain = [self.DECODERS[self._decoder]]
+        if self._decode_threads and self._decoder == 'avdec':
+            chain[0] += " max-threads={}".format(self._decode_threads)
+        if self._keyframes_only:
+            chain.insert(0, "identity drop-buffer-flags=delta-unit")
+        size = ",width={},height={}".format(*self._output_size) if self._output_size else ""
+        if self._decoder == 'nvv4l2' and not self._crop:
+            # nvvidconv scales in hardware
+            chain += ["nvvidconv", "video/x-raw,format=BGRx" + size]
+        else:
+            if self._decoder == 'nvv4l2':
+                chain += ["nvvidconv", "video/x-raw,format=BGRx"]
+            if self._crop:
+                chain.append("videocrop left={} top={} right={} bottom={}".format(*self._crop))
+            if size:
+                chain += ["videoscale", "video/x-raw" + size]
+        chain.append("videoconvert")
+        return " ! ".join(chain)
+
+    def describe(self):
+        '''
+        Returns the GStreamer pipeline
+        '''
+        return ("rtspsrc location={} latency=0 protocols={} ! rtph264depay ! h264parse ! {} "
+                "! video/x-raw,format=BGR ! appsink drop=true max-buffers=1 sync=false").format(
+                    self._rtsp_url, "udp" if self._use_udp else "tcp", self._decodeChain())
+
+    def open(self) -> bool:
+        import cv2
+        self._cap = cv2.VideoCapture(self.describe(), cv2.CAP_GSTREAMER)
+        return self._cap.isOpened()
+
+class SIYIRTSP:
+    # Capture backends, selected by name
+    BACKENDS = {'ffmpeg': FFmpegBackend, 'ffmpeg-pipe': FFmpegPipeBackend, 'gstreamer': GStreamerBackend}
+
+    def __init__(self, rtsp_url="rtsp://192.168.144.25:8554/main.264", cam_name="ZR10", debug=False, use_udp=True,
+                 backend='ffmpeg', decoder='avdec', pool_size=0, output_size=None, crop=None,
+                 frame_step=1, max_fps=None, keyframes_only=False, connection_timeout=2.0, max_backoff=1.0,
+                 decode_threads=0) -> None:
+        '''
+        Receives video stream from SIYI cameras.
+        A background thread connects to the camera, and reconnects whenever no frame arrives for connection_timeout
+        seconds, until close(). Frames, queues and callbacks keep working across reconnects.
+
+        Params
+        --
+        - rtsp_url [str] RTSP url
+        - cam_name [str] camera name (optional)
+        - debug [bool] print debug messages
+        - use_udp [bool] use UDP instead of TCP for RTSP transport
+        - backend [str] capture backend, 'ffmpeg' or 'gstreamer' (lower latency). A CaptureBackend subclass is also accepted
+        - decoder [str] GStreamer decoder: 'avdec', 'v4l2' or 'nvv4l2'. See GStreamerBackend
+        - pool_size [int] decode into a FramePool of this many recycled buffers, instead of allocating every frame.
+          0 disables it. Frames are then overwritten after pool_size newer frames, so it must be larger than
+          the deepest consumer queue plus the frames a consumer holds
+        - output_size [tuple] (width, height) of the delivered images. They are scaled in the decoding pipeline,
+          e.g. (640, 480) to reduce the CPU use of the conversion and of the consumers
+        - crop [tuple] (left, top, right, bottom) pixels removed from each side of the decoded image, before scaling.
+          With the 'ffmpeg' backend, output_size and crop switch to FFmpegPipeBackend
+        - frame_step [int] deliver only every frame_step-th frame
+        - max_fps [float] maximum delivered frame rate, e.g. 1 for a snapshot per second. None for no limit
+        - keyframes_only [bool] decode and deliver only the key frames. The other frames are not decoded at all,
+          so the CPU use scales with the key frame rate. With the 'ffmpeg' backend, this switches to FFmpegPipeBackend.
+          H.264 frames depend on the previous ones, so frame_step and max_fps still decode every frame, but skip the
+          conversion of the dropped ones (completely with FFmpegPipeBackend), and the work of the consumers
+        - connection_timeout [float] seconds without frames before reconnecting
+        - max_backoff [float] maximum delay in seconds between connection attempts. The delay starts at 0.1 s
+          and doubles after every failed attempt. With use_udp, failed attempts alternate between UDP and TCP
+        - decode_threads [int] maximum number of decoder threads. 0 lets the decoder choose, usually one per core.
+          Limit it when several streams are decoded on the same machine
+        '''
+        self._original_rtsp_url = rtsp_url  # Keep the original URL intact
+        self._rtsp_url = self._update_url_for_udp(rtsp_url, use_udp)
+        self._cam_name = cam_name
+        self._use_udp = use_udp  # Track whether we are trying UDP or TCP
+
+        if isinstance(backend, str):
+            if backend not in self.BACKENDS:
+                raise ValueError("Unknown backend {}. Use one of {}".format(backend, list(self.BACKENDS.keys())))
+            backend = self.BACKENDS[backend]
+        if (output_size or crop or keyframes_only) and not backend.SUPPORTS_FILTERS:
+            if backend is not FFmpegBackend:
+                raise ValueError("{} can not scale, crop or skip frames".format(backend.__name__))
+            backend = FFmpegPipeBackend
+        self._backend_cls = backend
+        self._output_size = output_size
+        self._crop = crop
+        self._frame_step = max(1, int(frame_step))
+        self._max_fps = max_fps
+        self._keyframes_only = keyframes_only
+        # Decimation done by this class, see _keepFrame()
+        native = backend.NATIVE_DECIMATION
+        self._skip_step = self._frame_step if 'frame_step' not in native else 1
+        self._skip_fps = max_fps if 'max_fps' not in native else None
+        self._grabbed = 0
+        self._skipped = 0
+        self._next_t = 0.0
+        self._decoder = decoder
+        self._decode_threads = decode_threads
+        self._stream = None
+        self._pool = FramePool(pool_size) if pool_size > 0 else None
+
+        # Shared memory frame bus, see enableSharedMemory()
+        self._bus_name = None
+        self._bus_slots = 4
+        self._bus = None
+
+        # Stored image frame
+        self._frame = None
+        # Latest VideoFrame, and its sequence number
+        self._latest = None
+        self._frame_seq = 0
+        # Notifies waitForFrame() of new frames
+        self._frame_cond = threading.Condition()
+        # Functions called with every new VideoFrame
+        self._frame_callbacks = []
+        # Consumer queues, see createQueue()
+        self._queues = []
+        # Frame rate, jitter and latency, see getStreamStats()
+        self._stream_stats = StreamStats()
+
+        # Logging is configured by the application. debug only lowers this logger's level
+        self._debug = debug
+        self._logger = logging.getLogger(self.__class__.__name__)
+        if self._debug:
+            self._logger.setLevel(logging.DEBUG)
+
+        # Flag to stop frame grabbing loop and close windows
+        self._stopped = False
+        # Wakes up the reconnection backoff on close()
+        self._stop_event = threading.Event()
+        self._recv_thread = None  # Initialize thread variable
+
+        # Connection state, see addConnectionCallback() and getStreamStats()
+        self._connected = False
+        self._connections = 0
+        self._failed_attempts = 0
+        self._connection_callbacks = []
+        self._fallback_tcp = use_udp
+        self._min_backoff = 0.1
+        self._max_backoff = max_backoff
+
+        # Show grabbed frame in a window (mainly for debugging)
+        self._show_window = False
+        self._window_shown = False
+
+        self._last_image_time = time()
+
+        # Timeout (seconds) without frames before reconnecting
+        self._connection_timeout = connection_timeout
+
+        # Start stream
+        self.start()
+
+    def setShowWindow(self, f: bool):
+        self._show_window = f
+
+    def getFrame(self):
+        """
+        Returns current image frame
+        """
+        return self._frame
+
+    def getLatestFrame(self):
+        """
+        Returns the latest VideoFrame, or None if no frame was received yet
+        """
+        return self._latest
+
+    def waitForFrame(self, after_seq=0, timeout=None):
+        """
+        Blocks until a frame newer than after_seq is available, and returns the latest one.
+        Passing the seq of the previous returned frame gives each frame at most once, without busy polling.
+
+        Params
+        --
+        - after_seq [int] Sequence number of the last processed frame. 0 returns any frame
+        - timeout [float] Maximum waiting time in seconds. None waits forever
+
+        Returns
+        --
+        [VideoFrame] Latest frame, or None on timeout or if the stream is closed
+        """
+        with self._frame_cond:
+            ok = self._frame_cond.wait_for(
+                lambda: self._stopped or (self._latest is not None and self._latest.seq > after_seq), timeout)
+            if not ok or self._latest is None or self._latest.seq <= after_seq:
+                return None
+            return self._latest
+
+    def frames(self, timeout=None):
+        """
+        Iterates over new frames until the stream is closed, or no frame arrives within timeout.
+        Frames that arrive while the consumer is busy are skipped, only the latest one is returned.
+
+        Example
+        --
+            for frame in rtsp.frames():
+                process(frame.image)
+        """
+        seq = 0
+        while True:
+            frame = self.waitForFrame(seq, timeout)
+            if frame is None:
+                return
+            seq = frame.seq
+            yield frame
+
+    def getStreamStats(self):
+        """
+        Returns rolling statistics of the received frames: frame rate, jitter, decode time and latency.
+        See StreamStats.snapshot()
+        """
+        stats = self._stream_stats.snapshot()
+        stats["skipped"] = self._skipped
+        stats["connected"] = self._connected
+        stats["transport"] = "udp" if self._use_udp else "tcp"
+        stats["reconnects"] = max(0, self._connections - 1)
+        stats["failed_attempts"] = self._failed_attempts
+        return stats
+
+    def isConnected(self):
+        """
+        Returns True while frames are being received
+        """
+        return self._connected
+
+    def addConnectionCallback(self, cb):
+        """
+        Registers a function called as cb(connected) when the first frame of a connection arrives (True),
+        and when the connection is lost (False). It is called from the receiving thread
+        """
+        self._connection_callbacks.append(cb)
+
+    def removeConnectionCallback(self, cb):
+        if cb in self._connection_callbacks:
+            self._connection_callbacks.remove(cb)
+
+    def _setConnected(self, connected):
+        self._connected = connected
+        if connected:
+            self._connections += 1
+            self._logger.info("Receiving stream of %s (%s)", self._cam_name, "UDP" if self._use_udp else "TCP")
+        else:
+            self._logger.warning("Lost stream of %s", self._cam_name)
+        for cb in self._connection_callbacks:
+            try:
+                cb(connected)
+            except Exception as e:
+                self._logger.error("Error in connection callback: %s", e)
+
+    def addFrameCallback(self, cb):
+        """
+        Registers a function called as cb(frame) with every new VideoFrame.
+        It is called from the receiving thread, so it must return quickly.
+        """
+        self._frame_callbacks.append(cb)
+
+    def removeFrameCallback(self, cb):
+        if cb in self._frame_callbacks:
+            self._frame_callbacks.remove(cb)
+
+    def createQueue(self, maxsize=1, policy=FrameQueue.DROP_OLDEST, block_timeout=None):
+        """
+        Creates a bounded queue that receives every new frame. Each consumer should use its own queue,
+        e.g. a detector with maxsize=1 and DROP_OLDEST, and a recorder with a deeper BLOCK queue.
+        See FrameQueue for the parameters.
+
+        Returns
+        --
+        [FrameQueue]
+        """
+        q = FrameQueue(maxsize, policy, block_timeout)
+        if self._pool is not None and maxsize + 2 > self._pool.getSize():
+            self._logger.warning("Queue of %s frames needs pool_size > %s, or queued images get overwritten",
+                                 maxsize, maxsize + 1)
+        self._queues.append(q)
+        return q
+
+    def removeQueue(self, q):
+        """
+        Stops feeding a queue created by createQueue(), and closes it
+        """
+        if q in self._queues:
+            self._queues.remove(q)
+        q.close()
+
+    def createBatcher(self, batch_size=8, max_wait=0.1, n_buffers=3):
+        """
+        Creates a FrameBatcher that collects the new frames into preallocated batches, e.g. for a detector
+        that processes several images at once. Requires numpy. Remove it with removeQueue().
+
+        Example
+        --
+            batcher = rtsp.createBatcher(batch_size=4, max_wait=0.2)
+            for batch in batcher:
+                detections = model(batch.images)  # (n, height, width, 3)
+
+        Returns
+        --
+        [FrameBatcher]
+        """
+        b = FrameBatcher(batch_size, max_wait, n_buffers)
+        self._queues.append(b)
+        return b
+
+    def enableSharedMemory(self, name, n_slots=4):
+        """
+        Publishes every frame into a shared memory ring, so other processes can read the frames without
+        their own RTSP session. See framebus.SharedFrameReader. The memory is created with the first frame.
+
+        Params
+        --
+        - name [str] shared memory name, given to the readers
+        - n_slots [int] number of frames in the ring
+        """
+        self._bus_slots = n_slots
+        self._bus_name = name
+
+    def _publishShared(self, frame):
+        if self._bus is None:
+            from .framebus import SharedFrameWriter
+            try:
+                self._bus = SharedFrameWriter(self._bus_name, frame.image.shape, self._bus_slots)
+            except Exception as e:
+                self._logger.error("Could not create shared memory %s: %s", self._bus_name, e)
+                self._bus_name = None
+                return
+            self._logger.info("Publishing frames to shared memory %s", self._bus_name)
+        if not self._bus.write(frame.image, frame.seq, frame.stamp, frame.pts or 0.0):
+            self._logger.warning("Frame shape %s does not match shared memory shape %s",
+                                 frame.image.shape, self._bus.getShape())
+
+    def _publish(self, image, stamp=None, pts=None, decode_time=0.0):
+        """
+        Makes a decoded image available to consumers
+        """
+        self._frame_seq += 1
+        frame = VideoFrame(self._frame_seq, image, stamp, pts, decode_time)
+        self._stream_stats.onFrame(frame)
+        with self._frame_cond:
+            self._frame = image
+            self._latest = frame
+            self._frame_cond.notify_all()
+        if self._bus_name is not None:
+            self._publishShared(frame)
+        for q in self._queues:
+            q.put(frame)
+        for cb in self._frame_callbacks:
+            try:
+                cb(frame)
+            except Exception as e:
+                self._logger.error("Error in frame callback: %s", e)
+
+    def start(self):
+        """
+        Start receiving thread. It connects, and reconnects, in the background
+        """
+        if self._recv_thread is not None and self._recv_thread.is_alive():
+            return
+        self._stopped = False
+        self._stop_event.clear()
+        self._recv_thread = threading.Thread(target=self.loop, daemon=True)
+        self._recv_thread.start()
+
+    def _createBackend(self):
+        options = dict(output_size=self._output_size, crop=self._crop, frame_step=self._frame_step,
+                       max_fps=self._max_fps, keyframes_only=self._keyframes_only)
+        if issubclass(self._backend_cls, GStreamerBackend):
+            return self._backend_cls(self._original_rtsp_url, self._use_udp, self._decoder, **options)
+        if self._backend_cls.SUPPORTS_FILTERS:
+            return self._backend_cls(self._original_rtsp_url, self._use_udp, **options)
+        return self._backend_cls(self._original_rtsp_url, self._use_udp)
+
+    def _keepFrame(self, stamp):
+        """
+        Returns False if a grabbed frame is dropped by frame_step or max_fps, before it is retrieved
+        """
+        self._grabbed += 1
+        if self._skip_step > 1 and (self._grabbed - 1) % self._skip_step:
+            return False
+        if self._skip_fps:
+            if stamp < self._next_t:
+                return False
+            # Keep the average rate, without catching up more than one frame after a stall
+            period = 1. / self._skip_fps
+            self._next_t = max(self._next_t + period, stamp - period)
+        return True
+
+    def close(self):
+        """
+        Stops receiving. Can be called from any thread, including frame callbacks
+        """
+        self._logger.info("Closing stream of %s...", self._cam_name)
+        self._stopped = True
+        self._stop_event.set()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        for q in self._queues:
+            q.close()
+        if self._recv_thread and self._recv_thread.is_alive() and threading.current_thread() is not self._recv_thread:
+            # The stream is released by the receiving thread, after its current read
+            self._recv_thread.join(self._connection_timeout + 1.0)
+            if self._recv_thread.is_alive():
+                self._logger.warning("Receiving thread of %s did not stop", self._cam_name)
+        if self._window_shown:
+            import cv2
+            cv2.destroyAllWindows()
+        if not (self._recv_thread and self._recv_thread.is_alive()):
+            self._closeBus()
+
+    def _closeBus(self):
+        # Removes the shared memory of enableSharedMemory(), once no frame is written anymore
+        if self._bus is not None:
+            self._bus.close()
+            self._bus = None
+
+    def loop(self):
+        """
+        Connects to the stream and captures frames, reconnecting with exponential backoff, until close()
+        """
+        backoff = self._min_backoff
+        while not self._stopped:
+            n = self._session()
+            if self._stopped:
+                break
+            if n > 0:
+                backoff = self._min_backoff
+            else:
+                self._failed_attempts += 1
+                if self._fallback_tcp:
+                    # UDP may be blocked, or TCP refused: alternate
+                    self._use_udp = not self._use_udp
+                    self._rtsp_url = self._update_url_for_udp(self._original_rtsp_url, self._use_udp)
+            self._stop_event.wait(backoff)
+            backoff = min(2 * backoff, self._max_backoff)
+
+        # close() leaves this to the receiving thread when it can't join it, e.g. when called from a frame callback
+        self._closeBus()
+        self._logger.warning("RTSP receiving loop is done")
+
+    def _session(self):
+        """
+        Opens the stream and captures frames until it times out or close() is called
+
+        Returns
+        --
+        [int] number of received frames
+        """
+        self._logger.info("Connecting to %s using %s...", self._cam_name, "UDP" if self._use_udp else "TCP")
+        stream = self._createBackend()
+        stream.setDecodeThreads(self._decode_threads)
+        try:
+            ok = stream.open()
+        except Exception as e:
+            self._logger.error("Could not open stream of %s. Error: %s", self._cam_name, e)
+            ok = False
+        if not ok:
+            self._logger.warning("Failed to open RTSP stream %s", stream.describe())
+            stream.release()
+            return 0
+
+        self._stream = stream
+        self._stream_stats.reset()
+        n = 0
+        try:
+            n = self._capture()
+        except Exception as e:
+            self._logger.error("Error while receiving stream of %s: %s", self._cam_name, e)
+        finally:
+            self._stream = None
+            stream.release()
+            if self._connected:
+                self._setConnected(False)
+        return n
+
+    def _capture(self):
+        """
+        Captures frames from self._stream until no frame arrives for connection_timeout seconds, or close()
+
+        Returns
+        --
+        [int] number of received frames
+        """
+        if not self._stream.hasFrames():
+            return self._watchProcess()
+
+        self._last_image_time = time()
+        n = 0
+
+        while not self._stopped:
+            ret = self._stream.grab()
+            if ret:
+                stamp = monotonic()
+                n += 1
+                if not self._connected:
+                    self._setConnected(True)
+                if not self._keepFrame(stamp):
+                    self._skipped += 1
+                    self._last_image_time = time()
+                    continue
+                pts = self._stream.getPTS()
+                buf = self._pool.next() if self._pool is not None else None
+                ret, image = self._stream.retrieve(buf)
+                decode_time = monotonic() - stamp
+                if ret and self._pool is not None:
+                    self._pool.adopt(image, buf)
+
+            if not ret:
+                if (time() - self._last_image_time) > self._connection_timeout:
+                    self._logger.warning("No frame from %s for %s s", self._cam_name, self._connection_timeout)
+                    break
+                continue
+
+            self._last_image_time = time()
+            self._publish(image, stamp, pts, decode_time)
+            if self._logger.isEnabledFor(logging.DEBUG):
+                self._logger.debug("Frame %s: pts %s ms, retrieved in %.1f ms", self._frame_seq, pts, decode_time * 1000)
+
+            if self._show_window:
+                import cv2
+                self._window_shown = True
+                cv2.imshow('{} Stream'.format(self._cam_name), image)
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    self.close()
+                    break
+
+            # Optimized delay to avoid overwhelming CPU while reducing latency
+            sleep(0.001)
+
+        return n
+
+    def _watchProcess(self):
+        """
+        Waits while a backend without frames runs. It counts as connected once it ran for connection_timeout
+
+        Returns
+        --
+        [int] 1 if it was connected, 0 if it stopped before
+        """
+        t0 = monotonic()
+        while not self._stopped and self._stream.isAlive():
+            if not self._connected and monotonic() - t0 > self._connection_timeout:
+                self._setConnected(True)
+            self._stop_event.wait(0.2)
+        if not self._stopped:
+            self._logger.warning("%s exited with code %s", self._stream.describe(), self._stream.getReturnCode())
+        return 1 if self._connected else 0
+
+    def _update_url_for_udp(self, rtsp_url, use_udp):
+        """
+        Modify the RTSP URL to use UDP transport if specified
+        """
+        return _url_with_transport(rtsp_url, use_udp)
+
+class RTSPRelay(SIYIRTSP):
+    '''
+    Forwards the camera RTSP stream to an RTMP server without decoding and re-encoding it, so relaying costs
+    almost no CPU. Runs an FFmpegRelayBackend, and restarts it with the reconnection policy of SIYIRTSP.
+
+    With tee_frames, the stream is also decoded once, and the frames are delivered to Python consumers
+    as with SIYIRTSP (waitForFrame(), createQueue(), callbacks), with its scaling and decimation options.
+    These options only apply to the teed frames: the relayed stream is always the original one.
+    '''
+    # Options of the decoded frames, with their default values. The copied stream is not decoded
+    DECODE_OPTIONS = {'output_size': None, 'crop': None, 'frame_step': 1, 'max_fps': None, 'keyframes_only': False}
+
+    def __init__(self, rtsp_url="rtsp://192.168.144.25:8554/main.264", rtmp_url="rtmp://127.0.0.1:1935/live/webcam",
+                 tee_frames=False, cam_name="ZR10", debug=False, use_udp=True, **kwargs) -> None:
+        '''
+        Params
+        --
+        - rtsp_url [str] RTSP url of the camera
+        - rtmp_url [str] RTMP server URL
+        - tee_frames [bool] also decode the stream and deliver its frames
+        - Other keyword arguments are passed to SIYIRTSP, e.g. connection_timeout. The options of the decoded
+          frames (output_size, crop, frame_step, max_fps, keyframes_only) need tee_frames
+        '''
+        if not tee_frames:
+            used = [k for k, v in self.DECODE_OPTIONS.items() if kwargs.get(k, v) != v]
+            if used:
+                raise ValueError("{} only apply to decoded frames, use tee_frames=True".format(", ".join(used)))
+        self._rtmp_url = rtmp_url
+        self._tee = tee_frames
+        super().__init__(rtsp_url, cam_name, debug, use_udp, backend=FFmpegRelayBackend, **kwargs)
+
+    def _createBackend(self):
+        return FFmpegRelayBackend(self._original_rtsp_url, self._use_udp, self._rtmp_url, self._tee,
+                                  output_size=self._output_size, crop=self._crop, frame_step=self._frame_step,
+                                  max_fps=self._max_fps, keyframes_only=self._keyframes_only)
+
+def parseEncoders(text):
+    '''
+    Returns the names of the video encoders in the output of `ffmpeg -encoders`
+    '''
+    names = set()
+    for line in text.splitlines():
+        parts = line.split()
+        # e.g. " V....D libx264    libx264 H.264 / AVC ..."
+        if len(parts) > 1 and len(parts[0]) == 6 and parts[0][0] == 'V' and parts[1] != '=':
+            names.add(parts[1])
+    return names
+
+class VideoEncoder:
+    '''
+    H.264 encoder settings of the ffmpeg commands of RTMPSender
+    '''
+    # codec: (pixel formats it takes without conversion, default preset)
+    CODECS = {
+        'libx264': (('yuv420p',), 'ultrafast'),
+        'h264_v4l2m2m': (('yuv420p', 'nv12'), None),  # e.g. Raspberry Pi
+        'h264_vaapi': (('nv12',), None),  # Intel/AMD GPUs
+        'h264_nvenc': (('yuv420p', 'nv12'), 'p1'),  # Nvidia GPUs
+    }
+    # Order in which select() tries the encoders
+    PREFERRED = ('h264_nvenc', 'h264_vaapi', 'h264_v4l2m2m', 'libx264')
+
+    _available = None
+
+    def __init__(self, codec='libx264', bitrate=None, gop=None, preset=None, vaapi_device='/dev/dri/renderD128') -> None:
+        '''
+        Params
+        --
+        - codec [str] one of CODECS
+        - bitrate [int] target bitrate in bits/s. None uses the encoder default
+        - gop [int] frames between key frames. None uses the encoder default
+        - preset [str] encoder preset. None uses the default of CODECS
+        - vaapi_device [str] device of h264_vaapi
+        '''
+        if codec not in self.CODECS:
+            raise ValueError("Unknown codec {}. Use one of {}".format(codec, list(self.CODECS.keys())))
+        self.codec = codec
+        self.bitrate = bitrate
+        self.gop = gop
+        self.preset = preset if preset is not None else self.CODECS[codec][1]
+        self.vaapi_device = vaapi_device
+
+    def __repr__(self):
+        return "VideoEncoder({}, bitrate={}, gop={}, preset={})".format(self.codec, self.bitrate, self.gop, self.preset)
+
+    def inputArgs(self):
+        '''
+        Returns the ffmpeg arguments needed before the input
+        '''
+        if self.codec == 'h264_vaapi':
+            return ["-vaapi_device", self.vaapi_device]
+        return []
+
+    def _pixFmt(self, input_pix_fmt):
+        native = self.CODECS[self.codec][0]
+        return input_pix_fmt if input_pix_fmt in native else native[0]
+
+    def filter(self, input_pix_fmt='bgr24'):
+        '''
+        Returns the video filter the encoder needs (upload to the GPU), or None
+        '''
+        if self.codec == 'h264_vaapi':
+            return "format={},hwupload".format(self._pixFmt(input_pix_fmt))
+        return None
+
+    def outputArgs(self, input_pix_fmt='bgr24', filters=True):
+        '''
+        Returns the ffmpeg arguments of the encoder
+
+        Params
+        --
+        - input_pix_fmt [str] pixel format of the raw input. If the encoder takes it, ffmpeg does not convert it
+        - filters [bool] include the filter(), as -vf. False if the caller puts it in a filter graph
+        '''
+        args = []
+        if self.filter(input_pix_fmt) is None:
+            args += ["-pix_fmt", self._pixFmt(input_pix_fmt)]
+        elif filters:
+            args += ["-vf", self.filter(input_pix_fmt)]
+        args += ["-c:v", self.codec]
+        if self.preset:
+            args += ["-preset", self.preset]
+        if self.codec == 'libx264':
+            args += ["-tune", "zerolatency"]
+        elif self.codec == 'h264_nvenc':
+            args += ["-zerolatency", "1"]
+        if self.bitrate:
+            args += ["-b:v", str(self.bitrate), "-maxrate", str(self.bitrate), "-bufsize", str(self.bitrate)]
+        if self.gop:
+            args += ["-g", str(self.gop)]
+            if self.codec == 'libx264':
+                # Fixed GOP, no extra key frames on scene changes
+                args += ["-keyint_min", str(self.gop), "-sc_threshold", "0"]
+        return args
+
+    @classmethod
+    def available(cls):
+        '''
+        Returns the names of the CODECS that ffmpeg was built with. The result is cached
+        '''
+        if cls._available is None:
+            try:
+                out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True,
+                                     timeout=10).stdout
+            except (OSError, subprocess.SubprocessError):
+                out = ""
+            cls._available = [c for c in cls.CODECS if c in parseEncoders(out)]
+        return cls._available
+
+    def isUsable(self):
+        '''
+        Encodes a few test frames, to check that the encoder hardware is present
+        '''
+        cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"] + self.inputArgs() + \
+              ["-f", "lavfi", "-i", "testsrc=size=320x240:rate=30", "-frames:v", "5"] + \
+              self.outputArgs("yuv420p") + ["-f", "null", "-"]
+        try:
+            return subprocess.run(cmd, capture_output=True, timeout=20).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            return False
+
+    @classmethod
+    def select(cls, preferred=PREFERRED, **kwargs):
+        '''
+        Returns a VideoEncoder of the first usable codec of preferred, or libx264
+
+        Params
+        --
+        - preferred [list] codec names, in order of preference
+        - Other keyword arguments are passed to VideoEncoder, e.g. bitrate, gop
+        '''
+        available = cls.available()
+        for codec in preferred:
+            if codec in available:
+                encoder = cls(codec, **kwargs)
+                if codec == 'libx264' or encoder.isUsable():
+                    return encoder
+        return cls('libx264', **kwargs)
+
+class SegmentIndex:
+    '''
+    Sidecar index of the segments of a SegmentRecorder, in index.csv next to them.
+    One line per completed segment: start (wall clock time, seconds), duration, size in bytes, file name.
+    Lines are appended as segments complete, and finding the segment of a moment bisects the start times.
+    '''
+    FILENAME = "index.csv"
+
+    def __init__(self, directory) -> None:
+        self._dir = directory
+        self._path = os.path.join(directory, self.FILENAME)
+        self._lock = threading.Lock()
+        # Sorted by start time
+        self._starts = []
+        self._entries = []
+        self._total_size = 0
+        self.load()
+
+    def load(self):
+        '''
+        Reads the index file. Segments whose file was deleted are dropped
+        '''
+        entries = []
+        if os.path.exists(self._path):
+            with open(self._path) as f:
+                for line in f:
+                    try:
+                        start, duration, size, name = line.rstrip('\n').split(',', 3)
+                        entry = (float(start), float(duration), int(size), name)
+                    except ValueError:
+                        continue
+                    if os.path.exists(os.path.join(self._dir, name)):
+                        entries.append(entry)
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._starts = [e[0] for e in entries]
+            self._total_size = sum(e[2] for e in entries)
+
+    def _save(self):
+        tmp = self._path + ".tmp"
+        with open(tmp, 'w') as f:
+            for e in self._entries:
+                f.write("{:.3f},{:.3f},{},{}\n".format(*e))
+        os.replace(tmp, self._path)
+
+    def add(self, start, duration, size, name):
+        '''
+        Adds a completed segment
+        '''
+        entry = (start, duration, size, name)
+        with self._lock:
+            # A file that was overwritten, e.g. after a restart within the same second
+            replaced = [k for k, e in enumerate(self._entries) if e[3] == name]
+            for k in reversed(replaced):
+                self._total_size -= self._entries[k][2]
+                del self._entries[k]
+                del self._starts[k]
+            i = bisect.bisect_right(self._starts, start)
+            self._starts.insert(i, start)
+            self._entries.insert(i, entry)
+            self._total_size += size
+            if i == len(self._entries) - 1 and not replaced:
+                with open(self._path, 'a') as f:
+                    f.write("{:.3f},{:.3f},{},{}\n".format(*entry))
+            else:
+                self._save()
+
+    def find(self, t):
+        '''
+        Returns (path, offset in seconds) of the segment that contains the wall clock time t, or None
+        '''
+        with self._lock:
+            i = bisect.bisect_right(self._starts, t) - 1
+            if i < 0:
+                return None
+            start, duration, _, name = self._entries[i]
+            if t > start + duration:
+                return None
+            return os.path.join(self._dir, name), t - start
+
+    def segments(self):
+        '''
+        Returns a copy of the entries (start, duration, size, name), oldest first
+        '''
+        with self._lock:
+            return list(self._entries)
+
+    def getTotalSize(self):
+        return self._total_size
+
+    def contains(self, name):
+        with self._lock:
+            return any(e[3] == name for e in self._entries)
+
+    def enforce(self, max_bytes):
+        '''
+        Deletes the oldest segments until the total size is at most max_bytes. The newest segment is kept
+
+        Returns
+        --
+        [list] names of the deleted segments
+        '''
+        deleted = []
+        with self._lock:
+            while self._total_size > max_bytes and len(self._entries) > 1:
+                _, _, size, name = self._entries.pop(0)
+                self._starts.pop(0)
+                self._total_size -= size
+                try:
+                    os.remove(os.path.join(self._dir, name))
+                except FileNotFoundError:
+                    pass
+                deleted.append(name)
+            if deleted:
+                self._save()
+        return deleted
+
+class SegmentRecorder(SIYIRTSP):
+    '''
+    Records the camera RTSP stream into rolling segment files, without decoding it, with bounded disk usage.
+    Runs an FFmpegSegmentBackend, restarted with the reconnection policy of SIYIRTSP.
+
+    Segments of segment_time seconds (cut at the next key frame) are written one after the other. When a segment
+    completes, it is added to the SegmentIndex, and the oldest segments are deleted while the total size is over
+    max_bytes. find(t) returns the segment and offset of a moment.
+    '''
+    # Segment file names: prefix + local start time + extension
+    TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+    def __init__(self, rtsp_url="rtsp://192.168.144.25:8554/main.264", directory="recordings", segment_time=60,
+                 fmt='mkv', max_bytes=10 * 1024 ** 3, prefix="seg_", cam_name="ZR10", debug=False, use_udp=True,
+                 **kwargs) -> None:
+        '''
+        Params
+        --
+        - rtsp_url [str] RTSP url of the camera
+        - directory [str] output directory, created if needed
+        - segment_time [float] segment length in seconds
+        - fmt [str] 'mkv' (default, readable after a crash), 'mp4' or 'ts'
+        - max_bytes [int] maximum total size of the completed segments
+        - prefix [str] prefix of the segment file names
+        - Other keyword arguments are passed to SIYIRTSP, e.g. connection_timeout
+        '''
+        os.makedirs(directory, exist_ok=True)
+        self._dir = directory
+        self._segment_time = segment_time
+        self._fmt = fmt
+        self._max_bytes = max_bytes
+        self._prefix = prefix
+        self._index = SegmentIndex(directory)
+        self._adoptOrphans()
+        self._index.enforce(max_bytes)
+        super().__init__(rtsp_url, cam_name, debug, use_udp, backend=FFmpegSegmentBackend, **kwargs)
+
+    def _adoptOrphans(self):
+        '''
+        Adds segments that are not in the index, e.g. the last one of a killed process, so that they are found
+        and deleted as the others. Only done once, at start
+        '''
+        ext = "." + self._fmt
+        for name in sorted(os.listdir(self._dir)):
+            if not (name.startswith(self._prefix) and name.endswith(ext)) or self._index.contains(name):
+                continue
+            path = os.path.join(self._dir, name)
+            try:
+                start = mktime(strptime(name[len(self._prefix):-len(ext)], self.TIME_FORMAT))
+            except ValueError:
+                continue
+            st = os.stat(path)
+            self._index.add(start, max(0.0, st.st_mtime - start), st.st_size, name)
+
+    def _createBackend(self):
+        pattern = os.path.join(self._dir, self._prefix + self.TIME_FORMAT + "." + self._fmt)
+        return FFmpegSegmentBackend(self._original_rtsp_url, self._use_udp, pattern, self._segment_time, self._fmt,
+                                    self._onSegment)
+
+    def _onSegment(self, name, start, end):
+        name = os.path.basename(name)
+        try:
+            size = os.path.getsize(os.path.join(self._dir, name))
+        except OSError:
+            return
+        duration = end - start
+        # The segment was completed just now
+        self._index.add(time() - duration, duration, size, name)
+        for deleted in self._index.enforce(self._max_bytes):
+            self._logger.debug("Deleted segment %s", deleted)
+
+    def getIndex(self):
+        '''
+        Returns the SegmentIndex
+        '''
+        return self._index
+
+    def find(self, t):
+        '''
+        Returns (path, offset in seconds) of the recorded segment that contains the wall clock time t, or None
+        '''
+        return self._index.find(t)
+
+class RTMPSender:
+    '''
+    Streams image frames to an RTMP server, through an ffmpeg process.
+
+    Frames are taken from a FrameQueue (setFrame(), or a queue of SIYIRTSP given to the constructor).
+    A pacing thread sends each new frame once, at the output rate, and repeats the previous frame only
+    when no new one arrived in time. A writer thread writes to the ffmpeg pipe, through a bounded handoff:
+    if ffmpeg stalls, frames are dropped (see getStats()) instead of stalling the pacing.
+    '''
+    # Frames waiting for the writer thread
+    HANDOFF_SIZE = 1
+
+    def __init__(self, rtmp_url="rtmp://127.0.0.1:1935/live/webcam", debug=False, queue=None) -> None:
+        '''
+        Params
+        --
+        - rtmp_url [str] RTMP server URL
+        - debug [bool] Printing debug message
+        - queue [FrameQueue] Input frames, e.g. rtsp.createQueue(). None creates a queue of one frame, fed by setFrame()
+        '''
+        self._rtmp_url=rtmp_url
+        # Desired frequency of streaming to rtmp server
+        self._fps =30
+
+        # Input frames (VideoFrame or images)
+        self._queue = queue if queue is not None else FrameQueue(maxsize=1, policy=FrameQueue.DROP_OLDEST)
+        # Prepared frames, from the pacing thread to the writer thread
+        self._handoff = FrameQueue(maxsize=self.HANDOFF_SIZE, policy=FrameQueue.DROP_NEWEST)
+        # Last prepared frame, repeated when no new frame arrives
+        self._last = None
+        # Reused destination buffers of resizing and color conversion. One is written to the pipe,
+        # one waits in the handoff, and one is being prepared
+        self._buffers = [None] * (self.HANDOFF_SIZE + 2)
+        self._buf_i = 0
+        # Intermediate buffers of the conversions
+        self._scratch = {}
+
+        # Counters, see getStats()
+        self._frames_in = 0
+        self._duplicated = 0
+        self._dropped = 0
+        self._written = 0
+        self._write_stamps = collections.deque(maxlen=64)
+
+        # Desired image height
+        self._height = 480
+        # Desired image width
+        self._width = 640
+
+        self._toGray=False
+        # Pixel format sent to ffmpeg, see setPixelFormat()
+        self._pix_fmt="bgr24"
+        self._encoder = VideoEncoder()
+
+        # Flag to stop streaming loop
+        self._stopped = False
+        self._p = None
+
+        self._debug= debug # print debug messages
+        # Logging is configured by the application. debug only lowers this logger's level
+        self._logger = logging.getLogger(self.__class__.__name__)
+        if self._debug:
+            self._logger.setLevel(logging.DEBUG)
+
+        # Pacing and pipe writing threads
+        self._st_thread = threading.Thread(target=self.loop, daemon=True)
+        self._wr_thread = threading.Thread(target=self.writerLoop, daemon=True)
+
+        
+    def setImageSize(self, w=640, h=480):
+        self._width=w
+        self._height=h
+
+    def setFPS(self, fps=20):
+        self._fps=fps
+
+    def setGrayFrame(self, b: bool):
+        '''
+        Params
+        --
+        - b [bool] True: sends grayscale image. Otherwise sends color image
+        '''
+        self._toGray = b
+        if self._toGray:
+            self._pix_fmt="gray"
+        else:
+            self._pix_fmt="bgr24"
+
+    # Pixel formats that can be sent to ffmpeg
+    PIX_FMTS = ('bgr24', 'gray', 'yuv420p', 'nv12')
+
+    def setPixelFormat(self, pix_fmt):
+        '''
+        Params
+        --
+        - pix_fmt [str] format of the frames written to ffmpeg: 'bgr24', 'gray', 'yuv420p' or 'nv12'.
+          BGR images are converted to it with OpenCV. Sending a format that the encoder takes (see VideoEncoder.CODECS)
+          saves the conversion in ffmpeg. Images that are already yuv420p or nv12 ((height * 3/2, width) arrays)
+          are sent as they are
+        '''
+        if pix_fmt not in self.PIX_FMTS:
+            raise ValueError("Unknown pixel format {}. Use one of {}".format(pix_fmt, self.PIX_FMTS))
+        self._pix_fmt = pix_fmt
+        self._toGray = pix_fmt == "gray"
+
+    def setEncoder(self, encoder):
+        '''
+        Params
+        --
+        - encoder [VideoEncoder or str] encoder, or codec name with default settings. See VideoEncoder.select()
+          to pick the best available one
+        '''
+        self._encoder = VideoEncoder(encoder) if isinstance(encoder, str) else encoder
+
+    def getEncoder(self):
+        return self._encoder
+
+
+    def setFrame(self, frame):
+        '''
+        Queues an image (or a VideoFrame) to send. Never blocks, an unsent older frame is replaced
+        '''
+        self._queue.put(frame)
+
+    def getQueue(self):
+        '''
+        Returns the input FrameQueue
+        '''
+        return self._queue
+
+    def getStats(self):
+        '''
+        Returns a dictionary with
+        - frames_in: new frames sent to ffmpeg
+        - duplicated: repeated frames, sent to keep the output rate
+        - dropped_pipe_full: frames dropped because ffmpeg did not read the previous ones in time
+        - input_dropped: frames replaced in the input queue before they were sent
+        - output_fps: frames written to the pipe per second, over the last frames
+        '''
+        stamps = self._write_stamps
+        fps = None
+        if len(stamps) > 1 and stamps[-1] > stamps[0]:
+            fps = (len(stamps) - 1) / (stamps[-1] - stamps[0])
+        return {
+            "frames_in": self._frames_in,
+            "duplicated": self._duplicated,
+            "dropped_pipe_full": self._dropped,
+            "input_dropped": self._queue.getDroppedCount(),
+            "written": self._written,
+            "output_fps": fps,
+        }
+
+
+    def command(self):
+        '''
+        Returns the ffmpeg command line
+        '''
+        return ["ffmpeg", "-y"] + self._encoder.inputArgs() + [
+            "-f", "rawvideo",
+            "-vcodec", "rawvideo",
+            "-pix_fmt", self._pix_fmt,
+            "-s", "{}x{}".format(self._width, self._height),
+            "-r", str(self._fps),
+            "-i", "-"] + self._encoder.outputArgs(self._pix_fmt) + [
+            "-f", "flv",
+            self._rtmp_url]
+
+    def start(self) -> bool:
+        '''
+        Starts ffmpeg and the streaming threads
+
+        Returns
+        --
+        True if all is fine. False otherwise
+        '''
+        command = self.command()
+        # using subprocess and pipe to fetch frame data
+        try:
+            self._p = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except Exception as e:
+            self._logger.error("Could not create ffmpeg pipeline. Error %s", e)
+            return False
+
+        self._wr_thread.start()
+        self._st_thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops streaming threads and ffmpeg
+        """
+        self._logger.warning("RTMP streaming is stopped.")
+        self._stopped=True
+        self._queue.close()
+        self._handoff.close()
+        if self._p is not None:
+            try:
+                self._p.stdin.close()
+            except Exception:
+                pass
+            for t in (self._st_thread, self._wr_thread):
+                if t.is_alive() and t is not threading.current_thread():
+                    t.join(1.0)
+            self._p.kill()
+            self._p.wait()
+
+    def _buffer(self, name, shape, dtype, final):
+        '''
+        Returns a reused buffer: the current ring buffer for the final image, or an intermediate one
+        '''
+        buf = self._buffers[self._buf_i] if final else self._scratch.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            import numpy as np
+            buf = np.empty(shape, dtype=dtype)
+            if final:
+                self._buffers[self._buf_i] = buf
+            else:
+                self._scratch[name] = buf
+        return buf
+
+    def _prepare(self, frame):
+        '''
+        Converts and resizes an image, if needed, into reused buffers
+        '''
+        w, h = self._width, self._height
+        fmt = self._pix_fmt
+        yuv = fmt in ('yuv420p', 'nv12')
+        if yuv and len(frame.shape) == 2 and frame.shape == (h * 3 // 2, w):
+            # Already converted
+            return frame
+        resize = frame.shape[0] != h or frame.shape[1] != w
+        to_gray = fmt == 'gray' and (len(frame.shape) > 2)
+        if not (to_gray or resize or yuv):
+            # Sent as is. OpenCV is only needed for conversions
+            return frame
+        import cv2
+        if to_gray:
+            # Convert first, so that resizing works on a single channel
+            dst = self._buffer('gray', frame.shape[:2], frame.dtype, final=not resize)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=dst)
+            frame = dst
+        if resize:
+            dst = self._buffer('resized', (h, w) + frame.shape[2:], frame.dtype, final=not yuv)
+            cv2.resize(frame, (w, h), dst=dst, interpolation = cv2.INTER_AREA)
+            frame = dst
+        if fmt == 'yuv420p':
+            dst = self._buffer('yuv', (h * 3 // 2, w), frame.dtype, final=True)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=dst)
+            frame = dst
+        elif fmt == 'nv12':
+            # OpenCV has no BGR to NV12 conversion: interleave the U and V planes of I420
+            i420 = self._buffer('yuv', (h * 3 // 2, w), frame.dtype, final=False)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=i420)
+            dst = self._buffer('nv12', (h * 3 // 2, w), frame.dtype, final=True)
+            dst[:h] = i420[:h]
+            uv = i420[h:].reshape(-1)
+            n = (h // 2) * (w // 2)
+            dst[h:, 0::2] = uv[:n].reshape(h // 2, w // 2)
+            dst[h:, 1::2] = uv[n:2 * n].reshape(h // 2, w // 2)
+            frame = dst
+        return frame
+
+    def sendFrame(self) -> bool:
+        '''
+        Hands the newest queued frame to the writer thread, or repeats the previous frame if there is no new one
+
+        Returns
+        --
+        True if a frame was handed over. False if there is no frame yet, or the writer is still busy
+        '''
+        item = self._queue.get(0)
+        if item is None:
+            if self._last is None:
+                return False
+            frame = self._last
+            new = False
+        else:
+            try:
+                frame = self._prepare(getattr(item, 'image', item))
+            except Exception as e:
+                self._logger.error(" Error in preparing frame:  %s", e)
+                return False
+            new = True
+
+        if not self._handoff.put(frame):
+            self._dropped += 1
+            self._logger.debug("ffmpeg pipe is full, frame dropped")
+            return False
+        if new:
+            self._frames_in += 1
+            self._last = frame
+            self._buf_i = (self._buf_i + 1) % len(self._buffers)
+        else:
+            self._duplicated += 1
+        return True
+
+    def loop(self):
+        '''
+        Paces the output at the configured FPS
+        '''
+        next_t = monotonic()
+        while(not self._stopped):
+            self.sendFrame()
+            next_t += 1. / self._fps
+            dt = next_t - monotonic()
+            if dt > 0:
+                sleep(dt)
+            else:
+                # Late, do not try to catch up
+                next_t = monotonic()
+
+        self._logger.warning("RTMP streaming loop is done")
+        return
+
+    def writerLoop(self):
+        '''
+        Writes the prepared frames to the ffmpeg pipe
+        '''
+        for frame in self._handoff:
+            try:
+                # Write the image memory directly, without a tobytes() copy
+                if frame.flags['C_CONTIGUOUS']:
+                    self._p.stdin.write(memoryview(frame).cast('B'))
+                else:
+                    self._p.stdin.write(frame.tobytes())
+            except Exception as e:
+                if not self._stopped:
+                    self._logger.error(" Error in sending:  %s", e)
+                    self._stopped = True
+                return
+            self._written += 1
+            self._write_stamps.append(monotonic())
+
+        
+
+
+class StreamFanout(RTMPSender):
+    '''
+    Sends one stream of frames to several outputs (e.g. RTMP server, local recording, low bitrate UDP preview)
+    with a single ffmpeg process. Each quality level is scaled and encoded once, and its encoded stream is
+    written to all its sinks by the ffmpeg tee muxer.
+
+    Sinks fail independently (tee onfail=ignore): a dead RTMP server does not stop the recording. Network sinks
+    are written through the fifo muxer, which retries to open them after a failure, and keeps a slow sink from
+    delaying the others.
+
+    Frames are given as with RTMPSender: setFrame(), or a queue of SIYIRTSP.
+
+    Example
+    --
+        fanout = StreamFanout(queue=rtsp.createQueue())
+        fanout.setImageSize(1280, 720)
+        fanout.addQuality("main", encoder=VideoEncoder(bitrate=4000000, gop=30))
+        fanout.addQuality("preview", size=(320, 180), encoder=VideoEncoder(bitrate=300000, gop=30))
+        fanout.addSink("rtmp://192.168.144.100/live/cam", fmt="flv", quality="main")
+        fanout.addSink("rec/cam_%Y%m%d_%H%M%S.mkv", fmt="segment", quality="main", segment_time=60, strftime=1)
+        fanout.addSink("udp://192.168.144.100:5600", fmt="mpegts", quality="preview")
+        fanout.start()
+    '''
+    def __init__(self, debug=False, queue=None) -> None:
+        super().__init__(rtmp_url=None, debug=debug, queue=queue)
+        # name: (size, VideoEncoder)
+        self._qualities = {}
+        # (url, fmt, quality, recover, options)
+        self._sinks = []
+
+    def addQuality(self, name, size=None, encoder=None):
+        '''
+        Params
+        --
+        - name [str] quality name, used by addSink()
+        - size [tuple] (width, height). None keeps the input size (setImageSize())
+        - encoder [VideoEncoder] None uses libx264 with default settings
+        '''
+        self._qualities[name] = (tuple(size) if size else None, encoder or VideoEncoder())
+
+    def addSink(self, url, fmt='flv', quality='main', recover=None, **options):
+        '''
+        Params
+        --
+        - url [str] output URL or file
+        - fmt [str] ffmpeg muxer, e.g. 'flv' (RTMP), 'mpegts' (UDP), 'segment', 'matroska'
+        - quality [str] quality name. 'main' is created with the input size if it was not added
+        - recover [bool] retry to open the sink after a failure. None: True for network URLs
+        - options: muxer options, e.g. segment_time=60
+        '''
+        if quality not in self._qualities:
+            if quality != 'main':
+                raise ValueError("Unknown quality {}. Add it with addQuality()".format(quality))
+            self.addQuality('main')
+        if recover is None:
+            recover = "://" in url
+        self._sinks.append((url, fmt, quality, recover, options))
+
+    def removeSinks(self):
+        self._sinks = []
+
+    @staticmethod
+    def teeSlave(url, fmt, recover, options):
+        '''
+        Returns the tee muxer specification of a sink
+        '''
+        opts = ["f={}".format(fmt), "onfail=ignore"]
+        opts += ["{}={}".format(k, v) for k, v in options.items()]
+        if recover:
+            # The fifo muxer options are nested, their separators are escaped
+            opts += ["use_fifo=1",
+                     "fifo_options=attempt_recovery=1\\:recover_any_error=1\\:recovery_wait_time=1\\:drop_pkts_on_overflow=1"]
+        return "[{}]{}".format(":".join(opts), url)
+
+    def command(self):
+        '''
+        Returns the ffmpeg command line
+        '''
+        if not self._sinks:
+            raise ValueError("No sink, use addSink()")
+        # Quality levels used by the sinks, in order
+        names = []
+        for _, _, quality, _, _ in self._sinks:
+            if quality not in names:
+                names.append(quality)
+
+        cmd = ["ffmpeg", "-y"]
+        # Device of the hardware encoders, e.g. -vaapi_device
+        device = [self._qualities[name][1].inputArgs() for name in names if self._qualities[name][1].inputArgs()]
+        if device:
+            cmd += device[0]
+        cmd += ["-f", "rawvideo",
+                "-vcodec", "rawvideo",
+                "-pix_fmt", self._pix_fmt,
+                "-s", "{}x{}".format(self._width, self._height),
+                "-r", str(self._fps),
+                "-i", "-"]
+
+        graph = []
+        if len(names) > 1:
+            graph.append("[0:v]split={}{}".format(len(names), "".join("[s{}]".format(i) for i in range(len(names)))))
+        for i, name in enumerate(names):
+            size, encoder = self._qualities[name]
+            f = []
+            if size and size != (self._width, self._height):
+                f.append("scale={}:{}".format(*size))
+            if encoder.filter(self._pix_fmt):
+                f.append(encoder.filter(self._pix_fmt))
+            src = "[s{}]".format(i) if len(names) > 1 else "[0:v]"
+            graph.append("{}{}[v{}]".format(src, ",".join(f) if f else "null", i))
+        cmd += ["-filter_complex", ";".join(graph)]
+
+        for i, name in enumerate(names):
+            encoder = self._qualities[name][1]
+            slaves = [self.teeSlave(url, fmt, recover, options)
+                      for url, fmt, quality, recover, options in self._sinks if quality == name]
+            cmd += ["-map", "[v{}]".format(i)] + encoder.outputArgs(self._pix_fmt, filters=False)
+            cmd += ["-flags", "+global_header", "-f", "tee", "|".join(slaves)]
+        return cmd
+
+def test():
+    import cv2
+    from imutils.video import VideoStream
+    # rtsp = SIYIRTSP(debug=False)
+    # rtsp.setShowWindow(True)
+    # Webcam
+    try:
+        wc = VideoStream(src=0).start()
+    except Exception as e:
+        print("Error in opening webcam")
+        exit(1)
+
+    rtmp = RTMPSender(rtmp_url="rtmp://127.0.0.1:1935/live/webcam")
+    rtmp.start()
+    try:
+        while(True):
+            # frame=stream.getFrame()
+            frame=wc.read()
+            rtmp.setFrame(frame)
+    except KeyboardInterrupt:
+        # rtsp.close()
+        rtmp.stop()
+        wc.stop()
+        cv2.destroyAllWindows()
+        # quit
+        exit(0)
+
+    
+
+if __name__=="__main__":
+    LOG_FORMAT = ' [%(levelname)s] %(asctime)s [%(name)s::%(funcName)s] :\t%(message)s'
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
+    test()
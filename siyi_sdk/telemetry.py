@@ -0,0 +1,96 @@
+"""
+Streams the gimbal attitude and zoom of a SIYI camera as CSV, to stdout or to a file
+Author : Mohamed Abdelkader
+Email: mohamedashraf123@gmail.com
+Copyright 2024
+
+Usage
+--
+    siyi-telemetry --rate 20
+    siyi-telemetry --ip 192.168.144.25 --rate 50 --duration 60 --output attitude.csv
+"""
+import sys
+import argparse
+import logging
+from time import time, monotonic, sleep
+
+from .siyi_sdk import SIYISDK
+
+FIELDS = ("time", "yaw", "pitch", "roll", "yaw_speed", "pitch_speed", "roll_speed", "zoom")
+
+
+def sample(cam):
+    """
+    Returns the current telemetry of cam, in the order of FIELDS
+    """
+    return (time(),) + tuple(cam.getAttitude()) + tuple(cam.getAttitudeSpeed()) + (cam.getCurrentZoomLevel(),)
+
+
+def stream(cam, out, rate=10.0, duration=0.0):
+    """
+    Writes one CSV line per sample to out, at a fixed rate
+
+    Params
+    --
+    - cam [SIYISDK] connected instance
+    - out [file] text file
+    - rate [float] samples per second
+    - duration [float] seconds. 0 runs until interrupted or disconnected
+
+    Returns
+    --
+    [int] number of written samples
+    """
+    out.write(",".join(FIELDS) + "\n")
+    period = 1.0 / rate
+    t0 = monotonic()
+    n = 0
+    cam.enableZoomPolling()
+    try:
+        while cam.isConnected():
+            out.write("{:.3f},{:.1f},{:.1f},{:.1f},{:.1f},{:.1f},{:.1f},{:.1f}\n".format(*sample(cam)))
+            out.flush()
+            n += 1
+            if duration and n * period >= duration:
+                break
+            # Scheduled from the start time, so the rate does not drift
+            dt = t0 + n * period - monotonic()
+            if dt > 0:
+                sleep(dt)
+    finally:
+        cam.enableZoomPolling(False)
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream the attitude and zoom of a SIYI camera as CSV")
+    parser.add_argument("--ip", default="192.168.144.25", help="Camera IP address")
+    parser.add_argument("--port", type=int, default=37260, help="Camera UDP port")
+    parser.add_argument("--rate", type=float, default=10.0, help="Samples per second")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds to stream. Default: until interrupted")
+    parser.add_argument("--output", default=None, help="CSV file to write to. Default: stdout")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args(argv)
+
+    # Log messages go to stderr, so they do not mix with the CSV on stdout
+    logging.basicConfig(format='[%(levelname)s] %(asctime)s [%(name)s::%(funcName)s] :\t%(message)s',
+                        level=logging.DEBUG if args.debug else logging.WARNING)
+
+    cam = SIYISDK(server_ip=args.ip, port=args.port)
+    if not cam.connect():
+        print("Could not connect to the camera at {}:{}".format(args.ip, args.port), file=sys.stderr)
+        return 1
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        stream(cam, out, args.rate, args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cam.disconnect()
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""
+@file conftest.py
+@Description: pytest collects only the offline tests. The other scripts need a camera (some also OpenCV, imutils
+or an RTMP server), and are run one by one, e.g. python3 test_gimbal_rotation.py
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+# Scripts that connect to a real camera
+collect_ignore = [
+    "test_absolute_zoom.py",
+    "test_center_gimbal.py",
+    "test_follow_mode.py",
+    "test_fpv_mode.py",
+    "test_from_rtsp_to_rtmp.py",
+    "test_get_fw_ver.py",
+    "test_get_gimbal_info.py",
+    "test_get_hw_id.py",
+    "test_gimbal_rotation.py",
+    "test_lock_mode.py",
+    "test_print_attitude.py",
+    "test_record_video.py",
+    "test_rtmp_stream.py",
+    "test_rtsp.py",
+    "test_set_angles.py",
+    "test_zoom.py",
+]
@@ -0,0 +1,45 @@
+"""
+@file test_capture.py
+@Description: Records a session with the local camera emulator, and replays it offline
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import os
+import tempfile
+from time import sleep
+
+from siyi_sdk import SIYISDK
+from siyi_sdk.emulator import SIYIEmulator
+from siyi_sdk import capture
+
+
+def test_capture_replay():
+    path = os.path.join(tempfile.mkdtemp(), "session.siyi")
+    with SIYIEmulator(port=0) as emu:
+        emu.setAttitude(12.3, -45.6)
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+        cam.startCapture(path)
+        assert cam.connect()
+        sleep(0.5)
+        attitude = cam.getAttitude()
+        cam.disconnect()
+        cam.stopCapture()
+
+    records = list(capture.readCapture(path))
+    assert any(d == capture.TX for _, d, _ in records)
+    assert any(d == capture.RX for _, d, _ in records)
+    times = [t for t, _, _ in records]
+    assert times == sorted(times)
+
+    offline = SIYISDK(server_ip="127.0.0.1", port=1)
+    n, _ = capture.replayCapture(path, offline, speed=0)
+    assert n == sum(1 for _, d, _ in records if d == capture.RX)
+    assert offline.getAttitude() == attitude
+    assert offline.getCameraTypeString() == "A8 mini"
+
+
+if __name__ == "__main__":
+    test_capture_replay()
+    print("DONE")
@@ -0,0 +1,169 @@
+"""
+@file test_emulator.py
+@Description: Tests the SDK against the local camera emulator. No camera is needed
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import socket
+import threading
+from time import sleep, time
+
+from siyi_sdk import SIYISDK
+from siyi_sdk.siyi_message import SIYIMESSAGE
+from siyi_sdk.emulator import SIYIEmulator
+
+
+def wait_for(cond, timeout=3.0):
+    t0 = time()
+    while time() - t0 < timeout:
+        if cond():
+            return True
+        sleep(0.01)
+    return False
+
+
+def test_connect():
+    with SIYIEmulator(port=0) as emu:
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+        assert cam.connect()
+        assert len(cam.getFirmwareVersion()) > 0
+        assert cam.getCameraTypeString() == "A8 mini"
+        cam.disconnect()
+
+
+def test_set_angles():
+    with SIYIEmulator(port=0) as emu:
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+        assert cam.connect()
+        cam.requestSetAngles(30.0, -20.0)
+        assert wait_for(lambda: abs(cam.getAttitude()[0] - 30.0) < 0.2 and abs(cam.getAttitude()[1] + 20.0) < 0.2)
+        cam.disconnect()
+
+
+def test_gimbal_rotation():
+    with SIYIEmulator(port=0) as emu:
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+        assert cam.connect()
+        cam.setGimbalRotation(10, -10, err_thresh=1.0)
+        yaw, pitch, _ = emu.getAttitude()
+        assert abs(yaw - 10) < 2.0 and abs(pitch + 10) < 2.0
+        cam.disconnect()
+
+
+def test_gimbal_rotation_async():
+    with SIYIEmulator(port=0) as emu:
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+        assert cam.connect()
+        assert cam.setGimbalRotationAsync(60, 0).result(timeout=1.0) is False
+        first = cam.setGimbalRotationAsync(-20, 0)
+        # The latest target wins
+        second = cam.setGimbalRotationAsync(10, -10)
+        assert first.result(timeout=1.0) is False
+        assert second.result(timeout=10.0) is True
+        yaw, pitch, _ = emu.getAttitude()
+        assert abs(yaw - 10) < 2.0 and abs(pitch + 10) < 2.0
+        assert not cam.isRotating()
+
+        third = cam.setGimbalRotationAsync(-30, 0)
+        # Only cancelRotation() stops a rotation
+        assert not third.cancel()
+        sleep(0.3)
+        cam.cancelRotation()
+        assert third.result(timeout=1.0) is False
+        # The gimbal is stopped after the last speed command of the controller
+        sleep(0.3)
+        yaw = emu.getAttitude()[0]
+        sleep(0.3)
+        assert abs(emu.getAttitude()[0] - yaw) < 0.1
+
+        # A manual speed command after a cancelled rotation is not overridden by the stop of the controller
+        cam.setGimbalRotationAsync(30, 0)
+        sleep(0.3)
+        cam.cancelRotation(wait=True)
+        cam.requestGimbalSpeed(-50, 0)
+        sleep(0.3)
+        yaw = emu.getAttitude()[0]
+        sleep(0.3)
+        assert emu.getAttitude()[0] > yaw + 1.0
+        cam.requestGimbalSpeed(0, 0)
+        cam.disconnect()
+
+
+def test_zoom_and_stream():
+    with SIYIEmulator(port=0) as emu:
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+        assert cam.connect()
+        cam.requestAbsoluteZoom(4.5)
+        sleep(0.1)
+        cam.requestCurrentZoomLevel()
+        assert wait_for(lambda: cam.getCurrentZoomLevel() == 4.5)
+
+        cam.requestDataStreamAttitude(50)
+        assert wait_for(lambda: cam.getDataStreamFeedback() == 1)
+        cam.disconnect()
+
+
+def test_step_is_deterministic():
+    emu = SIYIEmulator(port=0)
+    emu.handleRequest('07', '6400')  # yaw speed 100
+    for _ in range(100):
+        emu.step(0.01)
+    yaw, pitch, _ = emu.getAttitude()
+    assert abs(yaw + 90.0) < 1e-6 and pitch == 0.0
+    emu.stop()
+
+
+def test_unique_seq():
+    emu = SIYIEmulator(port=0)
+    msgs = []
+
+    def encode():
+        for _ in range(2000):
+            msgs.append(emu.encodeMsg('01', '08'))
+
+    threads = [threading.Thread(target=encode) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # SEQ is bytes 5 and 6 of every reply
+    assert len({m[10:14] for m in msgs}) == len(msgs)
+    emu.stop()
+
+
+def test_loss_is_repeatable():
+    def run():
+        with SIYIEmulator(port=0, loss=0.5, seed=7) as emu:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.settimeout(0.2)
+            msg = SIYIMESSAGE()
+            for _ in range(50):
+                s.sendto(bytes.fromhex(msg.firmwareVerMsg()), ("127.0.0.1", emu.getPort()))
+            received = 0
+            try:
+                while True:
+                    s.recvfrom(1024)
+                    received += 1
+            except socket.timeout:
+                pass
+            s.close()
+            return received, emu.getDroppedCount()
+
+    r1 = run()
+    r2 = run()
+    assert r1 == r2
+    assert r1[0] + r1[1] == 50 and 0 < r1[0] < 50
+
+
+if __name__ == "__main__":
+    test_connect()
+    test_set_angles()
+    test_gimbal_rotation()
+    test_gimbal_rotation_async()
+    test_zoom_and_stream()
+    test_step_is_deterministic()
+    test_unique_seq()
+    test_loss_is_repeatable()
+    print("DONE")
@@ -0,0 +1,83 @@
+"""
+@file test_frame_batcher.py
+@Description: Tests the batching of frames into preallocated arrays by FrameBatcher
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import math
+import threading
+from time import sleep, monotonic
+
+import pytest
+
+# The video extra
+np = pytest.importorskip("numpy")
+from siyi_sdk.stream import FrameBatcher, VideoFrame
+
+SHAPE = (6, 8, 3)
+
+
+def frame(seq, shape=SHAPE):
+    return VideoFrame(seq, np.full(shape, seq, dtype=np.uint8), pts=seq * 40.0 if seq % 2 else None)
+
+
+def test_full_batches():
+    b = FrameBatcher(batch_size=4, max_wait=None)
+    for seq in range(1, 9):
+        assert b.put(frame(seq))
+    batch = b.get(timeout=0)
+    assert len(batch) == 4 and batch.images.shape == (4,) + SHAPE
+    assert batch.images.flags['C_CONTIGUOUS']
+    assert list(batch.seq) == [1, 2, 3, 4]
+    assert batch.pts[0] == 40.0 and math.isnan(batch.pts[1])
+    assert [int(img[0, 0, 0]) for img in batch.images] == [1, 2, 3, 4]
+    first = batch.images.base
+    batch = b.get(timeout=0)
+    assert list(batch.seq) == [5, 6, 7, 8]
+    # Without max_wait an incomplete batch is not returned
+    b.put(frame(9))
+    assert b.get(timeout=0.05) is None
+    # The buffers are reused
+    for seq in range(10, 13):
+        b.put(frame(seq))
+    batch = b.get(timeout=0)
+    assert list(batch.seq) == [9, 10, 11, 12]
+    assert batch.images.base is first
+
+
+def test_max_wait():
+    b = FrameBatcher(batch_size=8, max_wait=0.1)
+    threading.Thread(target=lambda: [b.put(frame(s)) or sleep(0.01) for s in (1, 2, 3)]).start()
+    t0 = monotonic()
+    batch = b.get(timeout=1.0)
+    assert 0.08 < monotonic() - t0 < 0.5
+    assert list(batch.seq) == [1, 2, 3]
+    b.close()
+    assert b.get(timeout=0.1) is None
+
+
+def test_slow_consumer():
+    b = FrameBatcher(batch_size=2, max_wait=None, n_buffers=3)
+    for seq in range(1, 11):
+        b.put(frame(seq))
+    # All three buffers hold complete batches, the oldest ones were overwritten
+    assert b.getDroppedCount() == 4
+    assert list(b.get(0).seq) == [5, 6]
+    assert list(b.get(0).seq) == [7, 8]
+    assert list(b.get(0).seq) == [9, 10]
+    # New resolution
+    b.put(frame(11))
+    b.put(frame(12, shape=(3, 4, 3)))
+    b.put(frame(13, shape=(3, 4, 3)))
+    assert list(b.get(0).seq) == [11]
+    batch = b.get(0)
+    assert list(batch.seq) == [12, 13] and batch.images.shape == (2, 3, 4, 3)
+
+
+if __name__ == "__main__":
+    test_full_batches()
+    test_max_wait()
+    test_slow_consumer()
+    print("DONE")
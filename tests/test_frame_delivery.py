@@ -0,0 +1,202 @@
+"""
+@file test_frame_delivery.py
+@Description: Tests SIYIRTSP frame delivery (waitForFrame, queues, callbacks) with a synthetic capture backend
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+from time import sleep
+
+import pytest
+
+from siyi_sdk.stream import SIYIRTSP, RTSPRelay, CaptureBackend, GStreamerBackend, FFmpegPipeBackend, FFmpegRelayBackend, FrameQueue, FramePool
+
+
+class SyntheticBackend(CaptureBackend):
+    """
+    Returns N_FRAMES numbered images at ~200 fps, then nothing
+    """
+    N_FRAMES = 20
+
+    def open(self):
+        self._n = 0
+        return True
+
+    def grab(self):
+        if self._n >= self.N_FRAMES:
+            sleep(0.01)
+            return False
+        sleep(0.005)
+        self._n += 1
+        return True
+
+    def retrieve(self, image=None):
+        return True, "image {}".format(self._n)
+
+    def getPTS(self):
+        return self._n * 40.0
+
+    def release(self):
+        pass
+
+
+class FlakyBackend(SyntheticBackend):
+    """
+    Fails to open over UDP, then delivers N_FRAMES per connection
+    """
+    transports = []
+
+    def open(self):
+        FlakyBackend.transports.append(self._use_udp)
+        return super().open() if not self._use_udp else False
+
+
+def test_frame_delivery():
+    rtsp = SIYIRTSP(rtsp_url="rtsp://127.0.0.1:8554/test", backend=SyntheticBackend)
+    recorder = rtsp.createQueue(maxsize=SyntheticBackend.N_FRAMES, policy=FrameQueue.BLOCK)
+    tracker = rtsp.createQueue(maxsize=1, policy=FrameQueue.DROP_OLDEST)
+    called = []
+    rtsp.addFrameCallback(lambda f: called.append(f.seq))
+
+    seen = []
+    frame = rtsp.waitForFrame(0, timeout=1.0)
+    while frame is not None:
+        seen.append(frame.seq)
+        frame = rtsp.waitForFrame(frame.seq, timeout=0.2)
+
+    # Every frame at most once, in order
+    assert seen == sorted(set(seen)) and seen[-1] == SyntheticBackend.N_FRAMES
+    assert called == list(range(1, SyntheticBackend.N_FRAMES + 1))
+    assert [recorder.get(0).seq for _ in range(SyntheticBackend.N_FRAMES)] == called
+    assert tracker.get(0).seq == SyntheticBackend.N_FRAMES
+    assert tracker.getDroppedCount() == SyntheticBackend.N_FRAMES - 1
+    assert rtsp.getFrame() == "image {}".format(SyntheticBackend.N_FRAMES)
+
+    frame = rtsp.getLatestFrame()
+    assert frame.pts == SyntheticBackend.N_FRAMES * 40.0 and frame.decode_time >= 0
+    stats = rtsp.getStreamStats()
+    assert stats["frames"] == SyntheticBackend.N_FRAMES
+    assert 50 < stats["fps"] < 250
+    # Frames arrive faster than their 25 fps PTS, so the estimated latency shrinks, the first frame is the slowest
+    assert stats["latency_s"]["max"] > stats["latency_s"]["last"] == 0
+    rtsp.close()
+    assert rtsp.waitForFrame(SyntheticBackend.N_FRAMES, timeout=1.0) is None
+
+
+def test_reconnect():
+    FlakyBackend.transports = []
+    rtsp = SIYIRTSP(rtsp_url="rtsp://127.0.0.1:8554/test", backend=FlakyBackend, connection_timeout=0.2)
+    q = rtsp.createQueue(maxsize=3 * SyntheticBackend.N_FRAMES, policy=FrameQueue.BLOCK)
+    events = []
+    rtsp.addConnectionCallback(events.append)
+    sleep(1.5)
+    stats = rtsp.getStreamStats()
+    rtsp.close()
+
+    # UDP failed, then TCP was used for every reconnection
+    assert FlakyBackend.transports[:2] == [True, False] and not any(FlakyBackend.transports[2:])
+    assert stats["reconnects"] >= 1 and stats["transport"] == "tcp"
+    assert events[:3] == [True, False, True]
+    # The same queue keeps receiving frames after reconnecting
+    seqs = [f.seq for f in q]
+    assert len(seqs) > SyntheticBackend.N_FRAMES and seqs == list(range(1, len(seqs) + 1))
+
+
+def test_frame_pool():
+    pool = FramePool(3)
+    images = []
+    for i in range(3):
+        buf = pool.next()
+        assert buf is None
+        images.append(object())
+        pool.adopt(images[-1], buf)
+    # Buffers are then recycled, oldest first
+    for i in range(6):
+        buf = pool.next()
+        assert buf is images[i % 3]
+        pool.adopt(buf, buf)
+    # A newly allocated image (e.g. resolution change) restarts the pool
+    buf = pool.next()
+    pool.adopt(object(), buf)
+    assert pool.next() is None
+
+
+def test_gstreamer_pipeline():
+    b = GStreamerBackend("rtsp://192.168.144.25:8554/main.264", use_udp=False, decoder='nvv4l2')
+    pipeline = b.describe()
+    assert "latency=0" in pipeline and "protocols=tcp" in pipeline and "nvv4l2decoder" in pipeline
+    assert pipeline.endswith("appsink drop=true max-buffers=1 sync=false")
+
+    # Crop and scale before the conversion to BGR
+    b = GStreamerBackend("rtsp://192.168.144.25:8554/main.264", output_size=(640, 360), crop=(0, 60, 0, 60))
+    assert "avdec_h264 ! videocrop left=0 top=60 right=0 bottom=60 ! videoscale ! video/x-raw,width=640,height=360 " \
+           "! videoconvert" in b.describe()
+    b = GStreamerBackend("rtsp://192.168.144.25:8554/main.264", decoder='nvv4l2', output_size=(640, 360))
+    assert "nvvidconv ! video/x-raw,format=BGRx,width=640,height=360 ! videoconvert" in b.describe()
+    b = GStreamerBackend("rtsp://192.168.144.25:8554/main.264")
+    b.setDecodeThreads(2)
+    assert "avdec_h264 max-threads=2 !" in b.describe()
+
+
+def test_ffmpeg_filters():
+    b = FFmpegPipeBackend("rtsp://192.168.144.25:8554/main.264", output_size=(640, 360), crop=(100, 0, 100, 0))
+    cmd = b.command()
+    assert cmd[cmd.index("-vf") + 1] == "crop=iw-200:ih-0:100:0,scale=640:360"
+    assert cmd[cmd.index("-rtsp_transport") + 1] == "udp"
+    assert cmd[-5:] == ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+
+    b = FFmpegPipeBackend("rtsp://192.168.144.25:8554/main.264", frame_step=5, max_fps=2, keyframes_only=True)
+    cmd = b.command()
+    assert cmd[cmd.index("-skip_frame") + 1] == "nokey" and cmd.index("-skip_frame") < cmd.index("-i")
+    assert cmd[cmd.index("-vf") + 1] == "framestep=5,select=isnan(prev_selected_t)+gte(t-prev_selected_t\\,0.5)"
+    b.setDecodeThreads(2)
+    cmd = b.command()
+    assert cmd[cmd.index("-threads") + 1] == "2" and cmd.index("-threads") < cmd.index("-i")
+
+
+def test_relay_command():
+    rtsp, rtmp = "rtsp://192.168.144.25:8554/main.264", "rtmp://127.0.0.1:1935/live/webcam"
+    cmd = FFmpegRelayBackend(rtsp, rtmp_url=rtmp).command()
+    # Remuxed, not decoded
+    assert cmd[cmd.index("-i"):] == ["-i", rtsp, "-map", "0:v", "-c:v", "copy", "-an", "-f", "flv", rtmp]
+
+    cmd = FFmpegRelayBackend(rtsp, rtmp_url=rtmp, tee=True, output_size=(640, 360), max_fps=5).command()
+    i = cmd.index(rtmp)
+    assert cmd[i - 7:i] == ["-map", "0:v", "-c:v", "copy", "-an", "-f", "flv"]
+    tee = cmd[i + 1:]
+    assert tee[:2] == ["-map", "0:v"] and tee[-5:] == ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+    assert tee[tee.index("-vf") + 1].endswith("scale=640:360")
+
+    # The copied stream is not decoded, so decoding options without tee would be ignored
+    with pytest.raises(ValueError):
+        RTSPRelay(rtsp, rtmp, keyframes_only=True)
+
+
+def test_decimation():
+    rtsp = SIYIRTSP(rtsp_url="rtsp://127.0.0.1:8554/test", backend=SyntheticBackend, frame_step=4)
+    q = rtsp.createQueue(maxsize=SyntheticBackend.N_FRAMES, policy=FrameQueue.BLOCK)
+    sleep(0.4)
+    rtsp.close()
+    images = [f.image for f in q]
+    # Skipped frames are grabbed but not retrieved
+    assert images == ["image {}".format(i) for i in range(1, SyntheticBackend.N_FRAMES + 1, 4)]
+    assert rtsp.getStreamStats()["skipped"] == SyntheticBackend.N_FRAMES - len(images)
+
+    # ~200 fps limited to 50 fps
+    rtsp = SIYIRTSP(rtsp_url="rtsp://127.0.0.1:8554/test", backend=SyntheticBackend, max_fps=50)
+    q = rtsp.createQueue(maxsize=SyntheticBackend.N_FRAMES, policy=FrameQueue.BLOCK)
+    sleep(0.4)
+    rtsp.close()
+    assert 2 <= q.qsize() <= 10
+
+
+if __name__ == "__main__":
+    test_frame_delivery()
+    test_reconnect()
+    test_frame_pool()
+    test_gstreamer_pipeline()
+    test_ffmpeg_filters()
+    test_relay_command()
+    test_decimation()
+    print("DONE")
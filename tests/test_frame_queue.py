@@ -0,0 +1,63 @@
+"""
+@file test_frame_queue.py
+@Description: Tests the drop policies of the FrameQueue between SIYIRTSP and its consumers
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import threading
+from time import sleep
+
+from siyi_sdk.stream import FrameQueue, VideoFrame
+
+
+def fill(q, n):
+    return [q.put(VideoFrame(i + 1, None)) for i in range(n)]
+
+
+def test_drop_oldest():
+    q = FrameQueue(maxsize=3, policy=FrameQueue.DROP_OLDEST)
+    assert all(fill(q, 5))
+    assert q.getDroppedCount() == 2
+    assert [q.get(0).seq for _ in range(3)] == [3, 4, 5]
+    assert q.get(timeout=0.01) is None
+
+
+def test_drop_newest():
+    q = FrameQueue(maxsize=3, policy=FrameQueue.DROP_NEWEST)
+    assert fill(q, 5) == [True, True, True, False, False]
+    assert q.getDroppedCount() == 2
+    assert [q.get(0).seq for _ in range(3)] == [1, 2, 3]
+
+
+def test_block():
+    q = FrameQueue(maxsize=2, policy=FrameQueue.BLOCK)
+    t = threading.Thread(target=fill, args=(q, 5))
+    t.start()
+    got = []
+    for _ in range(5):
+        sleep(0.01)
+        got.append(q.get(timeout=1.0).seq)
+    t.join()
+    assert got == [1, 2, 3, 4, 5]
+    assert q.getDroppedCount() == 0
+
+    q = FrameQueue(maxsize=1, policy=FrameQueue.BLOCK, block_timeout=0.01)
+    assert fill(q, 2) == [True, False]
+
+
+def test_close():
+    q = FrameQueue(maxsize=2)
+    fill(q, 1)
+    q.close()
+    assert not q.put(VideoFrame(2, None))
+    assert [f.seq for f in q] == [1]
+
+
+if __name__ == "__main__":
+    test_drop_oldest()
+    test_drop_newest()
+    test_block()
+    test_close()
+    print("DONE")
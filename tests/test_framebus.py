@@ -0,0 +1,136 @@
+"""
+@file test_framebus.py
+@Description: Tests the shared memory frame bus, with a reader in another process
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import os
+import multiprocessing
+from time import sleep
+
+import pytest
+
+# The video extra
+np = pytest.importorskip("numpy")
+from siyi_sdk.framebus import SharedFrameWriter, SharedFrameReader
+from siyi_sdk.stream import SIYIRTSP, CaptureBackend
+
+NAME = "siyi_test_bus_{}".format(os.getpid())
+SHAPE = (48, 64, 3)
+
+
+def reader_process(name, n, results):
+    reader = SharedFrameReader(name)
+    seq = 0
+    while seq < n:
+        frame = reader.waitForFrame(seq, timeout=5.0)
+        if frame is None:
+            break
+        seq = frame.seq
+        value = int(frame.image[0, 0, 0])
+        if frame.isValid():
+            results.put((frame.seq, value))
+    frame = None
+    reader.close()
+    results.put(None)
+
+
+def test_framebus():
+    writer = SharedFrameWriter(NAME, SHAPE, n_slots=4)
+    reader = SharedFrameReader(NAME)
+    assert reader.latest() is None
+
+    image = np.full(SHAPE, 7, dtype=np.uint8)
+    assert writer.write(image, seq=1, stamp=12.5, pts=40.0)
+    frame = reader.latest()
+    assert frame.seq == 1 and frame.stamp == 12.5 and frame.pts == 40.0
+    assert frame.image.shape == SHAPE and frame.image[10, 10, 2] == 7
+    # The image is a view of the shared memory, no copy
+    assert not frame.image.flags['OWNDATA']
+
+    # After n_slots more frames the slot is overwritten
+    for seq in range(2, 6):
+        writer.write(np.full(SHAPE, seq, dtype=np.uint8), seq=seq)
+    assert not frame.isValid()
+    assert reader.latest().seq == 5
+    assert not writer.write(np.zeros((10, 10, 3), dtype=np.uint8))
+
+    del frame
+    reader.close()
+    writer.close()
+
+
+def test_header_not_written():
+    # A reader attaching before the writer wrote the header gets ValueError, and retries (see VideoIngest)
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=NAME + "_new", create=True, size=4096)
+    try:
+        with pytest.raises(ValueError):
+            SharedFrameReader(NAME + "_new", timeout=0.1)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_framebus_other_process():
+    writer = SharedFrameWriter(NAME + "_mp", SHAPE, n_slots=4)
+    results = multiprocessing.Queue()
+    p = multiprocessing.Process(target=reader_process, args=(NAME + "_mp", 50, results))
+    p.start()
+    for seq in range(1, 51):
+        writer.write(np.full(SHAPE, seq % 256, dtype=np.uint8), seq=seq)
+        sleep(0.005)
+    got = []
+    while True:
+        r = results.get(timeout=10)
+        if r is None:
+            break
+        got.append(r)
+    p.join()
+    writer.close()
+    assert got and got[-1][0] == 50
+    assert all(seq % 256 == value for seq, value in got)
+
+
+class NumberedBackend(CaptureBackend):
+    """
+    Returns images filled with the frame number
+    """
+    def open(self):
+        self._n = 0
+        return True
+
+    def grab(self):
+        sleep(0.005)
+        self._n += 1
+        return True
+
+    def retrieve(self, image=None):
+        return True, np.full(SHAPE, self._n % 256, dtype=np.uint8)
+
+    def getPTS(self):
+        return self._n * 40.0
+
+    def release(self):
+        pass
+
+
+def test_close_from_callback():
+    name = NAME + "_cb"
+    rtsp = SIYIRTSP(rtsp_url="rtsp://127.0.0.1:8554/test", backend=NumberedBackend)
+    rtsp.enableSharedMemory(name)
+    # close() from the receiving thread can not wait for it, the thread removes the memory when it stops
+    rtsp.addFrameCallback(lambda frame: frame.seq == 3 and rtsp.close())
+    rtsp._recv_thread.join(5.0)
+    assert not rtsp._recv_thread.is_alive()
+    assert not os.path.exists(os.path.join("/dev/shm", name))
+
+
+if __name__ == "__main__":
+    test_framebus()
+    test_header_not_written()
+    test_framebus_other_process()
+    test_close_from_callback()
+    print("DONE")
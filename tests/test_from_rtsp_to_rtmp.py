@@ -6,34 +6,27 @@
 All rights reserved 2022
 """
 
-import sys
-import os
 from imutils.video import VideoStream
 from time import sleep
-  
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
 
-from stream import SIYIRTSP, RTMPSender
+from siyi_sdk.stream import SIYIRTSP, RTMPSender
 
 def test():
     rtsp = SIYIRTSP(rtsp_url="rtsp://192.168.144.25:8554/main.264",debug=False)
     rtsp.setShowWindow(True)
 
-    rtmp = RTMPSender(rtmp_url="rtmp://127.0.0.1:1935/live/webcam")
+    # The sender takes the frames from its own queue
+    rtmp = RTMPSender(rtmp_url="rtmp://127.0.0.1:1935/live/webcam", queue=rtsp.createQueue(maxsize=1))
     rtmp.start()
 
     try:
-        while(True):
-            frame=rtsp.getFrame()
-            rtmp.setFrame(frame)
+        while True:
+            sleep(5)
+            print(rtmp.getStats())
     except KeyboardInterrupt:
-        rtsp.close()
-        rtmp.stop()
-        # quit
-        exit(0)
+        pass
+    rtsp.close()
+    rtmp.stop()
 
 if __name__ == "__main__":
     test()
\ No newline at end of file
@@ -5,14 +5,7 @@
 @Contact: mohamedashraf123@gmail.com
 All rights reserved 2022
 """
-import sys
-import os
 from time import sleep
-  
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
 
 from siyi_sdk import SIYISDK
 
@@ -6,15 +6,8 @@
 All rights reserved 2022
 """
 
-import sys
-import os
 from time import sleep
 
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
-
 from siyi_sdk import SIYISDK
 
 def test():
@@ -7,13 +7,6 @@ All rights reserved 2022
 """
 
 from time import sleep
-import sys
-import os
-  
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
 
 from siyi_sdk import SIYISDK
 
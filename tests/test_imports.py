@@ -0,0 +1,33 @@
+"""
+@file test_imports.py
+@Description: Checks that the control and streaming modules do not load OpenCV or numpy at import
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import sys
+import os
+import subprocess
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current)
+
+
+def loaded_modules(imports):
+    code = "import sys; import {}; print(' '.join(sorted(sys.modules)))".format(", ".join(imports))
+    out = subprocess.run([sys.executable, "-c", code], cwd=parent_directory, check=True,
+                         stdout=subprocess.PIPE, text=True).stdout
+    return set(out.split())
+
+
+def test_lazy_imports():
+    modules = loaded_modules(["siyi_sdk", "siyi_sdk.stream", "siyi_sdk.metadata", "siyi_sdk.ingest"])
+    assert "cv2" not in modules and "numpy" not in modules
+    modules = loaded_modules(["siyi_sdk"])
+    assert "unittest" not in modules and "siyi_sdk.stream" not in modules
+
+
+if __name__ == "__main__":
+    test_lazy_imports()
+    print("DONE")
@@ -0,0 +1,93 @@
+"""
+@file test_ingest.py
+@Description: Tests the multi-camera ingest, with synthetic capture backends in separate processes
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import os
+
+import pytest
+
+# The video extra
+np = pytest.importorskip("numpy")
+from siyi_sdk.stream import CaptureBackend
+from siyi_sdk.ingest import VideoIngest
+
+
+class NumberedBackend(CaptureBackend):
+    """
+    Returns images filled with the frame number, and the pid of the capture process in the first pixels
+    """
+    def open(self):
+        self._n = 0
+        return True
+
+    def grab(self):
+        from time import sleep
+        sleep(0.01)
+        self._n += 1
+        return True
+
+    def retrieve(self, image=None):
+        image = np.full((24, 32, 3), self._n % 256, dtype=np.uint8)
+        image[0, 0:4, 0] = np.frombuffer(os.getpid().to_bytes(4, 'little'), dtype=np.uint8)
+        image[1, 0, 0] = self._decode_threads
+        return True, image
+
+    def getPTS(self):
+        return self._n * 40.0
+
+    def release(self):
+        pass
+
+
+def pid(frame):
+    return int.from_bytes(frame.image[0, 0:4, 0].tobytes(), 'little')
+
+
+def test_ingest():
+    ingest = VideoIngest(max_decode_threads=4)
+    ingest.addCamera("front", "rtsp://127.0.0.1:8554/front", backend=NumberedBackend)
+    ingest.addCamera("rear", "rtsp://127.0.0.1:8554/rear", backend=NumberedBackend)
+    assert ingest.getDecodeThreads() == 2
+    queues = {name: ingest.createQueue(name, maxsize=100) for name in ingest.getCameras()}
+    with ingest:
+        frames = {name: [q.get(timeout=10.0) for _ in range(5)] for name, q in queues.items()}
+        stats = ingest.getStreamStats("front")
+    pids = set()
+    for name, fs in frames.items():
+        seqs = [f.seq for f in fs]
+        assert None not in fs and seqs == sorted(seqs)
+        assert fs[-1].image.shape == (24, 32, 3) and fs[-1].image[1, 0, 0] == 2
+        pids |= {pid(f) for f in fs}
+    # One process per camera, none of them this one
+    assert len(pids) == 2 and os.getpid() not in pids
+    assert stats["alive"] and stats["restarts"] == 0 and stats["delivered"] >= 5
+    assert queues["front"].isClosed()
+
+
+def test_restart():
+    ingest = VideoIngest(restart_delay=0.1)
+    ingest.addCamera("front", "rtsp://127.0.0.1:8554/front", backend=NumberedBackend)
+    q = ingest.createQueue("front", maxsize=1)
+    with ingest:
+        first = pid(q.get(timeout=10.0))
+        cam = ingest._cameras["front"]
+        bus_name = cam.bus_name
+        cam.process.kill()
+        frame = q.get(timeout=10.0)
+        while pid(frame) == first:
+            frame = q.get(timeout=10.0)
+        # The shared memory of the killed process was removed
+        assert not os.path.exists(os.path.join("/dev/shm", bus_name))
+        assert ingest.getStreamStats("front")["restarts"] == 1
+        bus_name = cam.bus_name
+    assert not os.path.exists(os.path.join("/dev/shm", bus_name))
+
+
+if __name__ == "__main__":
+    test_ingest()
+    test_restart()
+    print("DONE")
@@ -0,0 +1,71 @@
+"""
+@file test_metadata.py
+@Description: Tags frames with the gimbal state of the local camera emulator, and reads the sidecar back
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import os
+import math
+import tempfile
+from time import sleep, monotonic
+
+from siyi_sdk import SIYISDK
+from siyi_sdk.emulator import SIYIEmulator
+from siyi_sdk.stream import VideoFrame
+from siyi_sdk.metadata import GimbalStateHistory, MetadataWriter, readMetadata, metadataStartTime
+
+
+def test_interpolation():
+    h = GimbalStateHistory(maxlen=3)
+    assert h.at(1.0) is None
+    h.setZoom(2.0)
+    h.add(170.0, -10.0, 0.0, stamp=1.0)
+    h.setZoom(3.0)
+    h.add(-170.0, -20.0, 0.0, stamp=2.0)
+    yaw, pitch, roll, zoom, age = h.at(1.5)
+    assert yaw == 180.0 and pitch == -15.0 and age == 0.0
+    assert h.at(1.75)[3] == 3.0
+    assert h.at(2.5) == (-170.0, -20.0, 0.0, 3.0, 0.5)
+    h.add(0.0, 0.0, 0.0, stamp=3.0)
+    h.add(0.0, 0.0, 0.0, stamp=4.0)
+    # The oldest sample was dropped
+    assert h.at(0.0)[0] == -170.0 and len(h) == 3
+
+
+def test_metadata_sidecar():
+    directory = tempfile.mkdtemp()
+    with SIYIEmulator(port=0) as emu:
+        emu.setAttitude(12.3, -45.6)
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort())
+        assert cam.connect()
+        sleep(0.3)
+        writers = [MetadataWriter(cam, None, os.path.join(directory, "frames.csv")),
+                   MetadataWriter(cam, None, os.path.join(directory, "frames.meta"))]
+        for seq in range(1, 11):
+            frame = VideoFrame(seq, None, monotonic(), pts=seq * 40.0)
+            for w in writers:
+                w.onFrame(frame)
+            sleep(0.02)
+        sleep(0.1)
+        for w in writers:
+            w.close()
+        cam.disconnect()
+
+    for name in ("frames.csv", "frames.meta"):
+        path = os.path.join(directory, name)
+        records = list(readMetadata(path))
+        assert [m.seq for m in records] == list(range(1, 11))
+        assert records[0].pts == 40.0
+        for m in records:
+            assert math.isclose(m.yaw, 12.3, abs_tol=0.05) and math.isclose(m.pitch, -45.6, abs_tol=0.05)
+            assert m.zoom >= 1.0
+        wall, stamp = metadataStartTime(path)
+        assert stamp <= records[0].stamp
+
+
+if __name__ == "__main__":
+    test_interpolation()
+    test_metadata_sidecar()
+    print("DONE")
@@ -6,14 +6,7 @@
 All rights reserved 2024
 """
 
-import sys
-import os
 from time import sleep
-  
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
 
 from siyi_sdk import SIYISDK
 
@@ -0,0 +1,158 @@
+"""
+@file test_rtmp_sender.py
+@Description: Tests the pacing and the pipe backpressure of RTMPSender, with a slow fake ffmpeg process
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import sys
+from time import sleep
+
+import pytest
+
+from siyi_sdk import stream
+from siyi_sdk.stream import RTMPSender, StreamFanout, VideoEncoder, parseEncoders
+
+
+class Image:
+    """
+    Minimal image, already at the output size
+    """
+    flags = {'C_CONTIGUOUS': False}
+
+    def __init__(self, n):
+        self.n = n
+        self.shape = (480, 640, 3)
+
+    def tobytes(self):
+        return bytes([self.n])
+
+
+class SlowPipe:
+    """
+    stdin of a fake ffmpeg that needs `delay` seconds per frame
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        self.frames = []
+
+    def write(self, b):
+        sleep(self.delay)
+        self.frames.append(b[0])
+
+    def close(self):
+        pass
+
+
+class FakeFFmpeg:
+    def __init__(self, command, stdin=None):
+        self.command = command
+        self.stdin = SlowPipe(FakeFFmpeg.delay)
+
+    def kill(self):
+        pass
+
+    def wait(self):
+        pass
+
+
+def run(monkeypatch, delay, fps, n_frames, frame_period):
+    FakeFFmpeg.delay = delay
+    monkeypatch.setattr(stream.subprocess, "Popen", FakeFFmpeg)
+    rtmp = RTMPSender()
+    rtmp.setFPS(fps)
+    assert rtmp.start()
+    for i in range(1, n_frames + 1):
+        rtmp.setFrame(Image(i))
+        sleep(frame_period)
+    rtmp.stop()
+    return rtmp.getStats(), rtmp._p.stdin.frames
+
+
+def test_duplicates_for_rate(monkeypatch):
+    # 10 frames at 20 fps, sent at 50 fps: every frame once, in order, repeated in between
+    stats, frames = run(monkeypatch, 0.0, 50, 10, 0.05)
+    assert stats["dropped_pipe_full"] == 0
+    assert stats["frames_in"] == 10 and stats["duplicated"] > 10
+    assert [n for i, n in enumerate(frames) if i == 0 or frames[i - 1] != n] == list(range(1, 11))
+    assert 30 < stats["output_fps"] < 70
+
+
+def test_pipe_full(monkeypatch):
+    # ffmpeg takes 50 ms per frame, at 100 fps: the pacing does not stall, and frames are dropped
+    stats, frames = run(monkeypatch, 0.05, 100, 20, 0.01)
+    assert stats["dropped_pipe_full"] > 0
+    assert stats["written"] == len(frames) < 20
+    assert frames == sorted(frames)
+
+
+def test_prepare_without_opencv(monkeypatch):
+    # A frame at the output size in the input format is sent as is, without OpenCV
+    monkeypatch.setitem(sys.modules, "cv2", None)
+    rtmp = RTMPSender()
+    image = Image(1)
+    assert rtmp._prepare(image) is image
+
+
+def test_encoder_args():
+    rtmp = RTMPSender(rtmp_url="rtmp://127.0.0.1:1935/live/test")
+    cmd = rtmp.command()
+    # Default: BGR input, converted by ffmpeg for libx264
+    assert cmd[cmd.index("-c:v") - 2:cmd.index("-c:v") + 6] == \
+        ["-pix_fmt", "yuv420p", "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency"]
+    assert cmd[-3:] == ["-f", "flv", "rtmp://127.0.0.1:1935/live/test"]
+
+    # NV12 input goes to the hardware encoder without conversion
+    rtmp.setPixelFormat("nv12")
+    rtmp.setEncoder(VideoEncoder("h264_v4l2m2m", bitrate=2000000, gop=30))
+    cmd = rtmp.command()
+    assert cmd.count("nv12") == 2 and "h264_v4l2m2m" in cmd
+    assert cmd[cmd.index("-b:v") + 1] == "2000000" and cmd[cmd.index("-g") + 1] == "30"
+
+    enc = VideoEncoder("h264_vaapi")
+    assert enc.inputArgs() == ["-vaapi_device", "/dev/dri/renderD128"]
+    assert enc.outputArgs("bgr24")[:2] == ["-vf", "format=nv12,hwupload"]
+
+
+def test_parse_encoders():
+    text = """Encoders:
+ V..... = Video
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)
+ V....D h264_v4l2m2m         V4L2 mem2mem H.264 encoder wrapper (codec h264)
+ A....D aac                  AAC (Advanced Audio Coding)
+"""
+    assert parseEncoders(text) == {"libx264", "h264_v4l2m2m"}
+
+
+def test_fanout_command():
+    fanout = StreamFanout()
+    fanout.setImageSize(1280, 720)
+    fanout.addQuality("preview", size=(320, 180), encoder=VideoEncoder(bitrate=300000))
+    fanout.addSink("rtmp://127.0.0.1/live/cam")
+    fanout.addSink("rec/%05d.mkv", fmt="segment", segment_time=60)
+    fanout.addSink("udp://127.0.0.1:5600", fmt="mpegts", quality="preview")
+    cmd = fanout.command()
+
+    # One input, one scaling, one encoder per quality level
+    assert cmd.count("-i") == 1 and cmd.count("-c:v") == 2
+    assert cmd[cmd.index("-filter_complex") + 1] == "[0:v]split=2[s0][s1];[s0]null[v0];[s1]scale=320:180[v1]"
+    tees = [cmd[i + 1] for i, a in enumerate(cmd) if a == "tee"]
+    assert len(tees) == 2
+    main = tees[0].split("|")
+    assert main[0].startswith("[f=flv:onfail=ignore:use_fifo=1:") and main[0].endswith("]rtmp://127.0.0.1/live/cam")
+    # Local files are not retried through the fifo muxer
+    assert main[1] == "[f=segment:onfail=ignore:segment_time=60]rec/%05d.mkv"
+    assert tees[1].startswith("[f=mpegts:onfail=ignore:") and tees[1].endswith("]udp://127.0.0.1:5600")
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as mp:
+        test_duplicates_for_rate(mp)
+    with pytest.MonkeyPatch.context() as mp:
+        test_pipe_full(mp)
+    test_encoder_args()
+    test_parse_encoders()
+    test_fanout_command()
+    print("DONE")
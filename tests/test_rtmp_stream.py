@@ -6,17 +6,10 @@
 All rights reserved 2022
 """
 
-import sys
-import os
 from imutils.video import VideoStream
 from time import sleep
-  
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
 
-from stream import RTMPSender
+from siyi_sdk.stream import RTMPSender
 
 def test():
     # Webcam
@@ -6,15 +6,7 @@
 All rights reserved 2022
 """
 
-import sys
-import os
-  
-current = os.path.dirname(os.path.realpath(__file__))
-parent_directory = os.path.dirname(current)
-  
-sys.path.append(parent_directory)
-
-from stream import SIYIRTSP
+from siyi_sdk.stream import SIYIRTSP
 from siyi_sdk import SIYISDK
 
 def test():
@@ -0,0 +1,61 @@
+"""
+@file test_segment_recorder.py
+@Description: Tests the segment index (lookup, size based retention) and the ffmpeg command of SegmentRecorder
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+import os
+import tempfile
+
+from siyi_sdk.stream import SegmentIndex, FFmpegSegmentBackend
+
+
+def write_segment(directory, name, size):
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def test_segment_index():
+    with tempfile.TemporaryDirectory() as d:
+        index = SegmentIndex(d)
+        for i in range(5):
+            name = "seg_{}.mkv".format(i)
+            write_segment(d, name, 1000)
+            index.add(1000.0 + 60 * i, 60.0, 1000, name)
+        assert index.getTotalSize() == 5000
+
+        path, offset = index.find(1000.0 + 60 * 2 + 15.5)
+        assert path == os.path.join(d, "seg_2.mkv") and abs(offset - 15.5) < 1e-6
+        assert index.find(999.0) is None and index.find(1000.0 + 60 * 5 + 1) is None
+
+        # Oldest segments are deleted first
+        assert index.enforce(3000) == ["seg_0.mkv", "seg_1.mkv"]
+        assert not os.path.exists(os.path.join(d, "seg_0.mkv"))
+        assert index.find(1010.0) is None
+
+        # The index file survives a restart
+        index = SegmentIndex(d)
+        assert [e[3] for e in index.segments()] == ["seg_2.mkv", "seg_3.mkv", "seg_4.mkv"]
+        assert index.find(1000.0 + 60 * 4 + 1)[0] == os.path.join(d, "seg_4.mkv")
+
+
+def test_segment_command():
+    b = FFmpegSegmentBackend("rtsp://192.168.144.25:8554/main.264", pattern="rec/seg_%Y%m%d-%H%M%S.mkv", segment_time=30)
+    cmd = b.command()
+    # Remuxed, not decoded
+    assert cmd[cmd.index("-c:v") + 1] == "copy"
+    assert cmd[cmd.index("-segment_time") + 1] == "30" and cmd[cmd.index("-segment_format") + 1] == "matroska"
+    assert cmd[cmd.index("-segment_list") + 1] == "pipe:1" and cmd[-1] == "rec/seg_%Y%m%d-%H%M%S.mkv"
+
+    segments = []
+    b = FFmpegSegmentBackend("rtsp://192.168.144.25:8554/main.264", on_segment=lambda *a: segments.append(a))
+    b.readSegments(["seg_20240101-120000.mkv,0.000000,60.040000\n", "garbage\n"])
+    assert segments == [("seg_20240101-120000.mkv", 0.0, 60.04)]
+
+
+if __name__ == "__main__":
+    test_segment_index()
+    test_segment_command()
+    print("DONE")
@@ -0,0 +1,86 @@
+"""
+@file test_stats.py
+@Description: Tests the per-command traffic counters, against the local camera emulator
+@Author: Mohamed Abdelkader
+@Contact: mohamedashraf123@gmail.com
+All rights reserved 2024
+"""
+
+from time import sleep
+
+from siyi_sdk import SIYISDK
+from siyi_sdk.siyi_message import COMMAND
+from siyi_sdk.emulator import SIYIEmulator
+from siyi_sdk.metrics import SIYIStats, prometheusText
+
+
+def test_stats():
+    with SIYIEmulator(port=0) as emu:
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort(), enable_stats=True)
+        assert cam.connect()
+        sleep(0.5)
+        stats = cam.getStats()
+        att = stats["commands"][COMMAND.ACQUIRE_GIMBAL_ATT]
+        assert att["name"] == "ACQUIRE_GIMBAL_ATT"
+        assert att["sent"] > 5 and att["received"] > 5
+        assert att["rtt"]["count"] > 0 and att["rtt"]["buckets"]["+Inf"] == att["rtt"]["count"]
+        assert stats["loops"]["gimbal_attitude"]["iterations"] > 5
+
+        # Corrupted CRC, then a valid packet with an unknown ID
+        msg = emu.encodeMsg('', COMMAND.ACQUIRE_FW_VER)
+        cam.parseBuffer(bytes.fromhex(msg[:-4] + '0000'))
+        cam.parseBuffer(bytes.fromhex(emu.encodeMsg('01', 'ff')))
+        stats = cam.getStats()
+        assert stats["commands"][COMMAND.ACQUIRE_FW_VER]["crc_failures"] == 1
+        assert stats["unknown_ids"] == {'ff': 1}
+
+        text = prometheusText(stats, labels={"camera": "emulator"})
+        assert 'siyi_sent_total{camera="emulator",cmd_id="0d",cmd="ACQUIRE_GIMBAL_ATT"}' in text
+        assert 'siyi_unknown_ids_total{camera="emulator",cmd_id="ff"} 1' in text
+        cam.disconnect()
+
+
+def test_rtt_after_lost_reply():
+    stats = SIYIStats()
+    # The reply of the first request is lost
+    stats.onSent(COMMAND.ACQUIRE_GIMBAL_ATT)
+    sleep(0.2)
+    stats.onSent(COMMAND.ACQUIRE_GIMBAL_ATT)
+    stats.onReceived(COMMAND.ACQUIRE_GIMBAL_ATT)
+    rtt = stats.snapshot()["commands"][COMMAND.ACQUIRE_GIMBAL_ATT]["rtt"]
+    assert rtt["count"] == 1 and rtt["max"] < 0.1
+
+
+def test_zoom_polling():
+    with SIYIEmulator(port=0) as emu:
+        cam = SIYISDK(server_ip="127.0.0.1", port=emu.getPort(), enable_stats=True)
+        assert cam.connect()
+
+        def zoom_requests():
+            return cam.getStats()["commands"][COMMAND.CURRENT_ZOOM_VALUE]["sent"]
+
+        # Only the request of connect()
+        sleep(2.2)
+        assert zoom_requests() == 1
+        cam.enableZoomPolling()
+        sleep(2.2)
+        assert zoom_requests() >= 3
+        cam.enableZoomPolling(False)
+        sleep(1.1)
+        n = zoom_requests()
+        sleep(1.1)
+        assert zoom_requests() == n
+        cam.disconnect()
+
+
+def test_stats_disabled():
+    cam = SIYISDK(server_ip="127.0.0.1", port=1)
+    assert cam.getStats() is None
+
+
+if __name__ == "__main__":
+    test_stats()
+    test_rtt_after_lost_reply()
+    test_zoom_polling()
+    test_stats_disabled()
+    print("DONE")